@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# Benchmark schema v0 (grp TEXT, không index) so với schema hiện tại (group_id + index, sau mọi bước
+# upgrade tới SCHEMA_VERSION) ở 100k dòng.
+#   python3 benchmarks/bench_schema.py [rows]
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ssh_core as sm  # noqa: E402
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+GROUPS = 200
+REPEAT = 20
+
+V0_DDL = """
+CREATE TABLE connections
+(
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    grp       TEXT,
+    name      TEXT,
+    host      TEXT,
+    port      INTEGER,
+    user      TEXT,
+    password  TEXT,
+    protocol  TEXT,
+    last_used TEXT
+);
+CREATE TABLE groups
+(
+    id   INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE
+);
+CREATE TABLE table_layout
+(
+    col_name TEXT PRIMARY KEY,
+    width    INTEGER
+);
+"""
+
+
+def build_v0(path):
+    rnd = random.Random(42)
+    conn = sqlite3.connect(path)
+    conn.executescript(V0_DDL)
+    groups = [f"grp-{i:03d}" for i in range(GROUPS)]
+    conn.executemany("INSERT INTO groups (name) VALUES (?)", [(g,) for g in groups])
+    conn.executemany(
+        "INSERT INTO connections (grp, name, host, port, user, password, protocol, last_used) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        ((rnd.choice(groups), f"host-{rnd.randrange(10 ** 9):09d}", f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+          22, "root", "", "SSH", f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} 00:00:00")
+         for i in range(ROWS)))
+    conn.commit()
+    conn.close()
+    return groups
+
+
+def timeit(fn):
+    fn()  # warm cache
+    t = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - t) / REPEAT * 1000
+
+
+def main():
+    # DB dựng từ file trống, mở thẳng ConnectionRepository (không qua get_repo/prepare_db_file → không chép seed)
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "bench.db")
+    groups = build_v0(path)
+    grp = groups[GROUPS // 2]
+
+    conn = sqlite3.connect(path)
+    before = {
+        "group filter (all rows)": lambda: conn.execute(
+            "SELECT * FROM connections WHERE grp=? ORDER BY name", (grp,)).fetchall(),
+        "group filter (first page)": lambda: conn.execute(
+            "SELECT * FROM connections WHERE grp=? ORDER BY name LIMIT 256", (grp,)).fetchall(),
+        "All (first page)": lambda: conn.execute(
+            "SELECT * FROM connections ORDER BY grp, name LIMIT 256").fetchall(),
+        "distinct groups": lambda: conn.execute("SELECT DISTINCT grp FROM connections").fetchall(),
+        "recent 50 (last_used)": lambda: conn.execute(
+            "SELECT * FROM connections ORDER BY last_used DESC LIMIT 50").fetchall(),
+        "lookup by host": lambda: conn.execute(
+            "SELECT * FROM connections WHERE host=?", ("10.0.200.1",)).fetchall(),
+    }
+    before_ms = {k: timeit(f) for k, f in before.items()}
+    conn.close()
+
+    repo = sm.ConnectionRepository(path)
+    t = time.perf_counter()
+    sm.upgrade_schema(repo)
+    upgrade_ms = (time.perf_counter() - t) * 1000
+    repo.query("ANALYZE")
+
+    after = {
+        "group filter (all rows)": lambda: repo.fetch_group(grp),
+        "group filter (first page)": lambda: repo.fetch_page(grp, None, 256),
+        "All (first page)": lambda: repo.fetch_page(None, None, 256),
+        "distinct groups": lambda: repo.distinct_grp(),
+        "recent 50 (last_used)": lambda: repo.query(
+            sm.CONN_SELECT + "ORDER BY c.last_used DESC LIMIT 50"),
+        "lookup by host": lambda: repo.query(sm.CONN_SELECT + "WHERE c.host=?", ("10.0.200.1",)),
+    }
+    after_ms = {k: timeit(f) for k, f in after.items()}
+    repo.close()
+
+    now = f"v{sm.SCHEMA_VERSION} ms"
+    print(f"rows={ROWS} groups={GROUPS} upgrade v0→v{sm.SCHEMA_VERSION}: {upgrade_ms:.0f} ms")
+    print(f"{'query':<28}{'v0 ms':>10}{now:>10}{'speedup':>10}")
+    for k in before:
+        b, a = before_ms[k], after_ms[k]
+        print(f"{k:<28}{b:>10.2f}{a:>10.2f}{b / a if a else float('inf'):>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# Benchmark ô tìm kiếm (FTS5) ở 50k kết nối – mục tiêu < 10 ms mỗi lần gõ.
+#   python3 benchmarks/bench_search.py [rows]
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ssh_core as sm  # noqa: E402
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+REPEAT = 50
+QUERIES = ["w", "web", "web-0", "db 12", "10.3", "10.3.7.1", "prod", "deploy", "zzz-no-match"]
+
+
+def main():
+    # DB rỗng, không qua get_repo() → không chép DB seed / DB thật vào dữ liệu đo
+    repo = sm.ConnectionRepository(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    sm.upgrade_schema(repo)
+    rnd = random.Random(7)
+    roles = ["web", "db", "cache", "api", "worker", "lb"]
+    envs = ["prod", "staging", "dev", "qa"]
+    # Qua bulk_import như import thật → cột mới của connections không làm hỏng benchmark
+    repo.bulk_import(
+        (rnd.choice(envs), f"{rnd.choice(roles)}-{i:05d}", f"10.{i >> 14 & 255}.{i >> 7 & 127}.{i & 127}",
+         22, rnd.choice(["root", "deploy", "ubuntu"]), "", "SSH",
+         f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} {rnd.randint(0, 23):02d}:00:00")
+        for i in range(ROWS))
+
+    print(f"rows={ROWS}")
+    print(f"{'query':<16}{'hits':>8}{'avg ms':>10}{'max ms':>10}")
+    for q in QUERIES:
+        times = []
+        hits = 0
+        for _ in range(REPEAT):
+            t = time.perf_counter()
+            hits = len(repo.search(q))
+            times.append((time.perf_counter() - t) * 1000)
+        print(f"{q:<16}{hits:>8}{sum(times) / len(times):>10.2f}{max(times):>10.2f}")
+    repo.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# Đo thời gian khởi động tới lần vẽ đầu tiên (cold + warm) của app chạy từ source hoặc bản build,
+# thời gian một lần chạy sau chuyển lệnh sang instance đang mở (single instance / IPC)
+# và thời gian các lệnh CLI (không import Qt).
+#   python3 benchmarks/bench_startup.py [runs] [lệnh chạy app...]
+#   python3 benchmarks/bench_startup.py 10 dist/ssh_manager/ssh_manager
+# Cold: thử xoá page cache (cần root); không có quyền thì lần chạy đầu được tính là cold.
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+# -m dùng bytecode đã cache trong __pycache__ (chạy file .py trực tiếp phải compile lại mỗi lần)
+CMD = sys.argv[2:] or [sys.executable, "-m", "ssh_manager"]
+
+
+def drop_caches():
+    try:
+        subprocess.run(["sync"], check=False)
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+
+def launch(env):
+    # → (wall ms từ lúc spawn, ms trong process tính từ dòng đầu tiên của ssh_manager.py)
+    t = time.perf_counter()
+    p = subprocess.Popen(CMD, env=env, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    inner = None
+    for line in p.stdout:
+        if line.startswith("FIRST_PAINT_MS"):
+            wall = (time.perf_counter() - t) * 1000
+            inner = float(line.split()[1])
+            break
+    p.wait(timeout=30)
+    if inner is None:
+        raise RuntimeError(f"{CMD} thoát mà không báo FIRST_PAINT_MS (exit {p.returncode})")
+    return wall, inner
+
+
+def ipc_round_trips(env, runs):
+    # Instance đầu chạy nền (không probe); các lần sau chỉ gửi argv qua socket rồi thoát
+    env = {k: v for k, v in env.items() if k != "SSH_MANAGER_STARTUP_PROBE"}
+    server = subprocess.Popen(CMD, env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    sock = os.path.join(env["XDG_RUNTIME_DIR"], f"ssh_manager-{os.getuid()}.sock")
+    deadline = time.time() + 30
+    while not os.path.exists(sock) and time.time() < deadline:
+        time.sleep(0.05)
+    times = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        subprocess.run(CMD, env=env, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - t) * 1000)
+    subprocess.run(CMD + ["quit"], env=env, cwd=ROOT, stdout=subprocess.DEVNULL)
+    server.wait(timeout=30)
+    return times
+
+
+def cli_runs(env, args, runs):
+    times = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        subprocess.run(CMD + args, env=env, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - t) * 1000)
+    return times
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    db = os.path.join(tmp, "connections.db")
+    shutil.copy(os.path.join(ROOT, "connections.db"), db)
+    # Runtime dir riêng: không gửi nhầm lệnh cho instance thật đang chạy của user
+    env = dict(os.environ, SSH_MANAGER_STARTUP_PROBE="1", SSH_MANAGER_DB=db, XDG_RUNTIME_DIR=tmp)
+
+    dropped = drop_caches()
+    cold = launch(env)
+    warm = [launch(env) for _ in range(RUNS)]
+    ipc = ipc_round_trips(env, RUNS)
+    cli = {f"cli {' '.join(args)}": cli_runs(env, args, RUNS) for args in (["ls"], ["search", "a"], ["groups"])}
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"cmd: {' '.join(CMD)}")
+    print(f"{'':<22}{'wall ms':>10}{'in-process ms':>16}")
+    print(f"{'cold' + ('' if dropped else ' (first run)'):<22}{cold[0]:>10.0f}{cold[1]:>16.0f}")
+    print(f"{f'warm median of {RUNS}':<22}{statistics.median(w for w, _ in warm):>10.0f}"
+          f"{statistics.median(i for _, i in warm):>16.0f}")
+    print(f"{'repeat launch (IPC)':<22}{statistics.median(ipc):>10.0f}{'-':>16}")
+    for label, times in cli.items():
+        print(f"{label:<22}{statistics.median(times):>10.0f}{'-':>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,32 +5,46 @@ VERSION="1.0.0"
 DEB_DIR="${APP_NAME}_deb"
 
 echo "🔥 BUILD EXECUTABLE..."
-pyinstaller --noconfirm --onefile --windowed \
+# onedir: không giải nén vào /tmp mỗi lần chạy như --onefile.
+# Hook PyQt6 của PyInstaller tự lấy QtCore/QtGui/QtWidgets/QtNetwork; app không dùng WebEngine/QML/Multimedia.
+# paramiko / asyncio / configparser / csv / json được import lười (LazyModule) trong ssh_core.py –
+# PyInstaller không thấy import đó nên phải khai báo hidden-import (thiếu configparser → import Remmina lỗi).
+pyinstaller --noconfirm --onedir --windowed \
   --icon=icon.png \
-  --add-data "connections.db:." \
   --add-data "icon.png:." \
-  --collect-all PyQt6 \
-  --collect-all PyQt6.QtCore \
-  --collect-all PyQt6.QtGui \
-  --collect-all PyQt6.QtWidgets \
-  --collect-all PyQt6.QtNetwork \
-  --collect-all PyQt6.QtWebEngineWidgets \
+  --hidden-import paramiko \
+  --hidden-import asyncio \
+  --hidden-import configparser \
+  --hidden-import csv \
+  --hidden-import json \
+  --exclude-module PyQt6.QtWebEngineCore \
+  --exclude-module PyQt6.QtWebEngineWidgets \
+  --exclude-module PyQt6.QtWebChannel \
+  --exclude-module PyQt6.QtQml \
+  --exclude-module PyQt6.QtQuick \
+  --exclude-module PyQt6.QtMultimedia \
+  --exclude-module PyQt6.QtPdf \
+  --exclude-module PyQt6.QtSql \
+  --exclude-module tkinter \
   ssh_manager.py
 
 echo "=== build deb: cleanup ==="
 rm -rf "$DEB_DIR"
 mkdir -p $DEB_DIR/DEBIAN
 mkdir -p $DEB_DIR/usr/bin
+mkdir -p $DEB_DIR/usr/lib
 mkdir -p $DEB_DIR/usr/share/$APP_NAME
 mkdir -p $DEB_DIR/usr/share/applications
 mkdir -p $DEB_DIR/usr/share/icons/hicolor/64x64/apps
 
 echo "=== copy binary ==="
-# copy pyinstaller binary into /usr/bin (or /usr/share and link)
-cp dist/$APP_NAME $DEB_DIR/usr/bin/$APP_NAME
-chmod 755 $DEB_DIR/usr/bin/$APP_NAME
+# thư mục onedir vào /usr/lib/ssh_manager, /usr/bin chỉ là symlink
+cp -r dist/$APP_NAME $DEB_DIR/usr/lib/$APP_NAME
+chmod 755 $DEB_DIR/usr/lib/$APP_NAME/$APP_NAME
+ln -sf /usr/lib/$APP_NAME/$APP_NAME $DEB_DIR/usr/bin/$APP_NAME
 
 echo "=== copy data ==="
+# DB mẫu: app chép vào ~/.local/share/ssh_manager ở lần chạy đầu (không đóng gói vào binary)
 cp connections.db $DEB_DIR/usr/share/$APP_NAME/
 cp icon.png $DEB_DIR/usr/share/$APP_NAME/
 cp icon.png $DEB_DIR/usr/share/icons/hicolor/64x64/apps/$APP_NAME.png
@@ -64,21 +78,14 @@ echo "=== postinst ==="
 cat > $DEB_DIR/DEBIAN/postinst <<'EOF'
 #!/bin/bash
 set -e
-TARGET_USER="${SUDO_USER:-$USER}"
-USER_HOME=$(getent passwd "$TARGET_USER" | cut -d: -f6)
-mkdir -p "$USER_HOME/.ssh_manager" || true
-if [ ! -f "$USER_HOME/.ssh_manager/connections.db" ]; then
-    if [ -f /usr/share/ssh_manager/connections.db ]; then
-        cp /usr/share/ssh_manager/connections.db "$USER_HOME/.ssh_manager/"
-    fi
-fi
-chmod -R 755 "$USER_HOME/.ssh_manager" || true
+# DB của user nằm ở ~/.local/share/ssh_manager, app tự chép từ
+# /usr/share/ssh_manager/connections.db ở lần chạy đầu (không cần root ghi vào home)
 # install runtime packages (best-effort, won't fail install)
 if ! command -v pip3 >/dev/null 2>&1; then
     apt-get update || true
     apt-get install -y python3-pip || true
 fi
-pip3 install --no-cache-dir PyQt6 PyQt6-WebEngine paramiko || true
+pip3 install --no-cache-dir PyQt6 paramiko || true
 exit 0
 EOF
 chmod 755 $DEB_DIR/DEBIAN/postinst
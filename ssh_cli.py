@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# Dòng lệnh cho SSH Manager – không import Qt, dùng được trong script / automation.
+#   ssh_manager ls [group]              → group<TAB>name<TAB>user@host:port<TAB>protocol<TAB>last_used
+#   ssh_manager groups
+#   ssh_manager search <từ khoá...>
+#   ssh_manager connect <tên|host>      → ssh ngay trong terminal hiện tại
+#   ssh_manager exec <target> <lệnh...> → target: tên, host hoặc group:<tên>, nhiều target ngăn bởi dấu phẩy
+#   ssh_manager keyscan <target>        → host:port<TAB>new|same|changed|error<TAB>key_type<TAB>fingerprint
+# Exit code: 0 thành công, 1 lệnh lỗi / host lỗi (exec một host: exit code của lệnh remote),
+# 2 sai tham số / không tìm thấy kết nối.
+import argparse
+import contextlib
+import os
+import sys
+import threading
+
+import ssh_core
+
+
+def open_repo():
+    # Thông báo nâng cấp schema / chép DB mẫu ra stderr để stdout chỉ chứa kết quả
+    with contextlib.redirect_stdout(sys.stderr):
+        ssh_core.init_db()
+    return ssh_core.get_repo()
+
+
+def print_rows(rows):
+    for id_, grp, name, host, port, user, pwd, proto, last in rows:
+        print(f"{grp}\t{name}\t{user}@{host}:{port}\t{proto}\t{last or ''}")
+
+
+def cmd_ls(args):
+    repo = open_repo()
+    if args.group is None:
+        print_rows(ssh_core.iter_connections(repo.path))
+    else:
+        print_rows(repo.fetch_group("" if args.group == "(no group)" else args.group))
+    return 0
+
+
+def cmd_groups(args):
+    for g in open_repo().list_groups():
+        print(g)
+    return 0
+
+
+def cmd_search(args):
+    print_rows(open_repo().search(" ".join(args.text), limit=args.limit))
+    return 0
+
+
+def cmd_connect(args):
+    repo = open_repo()
+    row = repo.find_conn(args.name)
+    if not row:
+        print(f"không có kết nối '{args.name}'", file=sys.stderr)
+        return 2
+    id_, grp, name, host, port, user, pwd, proto, last = row
+    argv = ssh_core.Launcher().ssh_command(host, port, user, pwd, repo.multiplex_enabled(id_))
+    repo.touch_conn(id_, ssh_core.now_str())
+    repo.close()
+    sys.stdout.flush()
+    try:
+        os.execvp(argv[0], argv)
+    except OSError as e:
+        print(f"không chạy được {argv[0]}: {e}", file=sys.stderr)
+        return 1
+
+
+def resolve_targets(repo, spec):
+    # "web-01,group:prod" → danh sách dòng kết nối (không trùng), hoặc lỗi với target không tìm thấy
+    rows, seen = [], set()
+    for target in filter(None, (t.strip() for t in spec.split(","))):
+        if target.startswith("group:"):
+            grp = target[len("group:"):]
+            found = repo.fetch_group("" if grp == "(no group)" else grp)
+        else:
+            row = repo.find_conn(target)
+            found = [row] if row else []
+        if not found:
+            raise LookupError(target)
+        for row in found:
+            if row[0] not in seen:
+                seen.add(row[0])
+                rows.append(row)
+    return rows
+
+
+def cmd_exec(args):
+    if not ssh_core.HAVE_PARAMIKO:
+        print("exec cần paramiko (pip install paramiko)", file=sys.stderr)
+        return 1
+    repo = open_repo()
+    try:
+        rows = resolve_targets(repo, args.target)
+    except LookupError as e:
+        print(f"không có kết nối / group '{e.args[0]}'", file=sys.stderr)
+        return 2
+
+    lock = threading.Lock()
+    partial = {}  # (conn_id, stream) → phần dòng chưa có \n
+    finished = threading.Event()
+    results = []
+    prefix = len(rows) > 1 and not args.no_prefix
+
+    def emit(name, stream, line):
+        out = sys.stdout if stream == "out" else sys.stderr
+        out.write(f"{name}: {line}\n" if prefix else line + "\n")
+
+    def on_output(conn_id, name, stream, text):
+        # Chỉ in dòng hoàn chỉnh để output của các host không chen vào giữa dòng của nhau
+        with lock:
+            lines = (partial.pop((conn_id, stream), "") + text).split("\n")
+            if lines[-1]:
+                partial[(conn_id, stream)] = lines[-1]
+            for line in lines[:-1]:
+                emit(name, stream, line)
+
+    def on_result(res):
+        with lock:
+            for stream in ("out", "err"):
+                rest = partial.pop((res.conn_id, stream), None)
+                if rest:
+                    emit(res.name, stream, rest)
+            if res.error:
+                print(f"{res.name}: ❌ {res.error}", file=sys.stderr)
+            sys.stdout.flush()
+
+    def on_done(all_results):
+        results.extend(all_results)
+        finished.set()
+
+    executor = ssh_core.FanoutExecutor(concurrency=args.jobs, timeout=args.timeout)
+    token = executor.run(rows, " ".join(args.command), on_output, on_result, on_done)
+    try:
+        while not finished.wait(0.2):
+            pass
+    except KeyboardInterrupt:
+        token.cancel()
+        finished.wait(10)
+        return 130
+    finally:
+        ssh_core.shutdown_ssh()
+
+    if len(rows) == 1:
+        # Một host: trả đúng exit code của lệnh remote như ssh
+        res = results[0]
+        return 1 if res.error else res.exit_code
+    ok = sum(1 for r in results if r.error is None and r.exit_code == 0)
+    print(f"{ok}/{len(rows)} host thành công", file=sys.stderr)
+    return 0 if ok == len(rows) else 1
+
+
+def cmd_keyscan(args):
+    if not ssh_core.HAVE_PARAMIKO:
+        print("keyscan cần paramiko (pip install paramiko)", file=sys.stderr)
+        return 1
+    repo = open_repo()
+    try:
+        rows = resolve_targets(repo, args.target)
+    except LookupError as e:
+        print(f"không có kết nối / group '{e.args[0]}'", file=sys.stderr)
+        return 2
+    finished = threading.Event()
+    results = []
+
+    def on_done(all_results):
+        results.extend(all_results)
+        finished.set()
+
+    scanner = ssh_core.HostKeyScanner(concurrency=args.jobs, timeout=args.timeout)
+    token = scanner.scan([(row[3], row[4]) for row in rows], on_done=on_done)
+    try:
+        while not finished.wait(0.2):
+            pass
+    except KeyboardInterrupt:
+        token.cancel()
+        finished.wait(10)
+        return 130
+    for r in sorted(results, key=lambda r: (r.host, r.port)):
+        print(f"{r.host}:{r.port}\t{r.status}\t{r.key_type or ''}\t{r.fingerprint or r.error}")
+    return 0 if all(r.status in ("new", "same") for r in results) else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="ssh_manager",
+        description="SSH Manager – không tham số: mở GUI.",
+        epilog="Gửi cho GUI đang chạy: tab|sftp <tên>, quit. --new-instance: luôn mở GUI mới.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("ls", help="liệt kê kết nối (tất cả hoặc một group)")
+    p.add_argument("group", nargs="?")
+    p.set_defaults(func=cmd_ls)
+
+    p = sub.add_parser("groups", help="liệt kê group")
+    p.set_defaults(func=cmd_groups)
+
+    p = sub.add_parser("search", help="tìm theo tên / host / user / group")
+    p.add_argument("text", nargs="+")
+    p.add_argument("-n", "--limit", type=int, default=200)
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("connect", help="ssh tới kết nối ngay trong terminal hiện tại")
+    p.add_argument("name")
+    p.set_defaults(func=cmd_connect)
+
+    p = sub.add_parser("exec", help="chạy lệnh trên một hoặc nhiều host song song")
+    p.add_argument("target", help="tên, host hoặc group:<tên>, ngăn bởi dấu phẩy")
+    p.add_argument("command", nargs=argparse.REMAINDER)
+    p.add_argument("-j", "--jobs", type=int, default=32, help="số host chạy cùng lúc")
+    p.add_argument("-t", "--timeout", type=float, default=60, help="giây cho mỗi host")
+    p.add_argument("--no-prefix", action="store_true", help="không thêm 'tên: ' trước mỗi dòng")
+    p.set_defaults(func=cmd_exec)
+
+    p = sub.add_parser("keyscan", help="lấy host key song song và lưu vào cache known_hosts của app")
+    p.add_argument("target", help="tên, host hoặc group:<tên>, ngăn bởi dấu phẩy")
+    p.add_argument("-j", "--jobs", type=int, default=32, help="số host chạy cùng lúc")
+    p.add_argument("-t", "--timeout", type=float, default=10, help="giây cho mỗi host")
+    p.set_defaults(func=cmd_keyscan)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.cmd == "exec" and not args.command:
+        print("exec: thiếu lệnh", file=sys.stderr)
+        return 2
+    try:
+        return args.func(args)
+    except BrokenPipeError:
+        # ssh_manager ls | head – đầu đọc đã đóng; chuyển stdout sang devnull để lúc thoát không báo lỗi flush
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2783 @@
+# Phần lõi của SSH Manager, không import Qt: DB, import/export, launcher, SSH (paramiko),
+# fan-out, terminal. Dùng chung cho GUI (ssh_manager.py) và CLI (ssh_cli.py).
+import collections
+import codecs
+import contextlib
+import datetime
+import fnmatch
+import getpass
+import glob
+import hashlib
+import importlib
+import importlib.util
+import os
+import posixpath
+import re
+import select
+import shlex
+import shutil
+import socket
+import sqlite3
+import stat
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, CancelledError, as_completed
+
+
+# =====================================================
+# RESOURCE PATH – dùng được cho DEV, PyInstaller và .deb
+# =====================================================
+def resource_path(relative):
+    if hasattr(sys, '_MEIPASS'):  # PyInstaller
+        base = sys._MEIPASS
+    else:
+        # Khi cài .deb → file thực nằm tại /usr/share/ssh_manager/
+        base = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base, relative)
+
+
+def data_dir():
+    # Thư mục dữ liệu theo XDG: $XDG_DATA_HOME/ssh_manager (mặc định ~/.local/share/ssh_manager)
+    base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(base, "ssh_manager")
+
+
+# DB location: luôn ghi vào thư mục của user (không phải cạnh binary / trong _MEIPASS tạm).
+# SSH_MANAGER_DB cho phép chỉ định file khác (bản portable, thử nghiệm).
+DB_FILE = os.environ.get("SSH_MANAGER_DB") or os.path.join(data_dir(), "connections.db")
+
+# Lần chạy đầu: chép DB cũ / DB mẫu (nếu có) theo thứ tự này vào DB_FILE
+DB_SEEDS = (
+    os.path.expanduser("~/.ssh_manager/connections.db"),  # bản .deb cũ (postinst chép vào đây)
+    resource_path("connections.db"),  # cạnh script khi chạy từ source
+    "/usr/share/ssh_manager/connections.db",  # dữ liệu mẫu của gói .deb
+)
+
+class LazyModule:
+    """Module chỉ được import ở lần truy cập thuộc tính đầu tiên (thường trên worker thread),
+    để không cộng vào thời gian khởi động."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# Optional paramiko support: chỉ kiểm tra có cài hay không, import thật ở lần SFTP / fan-out / tab đầu tiên
+HAVE_PARAMIKO = importlib.util.find_spec("paramiko") is not None
+paramiko = LazyModule("paramiko")
+asyncio = LazyModule("asyncio")  # chỉ ReachabilityScanner dùng
+# Chỉ import / export dùng tới – CLI (ls, search, connect) không phải trả giá import
+configparser = LazyModule("configparser")
+csv = LazyModule("csv")
+json = LazyModule("json")
+
+
+# ==========================
+# DATABASE HELPERS
+# ==========================
+# Câu SQL dùng chung – giữ nguyên chuỗi để sqlite3 tái sử dụng prepared statement
+# connections.group_id → groups.id; các câu SELECT vẫn trả tuple
+# (id, grp, name, host, port, user, password, protocol, last_used) như trước
+CONN_SELECT = """
+              SELECT c.id, g.name, c.name, c.host, c.port, c.user, c.password, c.protocol, c.last_used
+              FROM connections c
+                       JOIN groups g ON g.id = c.group_id
+              """
+# CROSS JOIN ép groups làm vòng ngoài: duyệt theo index groups.name rồi (group_id, name)
+# → ORDER BY g.name, c.name, c.id không cần sort tạm
+CONN_SELECT_ORDERED = """
+                      SELECT c.id, g.name, c.name, c.host, c.port, c.user, c.password, c.protocol, c.last_used
+                      FROM groups g
+                               CROSS JOIN connections c ON c.group_id = g.id
+                      """
+SQL_FETCH_ALL = CONN_SELECT_ORDERED + "ORDER BY g.name, c.name, c.id"
+SQL_FETCH_GROUP = CONN_SELECT + "WHERE c.group_id = (SELECT id FROM groups WHERE name = ?) ORDER BY c.name, c.id"
+SQL_GET_CONN = CONN_SELECT + "WHERE c.id = ?"
+# Phân trang keyset cho table model: (grp, name, id) là khoá sắp xếp duy nhất.
+# Tất cả đều đi theo index (group_id, name) + groups.name, không cần sort tạm.
+SQL_PAGE_ALL_START = CONN_SELECT_ORDERED + "ORDER BY g.name, c.name, c.id LIMIT ?"
+SQL_PAGE_ALL_AFTER = CONN_SELECT_ORDERED + "WHERE g.name > ? ORDER BY g.name, c.name, c.id LIMIT ?"
+SQL_PAGE_GROUP = CONN_SELECT + """
+                 WHERE c.group_id = (SELECT id FROM groups WHERE name = ?)
+                   AND (c.name, c.id) > (?, ?)
+                 ORDER BY c.name, c.id
+                 LIMIT ?
+                 """
+SQL_GROUP_IDS = "SELECT id FROM connections WHERE group_id = (SELECT id FROM groups WHERE name = ?)"
+SQL_TOUCH_CONN = "UPDATE connections SET last_used=? WHERE id=?"
+SQL_INSERT_CONN = """
+                  INSERT INTO connections (group_id, name, host, port, user, password, protocol, last_used, multiplex)
+                  VALUES ((SELECT id FROM groups WHERE name = ?), ?, ?, ?, ?, ?, ?, ?, ?)
+                  """
+SQL_UPDATE_CONN = """
+                  UPDATE connections
+                  SET group_id=(SELECT id FROM groups WHERE name = ?),
+                      name=?,
+                      host=?,
+                      port=?,
+                      user=?,
+                      password=?,
+                      protocol=?,
+                      last_used=?,
+                      multiplex=coalesce(?, multiplex)
+                  WHERE id = ?
+                  """
+SQL_DELETE_CONN = "DELETE FROM connections WHERE id=?"
+# Group rỗng ('') là "(no group)" – không liệt kê như group do user tạo
+SQL_LIST_GROUPS = "SELECT name FROM groups WHERE name <> '' ORDER BY name"
+SQL_DISTINCT_GRP = """
+                   SELECT g.name
+                   FROM groups g
+                   WHERE EXISTS (SELECT 1 FROM connections c WHERE c.group_id = g.id)
+                   """
+SQL_INSERT_GROUP = "INSERT OR IGNORE INTO groups (name) VALUES (?)"
+SQL_DELETE_GROUP = "DELETE FROM groups WHERE name=?"
+SQL_DELETE_GROUP_CONNS = "DELETE FROM connections WHERE group_id = (SELECT id FROM groups WHERE name = ?)"
+# Tìm kiếm: FTS5 MATCH, xếp theo lần dùng gần nhất.
+# Ít kết quả → join rồi sort; nhiều kết quả → đi theo index last_used và dừng sau LIMIT dòng.
+SEARCH_WALK_THRESHOLD = 2000
+SQL_SEARCH_COUNT = """
+                   SELECT count(*)
+                   FROM (SELECT 1 FROM connections_fts WHERE connections_fts MATCH ? LIMIT ?)
+                   """
+SQL_SEARCH_FTS = CONN_SELECT + """
+                 JOIN connections_fts f ON f.rowid = c.id
+                 WHERE connections_fts MATCH ?
+                 ORDER BY c.last_used DESC, c.name
+                 LIMIT ?
+                 """
+SQL_SEARCH_FTS_RECENT = CONN_SELECT.replace("FROM connections c", "FROM connections c INDEXED BY idx_conn_last_used") + """
+                        WHERE c.id IN (SELECT rowid FROM connections_fts WHERE connections_fts MATCH ?)
+                        ORDER BY c.last_used DESC
+                        LIMIT ?
+                        """
+SQL_SEARCH_LIKE = CONN_SELECT + """
+                  WHERE c.name LIKE ? ESCAPE '\\' OR c.host LIKE ? ESCAPE '\\'
+                     OR c.user LIKE ? ESCAPE '\\' OR g.name LIKE ? ESCAPE '\\'
+                  ORDER BY c.last_used DESC, c.name
+                  LIMIT ?
+                  """
+SQL_HOST_PORTS_ALL = "SELECT DISTINCT host, port FROM connections"
+SQL_HOST_PORTS_GROUP = """
+                       SELECT DISTINCT host, port
+                       FROM connections
+                       WHERE group_id = (SELECT id FROM groups WHERE name = ?)
+                       """
+SQL_GET_MULTIPLEX = "SELECT multiplex FROM connections WHERE id=?"
+SQL_MULTIPLEX_TARGETS = "SELECT host, port, user, group_concat(name, ', ') FROM connections WHERE multiplex=1 GROUP BY host, port, user"
+SQL_HOST_KEYS = "SELECT host, port, user FROM connections"
+SQL_FIND_CONN = CONN_SELECT + "WHERE c.name = ? OR c.host = ? ORDER BY c.name = ? DESC, c.last_used DESC LIMIT 1"
+SQL_HAS_FTS = "SELECT 1 FROM sqlite_master WHERE type='table' AND name='connections_fts'"
+SQL_LOAD_LAYOUT = "SELECT col_name, width, position FROM table_layout"
+SQL_SAVE_LAYOUT = """
+                  INSERT INTO table_layout (col_name, width, position)
+                  VALUES (?, ?, ?)
+                  ON CONFLICT(col_name) DO UPDATE SET width=excluded.width, position=excluded.position
+                  """
+SQL_KNOWN_HOSTS_ALL = "SELECT host, port, key_type, key FROM known_hosts ORDER BY host, port, key_type"
+SQL_KNOWN_HOST_PUT = """
+                     INSERT INTO known_hosts (host, port, key_type, key, added)
+                     VALUES (?, ?, ?, ?, ?)
+                     ON CONFLICT(host, port, key_type) DO UPDATE SET key=excluded.key, added=excluded.added
+                     """
+SQL_KNOWN_HOST_DELETE = "DELETE FROM known_hosts WHERE host=? AND port=?"
+SQL_LOAD_UI_STATE = "SELECT key, value FROM ui_state"
+SQL_TRANSFER_GET = """
+                   SELECT id, size, mtime, chunk, confirmed
+                   FROM transfer_files
+                   WHERE direction = ? AND endpoint = ? AND dest = ?
+                   """
+SQL_TRANSFER_HASHES = "SELECT sha256 FROM transfer_chunks WHERE file_id = ? ORDER BY idx"
+SQL_TRANSFER_DELETE = "DELETE FROM transfer_files WHERE direction = ? AND endpoint = ? AND dest = ?"
+SQL_TRANSFER_INSERT = """
+                      INSERT INTO transfer_files (direction, endpoint, source, dest, size, mtime, chunk, updated)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                      """
+SQL_TRANSFER_CHUNK = "INSERT OR REPLACE INTO transfer_chunks (file_id, idx, sha256) VALUES (?, ?, ?)"
+SQL_TRANSFER_CONFIRM = "UPDATE transfer_files SET confirmed = ?, updated = ? WHERE id = ?"
+SQL_TRANSFER_TRIM = "DELETE FROM transfer_chunks WHERE file_id = ? AND idx >= ?"
+SQL_TRANSFER_DONE = "DELETE FROM transfer_files WHERE id = ?"
+SQL_TRANSFER_PRUNE = "DELETE FROM transfer_files WHERE updated < ?"
+SQL_SAVE_UI_STATE = "INSERT OR REPLACE INTO ui_state (key, value) VALUES (?, ?)"
+
+# PRAGMA cho kết nối sống lâu: WAL + synchronous=NORMAL để commit không fsync mỗi lần
+DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA busy_timeout=3000",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+class ChangeSet:
+    """Danh sách thay đổi của một thao tác ghi: dòng thêm/sửa (tuple đầy đủ), id bị xoá, group thêm/xoá."""
+
+    def __init__(self, inserted=(), updated=(), deleted=(), groups_added=(), groups_removed=(), reset=False):
+        self.inserted = list(inserted)
+        self.updated = list(updated)
+        self.deleted = list(deleted)
+        self.groups_added = list(groups_added)
+        self.groups_removed = list(groups_removed)
+        self.reset = reset  # quá nhiều thay đổi (import hàng loạt) → view nạp lại từ đầu
+
+    def __bool__(self):
+        return bool(self.inserted or self.updated or self.deleted
+                    or self.groups_added or self.groups_removed or self.reset)
+
+
+class ConnectionRepository:
+    """Giữ một kết nối SQLite duy nhất cho toàn bộ app (thay cho sqlite3.connect mỗi lần gọi)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._has_fts = None
+        self.conn = sqlite3.connect(path, check_same_thread=False, cached_statements=128)
+        for pragma in DB_PRAGMAS:
+            try:
+                self.conn.execute(pragma)
+            except sqlite3.DatabaseError as e:
+                print("pragma error:", pragma, e)
+
+    # --- Hạ tầng chung ---
+    def query(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    def execute(self, sql, params=()):
+        with self._lock, self.conn:
+            return self.conn.execute(sql, params)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    # --- Thông báo thay đổi (ChangeSet) cho view ---
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _publish(self, changes):
+        if not changes:
+            return
+        for listener in list(self._listeners):
+            try:
+                listener(changes)
+            except Exception as e:
+                print("change listener error:", e)
+
+    # --- connections ---
+    def fetch_all(self):
+        return self.query(SQL_FETCH_ALL)
+
+    def fetch_group(self, grp):
+        return self.query(SQL_FETCH_GROUP, (grp,))
+
+    def fetch_page(self, grp, after, limit):
+        # grp=None → tất cả; after là khoá sắp xếp của dòng cuối đã nạp (None = trang đầu)
+        if grp is not None:
+            return self.query(SQL_PAGE_GROUP, (grp, *(after or ("", -1)), limit))
+        if after is None:
+            return self.query(SQL_PAGE_ALL_START, (limit,))
+        # Phần còn lại của group hiện tại, rồi sang các group kế tiếp
+        last_grp, last_name, last_id = after
+        rows = self.query(SQL_PAGE_GROUP, (last_grp, last_name, last_id, limit))
+        if len(rows) < limit:
+            rows += self.query(SQL_PAGE_ALL_AFTER, (last_grp, limit - len(rows)))
+        return rows
+
+    def get_conn(self, id_):
+        return self.query_one(SQL_GET_CONN, (id_,))
+
+    def find_conn(self, name):
+        # Theo tên (ưu tiên) hoặc host; trùng thì lấy kết nối dùng gần nhất
+        return self.query_one(SQL_FIND_CONN, (name, name, name))
+
+    def insert_conn(self, data):
+        with self._lock:
+            self.ensure_group(data['grp'])
+            cur = self.execute(SQL_INSERT_CONN, (
+                data['grp'], data['name'], data['host'], data['port'],
+                data['user'], data['password'], data['protocol'],
+                data.get('last_used', ''), int(data.get('multiplex', 0))
+            ))
+            id_ = cur.lastrowid
+            row = self.get_conn(id_)
+        self._publish(ChangeSet(inserted=[row]))
+        return id_
+
+    def update_conn(self, id_, data):
+        with self._lock:
+            self.ensure_group(data['grp'])
+            self.execute(SQL_UPDATE_CONN, (
+                data['grp'], data['name'], data['host'], data['port'],
+                data['user'], data['password'], data['protocol'],
+                data.get('last_used', ''), data.get('multiplex'), id_
+            ))
+            row = self.get_conn(id_)
+        if row:
+            self._publish(ChangeSet(updated=[row]))
+
+    def touch_conn(self, id_, last_used):
+        # Chỉ cập nhật last_used (dùng khi mở SSH)
+        with self._lock:
+            self.execute(SQL_TOUCH_CONN, (last_used, id_))
+            row = self.get_conn(id_)
+        if row:
+            self._publish(ChangeSet(updated=[row]))
+
+    def delete_conn(self, id_):
+        self.execute(SQL_DELETE_CONN, (id_,))
+        self._publish(ChangeSet(deleted=[id_]))
+
+    # --- search ---
+    def search(self, text, limit=200):
+        terms = text.split()
+        if not terms:
+            return []
+        if self._has_fts is None:
+            self._has_fts = self.query_one(SQL_HAS_FTS) is not None
+        if self._has_fts:
+            # Mỗi từ là một phrase prefix: "web 01"* khớp web-01, web-012...
+            match = " ".join('"' + t.replace('"', '""') + '"*' for t in terms)
+            try:
+                hits = self.query_one(SQL_SEARCH_COUNT, (match, SEARCH_WALK_THRESHOLD + 1))[0]
+                sql = SQL_SEARCH_FTS_RECENT if hits > SEARCH_WALK_THRESHOLD else SQL_SEARCH_FTS
+                return self.query(sql, (match, limit))
+            except sqlite3.OperationalError as e:
+                print("search error:", e)
+                return []
+        like = "%" + text.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return self.query(SQL_SEARCH_LIKE, (like, like, like, like, limit))
+
+    def host_ports(self, grp=None):
+        # Các cặp (host, port) khác nhau của một group (None = tất cả)
+        if grp is None:
+            return self.query(SQL_HOST_PORTS_ALL)
+        return self.query(SQL_HOST_PORTS_GROUP, (grp,))
+
+    def bulk_import(self, records, batch=1000):
+        # records: iterable (grp, name, host, port, user, password, protocol, last_used), được đọc dần.
+        # Bỏ qua (host, port, user) đã có trong DB hoặc lặp trong chính nguồn import.
+        # Đọc / parse nguồn chạy ngoài lock; lock + transaction chỉ giữ trong từng lô executemany
+        # → phân trang, tìm kiếm, touch_conn của GUI chen vào được giữa các lô.
+        # Hỏng giữa chừng thì các lô đã ghi vẫn còn; import lại an toàn vì dòng trùng bị bỏ qua.
+        # → (số dòng thêm, số dòng trùng)
+        inserted = skipped = 0
+        seen = {(h, int(p or 0), u) for h, p, u in self.query(SQL_HOST_KEYS)}
+        buf = []
+        for rec in records:
+            key = (rec[2], int(rec[3]), rec[4])
+            if key in seen:
+                skipped += 1
+                continue
+            seen.add(key)
+            buf.append(tuple(rec) + (0,))
+            if len(buf) >= batch:
+                self._insert_batch(buf)
+                inserted += len(buf)
+                buf = []
+        if buf:
+            self._insert_batch(buf)
+            inserted += len(buf)
+        if inserted:
+            self._publish(ChangeSet(reset=True))
+        return inserted, skipped
+
+    def _insert_batch(self, rows):
+        with self._lock, self.conn:
+            self.conn.executemany(SQL_INSERT_GROUP, {(r[0],) for r in rows})
+            self.conn.executemany(SQL_INSERT_CONN, rows)
+
+    # --- multiplex (ControlMaster) ---
+    def multiplex_enabled(self, id_):
+        row = self.query_one(SQL_GET_MULTIPLEX, (id_,))
+        return bool(row and row[0])
+
+    def multiplex_targets(self):
+        # (host, port, user, tên các kết nối) có bật multiplex
+        return self.query(SQL_MULTIPLEX_TARGETS)
+
+    # --- groups ---
+    def distinct_grp(self):
+        return [r[0] for r in self.query(SQL_DISTINCT_GRP)]
+
+    def list_groups(self):
+        # Ưu tiên lấy từ bảng groups, fallback sang DISTINCT grp từ connections
+        try:
+            return [r[0] for r in self.query(SQL_LIST_GROUPS)]
+        except sqlite3.DatabaseError as e:
+            print(e)
+            return [r[0] for r in self.query(SQL_DISTINCT_GRP)]
+
+    def ensure_group(self, name):
+        # Tạo dòng groups (nếu chưa có) để connections.group_id luôn trỏ đúng
+        return self.execute(SQL_INSERT_GROUP, (name or "",)).rowcount > 0
+
+    def add_group(self, name):
+        if self.ensure_group(name):
+            self._publish(ChangeSet(groups_added=[name]))
+
+    def delete_group(self, name):
+        with self._lock, self.conn:
+            ids = [r[0] for r in self.conn.execute(SQL_GROUP_IDS, (name,))]
+            self.conn.execute(SQL_DELETE_GROUP_CONNS, (name,))
+            self.conn.execute(SQL_DELETE_GROUP, (name,))
+        self._publish(ChangeSet(deleted=ids, groups_removed=[name]))
+
+    # --- host key cache ---
+    def known_hosts(self):
+        return self.query(SQL_KNOWN_HOSTS_ALL)
+
+    def save_host_keys(self, entries):
+        # entries: [(host, port, key_type, key_base64)] – một transaction cho cả lượt scan
+        added = now_str()
+        with self._lock, self.conn:
+            self.conn.executemany(SQL_KNOWN_HOST_PUT, [(h, int(p), kt, k, added) for h, p, kt, k in entries])
+
+    def delete_host_keys(self, targets):
+        with self._lock, self.conn:
+            self.conn.executemany(SQL_KNOWN_HOST_DELETE, [(h, int(p)) for h, p in targets])
+
+    # --- tiến độ transfer SFTP (để resume) ---
+    def transfer_state(self, direction, endpoint, dest):
+        # → (file_id, size, mtime, chunk, confirmed, [sha256 từng chunk]) hoặc None
+        row = self.query_one(SQL_TRANSFER_GET, (direction, endpoint, dest))
+        if row is None:
+            return None
+        return (*row, [r[0] for r in self.query(SQL_TRANSFER_HASHES, (row[0],))])
+
+    def start_transfer(self, direction, endpoint, source, dest, size, mtime, chunk):
+        # Bỏ tiến độ cũ (nếu có) của cùng đích rồi ghi bản mới → file_id
+        with self._lock, self.conn:
+            self.conn.execute(SQL_TRANSFER_DELETE, (direction, endpoint, dest))
+            return self.conn.execute(SQL_TRANSFER_INSERT, (direction, endpoint, source, dest, size, mtime,
+                                                           chunk, now_str())).lastrowid
+
+    def confirm_chunk(self, file_id, idx, sha256, confirmed):
+        # Hash của chunk và offset đã xác nhận được ghi cùng một transaction
+        with self._lock, self.conn:
+            self.conn.execute(SQL_TRANSFER_CHUNK, (file_id, idx, sha256))
+            self.conn.execute(SQL_TRANSFER_CONFIRM, (confirmed, now_str(), file_id))
+
+    def rewind_transfer(self, file_id, chunks, confirmed):
+        # Chỉ giữ `chunks` chunk đầu (đã kiểm hash) khi resume
+        with self._lock, self.conn:
+            self.conn.execute(SQL_TRANSFER_TRIM, (file_id, chunks))
+            self.conn.execute(SQL_TRANSFER_CONFIRM, (confirmed, now_str(), file_id))
+
+    def finish_transfer(self, file_id):
+        self.execute(SQL_TRANSFER_DONE, (file_id,))
+
+    def forget_transfer(self, direction, endpoint, dest):
+        self.execute(SQL_TRANSFER_DELETE, (direction, endpoint, dest))
+
+    def prune_transfers(self, days=30):
+        # Tiến độ dở dang quá lâu không ai resume → xoá
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+        self.execute(SQL_TRANSFER_PRUNE, (cutoff,))
+
+    # --- table layout / trạng thái UI ---
+    def load_layout(self):
+        # → ({col_name: (width, position)}, {key: value})
+        columns = {name: (width, pos) for name, width, pos in self.query(SQL_LOAD_LAYOUT)}
+        return columns, dict(self.query(SQL_LOAD_UI_STATE))
+
+    def save_layout(self, columns, state=()):
+        # Mọi thay đổi bố cục trong một transaction: columns {col_name: (width, position)}, state {key: value}
+        with self._lock, self.conn:
+            self.conn.executemany(SQL_SAVE_LAYOUT, [(name, w, pos) for name, (w, pos) in columns.items()])
+            self.conn.executemany(SQL_SAVE_UI_STATE, dict(state).items())
+
+
+# Phiên bản schema (PRAGMA user_version)
+SCHEMA_VERSION = 6
+
+# Baseline: các bảng của bản cũ (trước khi có user_version). DB mới tạo hoặc DB cũ thiếu bảng
+# (bản v2 chỉ có connections) đều được đưa về cùng một điểm xuất phát cho bước v1.
+SCHEMA_V0 = """
+CREATE TABLE IF NOT EXISTS connections
+(
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    grp       TEXT,
+    name      TEXT,
+    host      TEXT,
+    port      INTEGER,
+    user      TEXT,
+    password  TEXT,
+    protocol  TEXT,
+    last_used TEXT
+);
+CREATE TABLE IF NOT EXISTS groups
+(
+    id   INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE
+);
+CREATE TABLE IF NOT EXISTS table_layout
+(
+    col_name TEXT PRIMARY KEY,
+    width    INTEGER
+);
+"""
+
+# v0 → v1: groups thành khoá ngoại (group_id) thay vì lặp tên group ở mỗi dòng,
+# thêm index cho lọc theo group + sắp xếp theo tên, last_used và host
+SCHEMA_V1 = """
+CREATE TABLE groups_new
+(
+    id   INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE
+);
+INSERT INTO groups_new (id, name) SELECT id, name FROM groups WHERE name IS NOT NULL;
+DROP TABLE groups;
+ALTER TABLE groups_new RENAME TO groups;
+INSERT OR IGNORE INTO groups (name) SELECT DISTINCT COALESCE(grp, '') FROM connections;
+CREATE TABLE connections_new
+(
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_id  INTEGER NOT NULL REFERENCES groups (id) ON DELETE CASCADE,
+    name      TEXT    NOT NULL DEFAULT '',
+    host      TEXT    NOT NULL DEFAULT '',
+    port      INTEGER NOT NULL DEFAULT 22,
+    user      TEXT    NOT NULL DEFAULT '',
+    password  TEXT    NOT NULL DEFAULT '',
+    protocol  TEXT    NOT NULL DEFAULT 'SSH',
+    last_used TEXT    NOT NULL DEFAULT ''
+);
+INSERT INTO connections_new (id, group_id, name, host, port, user, password, protocol, last_used)
+SELECT c.id, g.id, COALESCE(c.name, ''), COALESCE(c.host, ''), COALESCE(c.port, 22),
+       COALESCE(c.user, ''), COALESCE(c.password, ''), COALESCE(c.protocol, 'SSH'), COALESCE(c.last_used, '')
+FROM connections c
+         JOIN groups g ON g.name = COALESCE(c.grp, '');
+DROP TABLE connections;
+ALTER TABLE connections_new RENAME TO connections;
+CREATE INDEX IF NOT EXISTS idx_conn_group_name ON connections (group_id, name);
+CREATE INDEX IF NOT EXISTS idx_conn_last_used ON connections (last_used);
+CREATE INDEX IF NOT EXISTS idx_conn_host ON connections (host, port, user);
+"""
+
+# v1 → v2: index FTS5 cho ô tìm kiếm (name, host, user, grp), rowid = connections.id.
+# Trigger giữ index đồng bộ cho mọi đường ghi (insert/update/delete, kể cả cascade khi xoá group).
+SCHEMA_V2 = """
+CREATE VIRTUAL TABLE IF NOT EXISTS connections_fts USING fts5
+(
+    name, host, user, grp,
+    tokenize = 'unicode61', prefix = '1 2 3'
+);
+INSERT INTO connections_fts (rowid, name, host, user, grp)
+SELECT c.id, c.name, c.host, c.user, g.name
+FROM connections c
+         JOIN groups g ON g.id = c.group_id;
+CREATE TRIGGER IF NOT EXISTS trg_conn_fts_insert
+    AFTER INSERT
+    ON connections
+BEGIN
+    INSERT INTO connections_fts (rowid, name, host, user, grp)
+    VALUES (new.id, new.name, new.host, new.user, (SELECT name FROM groups WHERE id = new.group_id));
+END;
+CREATE TRIGGER IF NOT EXISTS trg_conn_fts_update
+    AFTER UPDATE OF group_id, name, host, user
+    ON connections
+BEGIN
+    UPDATE connections_fts
+    SET name = new.name,
+        host = new.host,
+        user = new.user,
+        grp  = (SELECT name FROM groups WHERE id = new.group_id)
+    WHERE rowid = new.id;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_conn_fts_delete
+    AFTER DELETE
+    ON connections
+BEGIN
+    DELETE FROM connections_fts WHERE rowid = old.id;
+END;
+"""
+
+def add_column(conn, table, column, decl):
+    # ALTER TABLE ADD COLUMN tại chỗ (không chép bảng), bỏ qua nếu cột đã có
+    if column not in {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# v2 → v3: bật OpenSSH ControlMaster cho từng kết nối
+def schema_v3(conn):
+    add_column(conn, "connections", "multiplex", "INTEGER NOT NULL DEFAULT 0")
+
+
+SCHEMA_V4 = """
+CREATE TABLE IF NOT EXISTS ui_state
+(
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+)
+"""
+
+
+# v3 → v4: thứ tự cột của bảng (table_layout.position) + trạng thái UI khác (kích thước splitter)
+def schema_v4(conn):
+    add_column(conn, "table_layout", "position", "INTEGER")
+    conn.execute(SCHEMA_V4)
+
+
+# v4 → v5: host key đã biết theo host:port (ssh + paramiko verify, không cần hỏi lại mạng)
+SCHEMA_V5 = """
+CREATE TABLE IF NOT EXISTS known_hosts
+(
+    host     TEXT    NOT NULL,
+    port     INTEGER NOT NULL,
+    key_type TEXT    NOT NULL,
+    key      TEXT    NOT NULL,
+    added    TEXT,
+    PRIMARY KEY (host, port, key_type)
+) WITHOUT ROWID;
+"""
+
+# v5 → v6: tiến độ upload / download SFTP theo file – offset đã xác nhận + sha256 từng chunk
+SCHEMA_V6 = """
+CREATE TABLE IF NOT EXISTS transfer_files
+(
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    direction TEXT    NOT NULL,
+    endpoint  TEXT    NOT NULL,
+    source    TEXT    NOT NULL,
+    dest      TEXT    NOT NULL,
+    size      INTEGER NOT NULL,
+    mtime     INTEGER,
+    chunk     INTEGER NOT NULL,
+    confirmed INTEGER NOT NULL DEFAULT 0,
+    updated   TEXT,
+    UNIQUE (direction, endpoint, dest)
+);
+CREATE TABLE IF NOT EXISTS transfer_chunks
+(
+    file_id INTEGER NOT NULL REFERENCES transfer_files (id) ON DELETE CASCADE,
+    idx     INTEGER NOT NULL,
+    sha256  TEXT    NOT NULL,
+    PRIMARY KEY (file_id, idx)
+) WITHOUT ROWID;
+"""
+
+
+# Các bước nâng cấp theo thứ tự: (user_version đích, mô tả, SQL script hoặc hàm(conn)).
+# Mỗi bước chạy trong một transaction cùng với lệnh tăng user_version → hỏng giữa chừng thì
+# không có gì thay đổi, chạy lại an toàn. Thêm bước mới: nối vào cuối và tăng SCHEMA_VERSION.
+SCHEMA_STEPS = [
+    (1, "baseline + groups.id làm khoá ngoại", SCHEMA_V0 + SCHEMA_V1),
+    (2, "FTS5 cho ô tìm kiếm", SCHEMA_V2),
+    (3, "cột multiplex", schema_v3),
+    (4, "thứ tự cột + ui_state", schema_v4),
+    (5, "known_hosts cache", SCHEMA_V5),
+    (6, "tiến độ transfer SFTP", SCHEMA_V6),
+]
+
+
+def has_fts5(conn):
+    opts = {r[0] for r in conn.execute("PRAGMA compile_options")}
+    return "ENABLE_FTS5" in opts
+
+
+def upgrade_schema(repo):
+    # Lúc khởi động chỉ đọc một số nguyên; DDL chỉ chạy khi DB cũ hơn app
+    with repo._lock:
+        version = repo.query_one("PRAGMA user_version")[0]
+        if version >= SCHEMA_VERSION:
+            if version > SCHEMA_VERSION:
+                print(f"⚠️ DB schema v{version} mới hơn app (v{SCHEMA_VERSION})")
+            return
+        conn = repo.conn
+        conn.commit()
+        # Phải tắt FK khi dựng lại bảng (PRAGMA này không có tác dụng trong transaction)
+        conn.execute("PRAGMA foreign_keys=OFF")
+        try:
+            for target, desc, step in SCHEMA_STEPS:
+                if version >= target:
+                    continue
+                if step is SCHEMA_V2 and not has_fts5(conn):
+                    # SQLite không có FTS5 → bỏ qua index, tìm kiếm dùng LIKE
+                    step = ""
+                if callable(step):
+                    conn.execute("BEGIN")
+                    step(conn)
+                    conn.execute(f"PRAGMA user_version = {target}")
+                    conn.commit()
+                else:
+                    conn.executescript(f"BEGIN;\n{step}\nPRAGMA user_version = {target};\nCOMMIT;")
+                print(f"🛠 Schema v{target}: {desc}")
+        except sqlite3.DatabaseError:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.execute("PRAGMA foreign_keys=ON")
+        print(f"🛠 Schema upgraded: v{version} → v{SCHEMA_VERSION}")
+
+
+_repo = None
+
+
+def prepare_db_file(path):
+    # Chỉ làm việc ở lần chạy đầu: tạo thư mục và chép seed (kèm -wal nếu có để không mất
+    # giao dịch chưa checkpoint; seed có thể nằm ở thư mục chỉ đọc như /usr/share)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+    for seed in DB_SEEDS:
+        if not os.path.isfile(seed) or os.path.abspath(seed) == os.path.abspath(path):
+            continue
+        try:
+            shutil.copyfile(seed, path + ".tmp")
+            os.replace(path + ".tmp", path)
+            os.chmod(path, 0o600)
+            # -wal chép sau khi file chính đã vào chỗ → không bao giờ còn -wal lạc cạnh DB không tồn tại
+            if os.path.isfile(seed + "-wal"):
+                shutil.copyfile(seed + "-wal", path + "-wal")
+            print(f"📦 DB khởi tạo từ {seed} → {path}")
+            return
+        except OSError as e:
+            print("⚠️ Không chép được DB:", seed, e)
+            # Dọn bản chép dở (kể cả -wal của seed này) để seed sau / DB rỗng không mở nhầm
+            for leftover in (path + ".tmp", path + "-wal", path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+    # Không có seed → DB rỗng, SCHEMA_STEPS tạo bảng
+
+
+def get_repo():
+    global _repo
+    if _repo is None:
+        prepare_db_file(DB_FILE)
+        _repo = ConnectionRepository(DB_FILE)
+    return _repo
+
+
+def init_db():
+    # Toàn bộ DDL nằm trong SCHEMA_STEPS (kể cả bảng gốc) – đây chỉ là kiểm tra user_version
+    upgrade_schema(get_repo())
+
+
+def fetch_all():
+    return get_repo().fetch_all()
+
+
+def insert_conn(data):
+    return get_repo().insert_conn(data)
+
+
+def update_conn(id_, data):
+    get_repo().update_conn(id_, data)
+
+
+def delete_conn(id_):
+    get_repo().delete_conn(id_)
+
+
+# ==========================
+# IMPORT (~/.ssh/config, Remmina, servers.json v1)
+# ==========================
+# Mỗi nguồn là một generator sinh (grp, name, host, port, user, password, protocol, last_used)
+# để ConnectionRepository.bulk_import ghi theo lô mà không giữ cả danh sách trong RAM.
+SSH_CONFIG_FILE = "~/.ssh/config"
+REMMINA_DIR = "~/.local/share/remmina"
+
+
+_SSH_CONFIG_LINE = re.compile(r"^\s*(\w+)\s*(?:=\s*|\s+)(.*)$")
+
+
+def _ssh_config_tokens(line):
+    # "Key value", "Key=value", "Key = value"; giá trị có thể nằm trong ngoặc kép
+    m = _SSH_CONFIG_LINE.match(line)
+    if not m or line.lstrip().startswith("#"):
+        return None, []
+    try:
+        values = shlex.split(m.group(2), comments=True)
+    except ValueError:
+        values = m.group(2).split()
+    return m.group(1).lower(), values
+
+
+def _read_ssh_config(path, blocks, seen, base_dir):
+    # Đọc một file (và các Include) vào blocks: [(patterns | None, {key: value})]; patterns None = Match (bỏ qua)
+    path = os.path.realpath(path)
+    if path in seen:
+        return
+    seen.add(path)
+    try:
+        f = open(path, encoding="utf-8", errors="replace")
+    except OSError as e:
+        print("⚠️ Không đọc được", path, e)
+        return
+    with f:
+        for line in f:
+            key, values = _ssh_config_tokens(line)
+            if not key or not values:
+                continue
+            if key == "host":
+                blocks.append((values, {}))
+            elif key == "match":
+                blocks.append((None, {}))
+            elif key == "include":
+                current = blocks[-1]
+                for pattern in values:
+                    pattern = os.path.expanduser(pattern)
+                    if not os.path.isabs(pattern):
+                        pattern = os.path.join(base_dir, pattern)
+                    for inc in sorted(glob.glob(pattern)):
+                        _read_ssh_config(inc, blocks, seen, base_dir)
+                if blocks[-1] is not current:
+                    blocks.append((current[0], {}))  # sau Include vẫn thuộc block đang mở
+            else:
+                # OpenSSH: giá trị đầu tiên thắng
+                blocks[-1][1].setdefault(key, values[0])
+
+
+def _ssh_host_matches(alias, patterns):
+    if patterns is None:
+        return False
+    matched = False
+    for p in patterns:
+        if p.startswith("!"):
+            if fnmatch.fnmatchcase(alias, p[1:]):
+                return False
+        elif fnmatch.fnmatchcase(alias, p):
+            matched = True
+    return matched
+
+
+def iter_ssh_config(path=SSH_CONFIG_FILE, grp="ssh_config"):
+    # Mỗi alias cụ thể trong "Host" là một kết nối; option lấy từ mọi block khớp (kể cả Host *, web-*)
+    path = os.path.expanduser(path)
+    blocks = [(["*"], {})]  # option trước Host đầu tiên áp dụng cho mọi host
+    _read_ssh_config(path, blocks, set(), os.path.dirname(path))
+    aliases = dict.fromkeys(a for patterns, _ in blocks if patterns
+                            for a in patterns if not any(c in a for c in "*?!"))
+    default_user = getpass.getuser()
+    for alias in aliases:
+        opts = {}
+        for patterns, block_opts in blocks:
+            if _ssh_host_matches(alias, patterns):
+                for k, v in block_opts.items():
+                    opts.setdefault(k, v)
+        host = opts.get("hostname", alias).replace("%h", alias)
+        try:
+            port = int(opts.get("port", 22))
+        except ValueError:
+            port = 22
+        yield grp, alias, host, port, opts.get("user", default_user), "", "SSH", ""
+
+
+def _split_host_port(server, default_port):
+    # "host", "host:2222", "[::1]:2222"
+    server = server.strip()
+    if server.startswith("["):
+        host, _, rest = server[1:].partition("]")
+        port = rest.lstrip(":")
+    elif server.count(":") == 1:
+        host, _, port = server.partition(":")
+    else:
+        host, port = server, ""
+    return host, int(port) if port.isdigit() else default_port
+
+
+def iter_remmina(directory=REMMINA_DIR, grp="remmina"):
+    # Chỉ lấy profile SSH / SFTP; password của Remmina được mã hoá bằng secret riêng → không import
+    default_user = getpass.getuser()
+    for path in sorted(glob.glob(os.path.join(os.path.expanduser(directory), "*.remmina"))):
+        cp = configparser.ConfigParser(interpolation=None, strict=False)
+        try:
+            cp.read(path, encoding="utf-8")
+        except (configparser.Error, UnicodeDecodeError) as e:
+            print("⚠️ Bỏ qua", path, e)
+            continue
+        if not cp.has_section("remmina"):
+            continue
+        sec = cp["remmina"]
+        proto = sec.get("protocol", "").upper()
+        if proto not in ("SSH", "SFTP"):
+            continue
+        host, port = _split_host_port(sec.get("server", ""), 22)
+        if not host:
+            continue
+        user = sec.get("username") or sec.get("ssh_username") or default_user
+        yield sec.get("group") or grp, sec.get("name") or host, host, port, user, "", proto, ""
+
+
+def iter_json_array(path, chunk_size=65536):
+    # Đọc mảng JSON từng phần tử (raw_decode trên buffer trượt) – không json.load cả file
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf, pos, started = "", 0, False
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or (started and buf[pos] == ",")):
+                pos += 1
+            if pos < len(buf):
+                if not started:
+                    if buf[pos] != "[":
+                        raise ValueError(f"{path}: không phải mảng JSON")
+                    started, pos = True, pos + 1
+                    continue
+                if buf[pos] == "]":
+                    return
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    obj = None  # phần tử bị cắt ở cuối buffer → đọc thêm
+                if obj is not None:
+                    yield obj
+                    pos = end
+                    continue
+            more = f.read(chunk_size)
+            if not more:
+                if started and pos >= len(buf):
+                    raise ValueError(f"{path}: thiếu ']'")
+                raise ValueError(f"{path}: JSON lỗi ở vị trí {pos}")
+            buf, pos = buf[pos:] + more, 0
+
+
+def iter_servers_json(path, grp="servers.json"):
+    # Định dạng của bản v1: [{"name", "server", "user", "port", "protocol", "password", "last_used"}]
+    for item in iter_json_array(path):
+        if not isinstance(item, dict) or not item.get("server"):
+            continue
+        try:
+            port = int(item.get("port") or 22)
+        except (TypeError, ValueError):
+            port = 22
+        yield (grp, item.get("name") or item["server"], item["server"], port, item.get("user") or "",
+               item.get("password") or "", item.get("protocol") or "SSH", item.get("last_used") or "")
+
+
+# ==========================
+# EXPORT / BACKUP
+# ==========================
+EXPORT_FIELDS = ("grp", "name", "host", "port", "user", "password", "protocol", "last_used")
+EXPORT_FORMATS = {"jsonl": "JSON Lines (*.jsonl)", "csv": "CSV (*.csv)", "ssh_config": "ssh_config (*)"}
+
+
+def iter_connections(path=None, batch=1000):
+    # Duyệt toàn bộ kết nối bằng cursor (fetchmany) trên connection read-only riêng:
+    # không giữ lock của repo nên GUI vẫn đọc/ghi được, WAL cho snapshot nhất quán
+    conn = sqlite3.connect(path or get_repo().path)
+    try:
+        conn.execute("PRAGMA query_only=ON")
+        cur = conn.execute(SQL_FETCH_ALL)
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
+def _export_record(row, passwords):
+    rec = dict(zip(EXPORT_FIELDS, row[1:]))
+    if not passwords:
+        rec["password"] = ""
+    return rec
+
+
+def write_jsonl(rows, f, passwords=False):
+    # Mỗi dòng một object, cùng key với dữ liệu của insert_conn → import lại được
+    for row in rows:
+        f.write(json.dumps(_export_record(row, passwords), ensure_ascii=False))
+        f.write("\n")
+
+
+def write_csv(rows, f, passwords=False):
+    w = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+    w.writeheader()
+    for row in rows:
+        w.writerow(_export_record(row, passwords))
+
+
+def write_ssh_config(rows, f, passwords=False):
+    # Alias = tên kết nối (khoảng trắng → '-'); trùng tên thì thêm id. Không bao giờ ghi password.
+    f.write(f"# Exported by SSH Manager {now_str()}\n")
+    aliases = set()
+    grp = None
+    for id_, g, name, host, port, user, pwd, proto, last in rows:
+        if g != grp:
+            grp = g
+            f.write(f"\n# ===== {g or '(no group)'} =====\n\n")
+        alias = re.sub(r"\s+", "-", name.strip()) or host
+        if alias in aliases:
+            alias = f"{alias}-{id_}"
+        aliases.add(alias)
+        f.write(f"Host {alias}\n    HostName {host}\n    Port {port}\n")
+        if user:
+            f.write(f"    User {user}\n")
+        f.write("\n")
+
+
+EXPORT_WRITERS = {"jsonl": write_jsonl, "csv": write_csv, "ssh_config": write_ssh_config}
+
+
+def export_connections(fmt, dest, passwords=False, path=None):
+    # Ghi ra file tạm rồi os.replace → file đích không bao giờ dở dang. → số dòng đã xuất
+    count = 0
+
+    def counted():
+        nonlocal count
+        for row in iter_connections(path):
+            count += 1
+            yield row
+
+    tmp = dest + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            EXPORT_WRITERS[fmt](counted(), f, passwords)
+        if fmt != "ssh_config" and passwords:
+            os.chmod(tmp, 0o600)
+        os.replace(tmp, dest)
+    except BaseException:
+        # Lỗi/Ctrl+C giữa chừng → không để lại file .tmp (có thể chứa password)
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return count
+
+
+def backup_db(dest, path=None, pages=1024, progress=None):
+    # Hot backup bằng sqlite3 backup API từ connection riêng – app vẫn ghi được trong lúc chép
+    src = sqlite3.connect(path or get_repo().path)
+    tmp = dest + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        # Bản backup chứa cả password → tạo file 0600 trước khi sqlite ghi vào
+        os.close(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+        dst = sqlite3.connect(tmp)
+        try:
+            with dst:
+                src.backup(dst, pages=pages, progress=progress)
+            dst.execute("PRAGMA journal_mode=DELETE")  # file backup đứng một mình, không kèm -wal
+        finally:
+            dst.close()
+        os.replace(tmp, dest)
+    except BaseException:
+        # Lỗi/Ctrl+C giữa chừng → không để lại file .tmp
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        src.close()
+    return os.path.getsize(dest)
+
+
+# ==========================
+# LAUNCHER (terminal / file manager)
+# ==========================
+TERMINAL = "gnome-terminal"
+FILE_MANAGERS = ["nautilus", "nemo", "thunar", "pcmanfm"]
+
+
+# Master giữ kết nối thêm bao lâu (giây) sau khi phiên cuối cùng đóng
+CONTROL_PERSIST = 600
+
+
+def now_str():
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def default_control_dir():
+    # Socket nằm trong runtime dir (tmpfs, chỉ user đọc được); đường dẫn phải ngắn (< 104 ký tự)
+    base = os.environ.get("XDG_RUNTIME_DIR") or os.path.expanduser("~/.ssh")
+    return os.path.join(base, "ssh_manager-cm")
+
+
+class ControlMasters:
+    """Socket ControlMaster của OpenSSH do app quản lý: một master cho mỗi (host, port, user),
+    terminal sau gắn vào master đang sống thay vì bắt tay + xác thực lại."""
+
+    def __init__(self, directory=None, persist=CONTROL_PERSIST, ssh_bin="ssh"):
+        self.dir = directory or default_control_dir()
+        self.persist = persist
+        self.ssh_bin = ssh_bin
+
+    def path(self, host, port, user):
+        digest = hashlib.sha1(f"{user}@{host}:{port}".encode()).hexdigest()[:16]
+        return os.path.join(self.dir, digest)
+
+    def ssh_options(self, host, port, user):
+        os.makedirs(self.dir, mode=0o700, exist_ok=True)
+        return ["-o", "ControlMaster=auto",
+                "-o", f"ControlPath={self.path(host, port, user)}",
+                "-o", f"ControlPersist={self.persist}"]
+
+    @staticmethod
+    def is_live(path):
+        # Master còn sống ⇔ socket còn nhận kết nối (không cần spawn ssh -O check)
+        s = socket.socket(socket.AF_UNIX)
+        s.settimeout(0.2)
+        try:
+            s.connect(path)
+            return True
+        except OSError:
+            return False
+        finally:
+            s.close()
+
+    def live(self, targets):
+        # targets: [(host, port, user, label)] → [(host, port, user, label, path)] của master đang sống.
+        # Socket chết (master đã thoát bất thường) bị xoá; master không khớp target nào có label None.
+        known = {self.path(h, p, u): (h, p, u, label) for h, p, u, label in targets}
+        try:
+            names = sorted(os.listdir(self.dir))
+        except FileNotFoundError:
+            return []
+        result = []
+        for name in names:
+            path = os.path.join(self.dir, name)
+            if not self.is_live(path):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                continue
+            h, p, u, label = known.get(path, (None, None, None, None))
+            result.append((h, p, u, label, path))
+        return result
+
+    def close(self, path, timeout=5):
+        # ssh -O exit: master đóng kết nối và xoá socket
+        try:
+            subprocess.run([self.ssh_bin, "-O", "exit", "-o", f"ControlPath={path}", "ssh-manager"],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print("⚠️ Không đóng được master:", path, e)
+        return not self.is_live(path)
+
+
+class Launcher:
+    """Tìm binary một lần lúc khởi động, spawn process trên worker thread
+    và đo thời gian từ lúc click tới khi process được tạo."""
+
+    def __init__(self, on_error=None, on_started=None):
+        self.on_error = on_error  # callback(message) – có thể gọi từ worker thread
+        self.on_started = on_started  # callback(label, ms)
+        self.bins = {name: shutil.which(name) for name in [TERMINAL, "ssh", "sshpass", *FILE_MANAGERS]}
+        self.file_manager = next((self.bins[fm] for fm in FILE_MANAGERS if self.bins[fm]), None)
+        self.masters = ControlMasters(ssh_bin=self.bins["ssh"] or "ssh")
+        self.metrics = collections.deque(maxlen=200)  # (label, ms) các lần launch gần nhất
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="launcher")
+
+    def ssh_command(self, host, port, user, pwd, multiplex=False):
+        # Lệnh ssh chạy trong terminal hiện tại (CLI) hoặc bên trong terminal mới (ssh_argv)
+        mux = self.masters.ssh_options(host, port, user) if multiplex else []
+        # Host key từ cache của app (chưa có thì nhận lần đầu, không bao giờ bỏ qua kiểm tra)
+        keys = get_known_hosts().ssh_options(host, port)
+        # Auto login with sshpass (phiên gắn vào master có sẵn không hỏi password, sshpass chỉ chờ)
+        if pwd and self.bins["sshpass"]:
+            return [
+                self.bins["sshpass"], "-p", pwd,
+                "ssh", *mux, *keys, f"{user}@{host}", "-p", str(port)
+            ]
+        return ["ssh", *mux, *keys, f"{user}@{host}", "-p", str(port)]
+
+    def ssh_argv(self, host, port, user, pwd, multiplex=False):
+        term = self.bins[TERMINAL] or TERMINAL
+        return [term, "--", *self.ssh_command(host, port, user, pwd, multiplex)]
+
+    def open_ssh(self, row, clicked_at=None):
+        id_, grp, name, host, port, user, pwd, proto, last = row
+        multiplex = get_repo().multiplex_enabled(id_)
+        self._submit(f"ssh {name}", self.ssh_argv(host, port, user, pwd, multiplex), clicked_at, touch_id=id_)
+
+    def open_sftp(self, row, clicked_at=None):
+        id_, grp, name, host, port, user, pwd, proto, last = row
+        if not self.file_manager:
+            return False
+        uri = f"sftp://{user}:{pwd}@{host}:{port}" if pwd else f"sftp://{user}@{host}:{port}"
+        self._submit(f"sftp {name}", [self.file_manager, uri], clicked_at)
+        return True
+
+    def _submit(self, label, argv, clicked_at, touch_id=None):
+        if clicked_at is None:
+            clicked_at = time.perf_counter()
+        self._pool.submit(self._run, label, argv, clicked_at, touch_id)
+
+    def _run(self, label, argv, clicked_at, touch_id):
+        try:
+            subprocess.Popen(argv, start_new_session=True)
+        except OSError as e:
+            print("⚠️ Lỗi launch:", label, e)
+            if self.on_error:
+                self.on_error(f"{label}: {e}")
+            return
+        ms = (time.perf_counter() - clicked_at) * 1000
+        self.metrics.append((label, ms))
+        print(f"🚀 {label}: {ms:.1f} ms")
+        if self.on_started:
+            self.on_started(label, ms)
+        # Ghi last_used sau khi process đã chạy – không nằm trên đường click → launch
+        if touch_id is not None:
+            try:
+                get_repo().touch_conn(touch_id, now_str())
+            except sqlite3.Error as e:
+                print("touch last_used error:", e)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+# ==========================
+# SSH TRANSPORT POOL (paramiko)
+# ==========================
+# Timeout mặc định (giây) cho kết nối TCP + banner/handshake và cho bước xác thực
+SSH_CONNECT_TIMEOUT = 10
+SSH_AUTH_TIMEOUT = 15
+
+
+class CancelToken:
+    """Cờ huỷ dùng chung giữa GUI và worker; cancel() gọi các callback đã đăng ký
+    (ví dụ đóng socket đang connect) để thao tác đang chặn kết thúc ngay."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception as e:
+                print("cancel callback error:", e)
+
+    def on_cancel(self, fn):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn()
+
+    def remove(self, fn):
+        with self._lock:
+            if fn in self._callbacks:
+                self._callbacks.remove(fn)
+
+    def check(self):
+        if self._event.is_set():
+            raise CancelledError()
+
+    def wait(self, seconds):
+        # Ngủ tối đa `seconds`, thức dậy ngay khi bị huỷ → True nếu đã huỷ
+        return self._event.wait(seconds)
+
+
+class TransportPool:
+    """Giữ các paramiko.Transport đã xác thực theo (host, port, user) để mở SFTP channel mới
+    mà không phải bắt tay lại. Có keepalive, loại bỏ khi idle, giới hạn số lượng và tự kết nối lại."""
+
+    def __init__(self, max_size=8, idle_timeout=300, keepalive=30,
+                 connect_timeout=SSH_CONNECT_TIMEOUT, auth_timeout=SSH_AUTH_TIMEOUT, known_hosts=None):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout  # giây
+        self.keepalive = keepalive  # giây
+        self.connect_timeout = connect_timeout
+        self.auth_timeout = auth_timeout
+        self.known_hosts = known_hosts  # KnownHosts: verify host key trước khi gửi password / key
+        self._entries = collections.OrderedDict()  # key → [transport, last_used (monotonic)]
+        self._lock = threading.Lock()
+        self._key_locks = collections.defaultdict(threading.Lock)  # tránh 2 thread cùng connect một host
+
+    def acquire(self, host, port, user, password, token=None):
+        key = (host, int(port), user)
+        with self._key_locks[key]:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry[0].is_active():
+                    entry[1] = time.monotonic()
+                    self._entries.move_to_end(key)
+                    return entry[0]
+            if entry:
+                self.discard(key)
+            t = self.connect(host, int(port), user, password, token)
+            with self._lock:
+                self._entries[key] = [t, time.monotonic()]
+                self._entries.move_to_end(key)
+                evicted = []
+                while len(self._entries) > self.max_size:
+                    evicted.append(self._entries.popitem(last=False)[1][0])
+            for old in evicted:
+                old.close()
+            return t
+
+    def connect(self, host, port, user, password, token=None):
+        # Tạo Transport đã xác thực (không đưa vào pool)
+        if token:
+            token.check()
+        sock = socket.create_connection((host, port), timeout=self.connect_timeout)
+        t = paramiko.Transport(sock)
+        if token:
+            token.on_cancel(t.close)  # huỷ → đóng socket, connect() đang chờ sẽ lỗi ngay
+        try:
+            t.banner_timeout = self.connect_timeout
+            t.handshake_timeout = self.connect_timeout
+            t.auth_timeout = self.auth_timeout
+            t.set_keepalive(self.keepalive)
+            if self.known_hosts:
+                self.known_hosts.prefer(t, host, port)
+            # Không truyền timeout: start_client sẽ trả về im lặng khi hết giờ; để banner/handshake
+            # timeout kết thúc transport thì lỗi thật (vd. "Error reading SSH protocol banner") được raise
+            t.start_client()
+            if self.known_hosts:
+                self.known_hosts.verify(host, port, t.get_remote_server_key())
+            self._auth(t, user, password)
+            if token:
+                token.check()
+        except Exception:
+            t.close()
+            if token and token.cancelled:
+                raise CancelledError()
+            raise
+        finally:
+            if token:
+                token.remove(t.close)
+        return t
+
+    @staticmethod
+    def _auth(t, user, password):
+        if password:
+            t.auth_password(user, password)
+            return
+        # Không lưu password → thử key từ ssh-agent rồi các key mặc định trong ~/.ssh
+        keys = list(paramiko.Agent().get_keys())
+        for name, cls in (("id_ed25519", paramiko.Ed25519Key), ("id_ecdsa", paramiko.ECDSAKey),
+                          ("id_rsa", paramiko.RSAKey)):
+            path = os.path.expanduser(f"~/.ssh/{name}")
+            if os.path.exists(path):
+                try:
+                    keys.append(cls.from_private_key_file(path))
+                except (paramiko.SSHException, OSError):
+                    pass  # key có passphrase / lỗi đọc
+        for key in keys:
+            try:
+                t.auth_publickey(user, key)
+                return
+            except paramiko.AuthenticationException:
+                continue
+        raise paramiko.AuthenticationException(f"Không có password / key hợp lệ cho {user}")
+
+    def open_sftp(self, host, port, user, password, token=None):
+        # Transport trong pool có thể đã chết (mạng rớt) → bỏ và kết nối lại một lần
+        for attempt in (1, 2):
+            t = self.acquire(host, port, user, password, token)
+            try:
+                return paramiko.SFTPClient.from_transport(t)
+            except (paramiko.SSHException, EOFError, OSError):
+                self.discard((host, int(port), user))
+                if attempt == 2:
+                    raise
+
+    def run(self, host, port, user, password, command, token=None, timeout=SSH_CONNECT_TIMEOUT):
+        # Lệnh ngắn trên transport trong pool → (exit code, stdout bytes); timeout tính theo lần chờ dữ liệu
+        t = self.acquire(host, port, user, password, token)
+        chan = t.open_session(timeout=self.connect_timeout)
+        try:
+            chan.settimeout(timeout)
+            chan.exec_command(command)
+            out = chan.makefile("rb").read()
+            return chan.recv_exit_status(), out
+        finally:
+            chan.close()
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry:
+            entry[0].close()
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            dead = [k for k, (t, used) in self._entries.items()
+                    if not t.is_active() or now - used > self.idle_timeout]
+            closing = [self._entries.pop(k)[0] for k in dead]
+        for t in closing:
+            t.close()
+        return len(closing)
+
+    def close_all(self):
+        with self._lock:
+            closing = [t for t, _ in self._entries.values()]
+            self._entries.clear()
+        for t in closing:
+            t.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_transport_pool = None
+_ssh_executor = None
+
+
+def get_transport_pool():
+    global _transport_pool
+    if _transport_pool is None:
+        _transport_pool = TransportPool(known_hosts=get_known_hosts())
+    return _transport_pool
+
+
+def get_ssh_executor():
+    # Worker pool chung cho mọi thao tác mạng paramiko (không chạy trên GUI thread)
+    global _ssh_executor
+    if _ssh_executor is None:
+        _ssh_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ssh-io")
+    return _ssh_executor
+
+
+def evict_idle_transports():
+    # Gọi định kỳ từ GUI; không tạo pool nếu chưa dùng tới
+    if _transport_pool:
+        _transport_pool.evict_idle()
+
+
+def shutdown_ssh():
+    if _transport_pool:
+        _transport_pool.close_all()
+    if _ssh_executor:
+        _ssh_executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ==========================
+# FAN-OUT COMMAND EXECUTOR
+# ==========================
+FanoutResult = collections.namedtuple("FanoutResult", "conn_id name host exit_code error elapsed")
+
+
+class FanoutExecutor:
+    """Chạy một lệnh trên nhiều host song song (paramiko exec channel), giới hạn số host
+    chạy cùng lúc, timeout từng host, stream stdout/stderr qua callback."""
+
+    CHUNK = 32768
+
+    def __init__(self, concurrency=32, timeout=60, pool=None):
+        self.concurrency = concurrency
+        self.timeout = timeout  # giây cho mỗi host (connect + chạy lệnh)
+        self.pool = pool or get_transport_pool()
+
+    def run(self, rows, command, on_output, on_result, on_done=None, token=None):
+        # on_output(conn_id, name, stream, text) / on_result(FanoutResult) / on_done([FanoutResult])
+        # đều được gọi từ worker thread
+        token = token or CancelToken()
+
+        def coordinator():
+            results = []
+            with ThreadPoolExecutor(max_workers=max(1, self.concurrency), thread_name_prefix="fanout") as ex:
+                futures = [ex.submit(self._run_one, row, command, on_output, token) for row in rows]
+                for f in as_completed(futures):
+                    res = f.result()
+                    results.append(res)
+                    on_result(res)
+            if on_done:
+                on_done(results)
+
+        threading.Thread(target=coordinator, name="fanout", daemon=True).start()
+        return token
+
+    def _run_one(self, row, command, on_output, token):
+        id_, grp, name, host, port, user, pwd, proto, last = row
+        t0 = time.monotonic()
+        t = None
+        code, error = None, None
+        try:
+            token.check()
+            t = self.pool.connect(host, port, user, pwd, token)
+            chan = t.open_session(timeout=self.pool.connect_timeout)
+            chan.exec_command(command)
+            code = self._pump(chan, id_, name, on_output, token, t0 + self.timeout)
+        except CancelledError:
+            error = "cancelled"
+        except TimeoutError:
+            error = "timeout"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        finally:
+            if t is not None:
+                t.close()
+        return FanoutResult(id_, name, host, code, error, time.monotonic() - t0)
+
+    def _pump(self, chan, id_, name, on_output, token, deadline):
+        decoders = {"out": codecs.getincrementaldecoder("utf-8")("replace"),
+                    "err": codecs.getincrementaldecoder("utf-8")("replace")}
+        while True:
+            token.check()
+            got = False
+            if chan.recv_ready():
+                on_output(id_, name, "out", decoders["out"].decode(chan.recv(self.CHUNK)))
+                got = True
+            if chan.recv_stderr_ready():
+                on_output(id_, name, "err", decoders["err"].decode(chan.recv_stderr(self.CHUNK)))
+                got = True
+            if not got:
+                if chan.exit_status_ready() and not chan.recv_ready() and not chan.recv_stderr_ready():
+                    return chan.recv_exit_status()
+                if time.monotonic() > deadline:
+                    raise TimeoutError()
+                time.sleep(0.02)
+
+
+# ==========================
+# EMBEDDED TERMINAL (paramiko PTY, không phụ thuộc Qt)
+# ==========================
+TERMINAL_SCROLLBACK = 5000  # số dòng giữ lại cho mỗi phiên
+# PTY khai báo TERM=dumb: buffer chỉ hiểu dòng (\r \n \b, xoá dòng, di chuyển ngang),
+# nên chương trình toàn màn hình (vim, top) vẫn nên mở bằng "Connect SSH" (gnome-terminal)
+TERMINAL_TERM = "dumb"
+TERMINAL_DRAIN_CHUNK = 64 * 1024  # số ký tự tối đa đưa vào buffer mỗi phiên mỗi lần rút
+
+_TERM_CTRL = re.compile(r"[\x00-\x1f\x7f]")
+_TERM_ESC = re.compile(r"\x1b(?:\[([0-9;?]*)[ -/]*([@-~])|\][^\x07\x1b]*(?:\x07|\x1b\\)|[ -/]*[0-Z\\^-~])")
+
+
+class ScrollbackRing:
+    """Ring buffer dung lượng cố định: append / truy cập theo chỉ số O(1), dòng cũ nhất bị ghi đè."""
+
+    __slots__ = ("_buf", "_start", "_len")
+
+    def __init__(self, capacity):
+        self._buf = [None] * capacity
+        self._start = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if not 0 <= i < self._len:
+            raise IndexError(i)
+        return self._buf[(self._start + i) % len(self._buf)]
+
+    def append(self, item):
+        cap = len(self._buf)
+        if self._len < cap:
+            self._buf[(self._start + self._len) % cap] = item
+            self._len += 1
+        else:
+            self._buf[self._start] = item
+            self._start = (self._start + 1) % cap
+
+    def clear(self):
+        self._buf = [None] * len(self._buf)
+        self._start = self._len = 0
+
+
+class TerminalBuffer:
+    """Màn hình dạng dòng cho PTY: các dòng đã xong nằm trong ScrollbackRing, dòng đang gõ là list ký tự.
+    Hiểu \\r \\n \\b \\t, tự xuống dòng ở `cols`, CSI K/P/@/C/D/G; màu và OSC bị bỏ qua."""
+
+    def __init__(self, scrollback=TERMINAL_SCROLLBACK, cols=80):
+        self.lines = ScrollbackRing(scrollback)
+        self.line = []
+        self.col = 0
+        self.cols = cols
+        self._esc = ""  # escape sequence bị cắt giữa hai lần feed
+
+    def __len__(self):
+        return len(self.lines) + 1
+
+    def __getitem__(self, i):
+        return self.lines[i] if i < len(self.lines) else "".join(self.line)
+
+    def feed(self, text):
+        if self._esc:
+            text, self._esc = self._esc + text, ""
+        pos, n = 0, len(text)
+        while pos < n:
+            m = _TERM_CTRL.search(text, pos)
+            end = m.start() if m else n
+            if end > pos:
+                self._write(text[pos:end])
+            if not m:
+                break
+            ch = text[end]
+            pos = end + 1
+            if ch == "\x1b":
+                esc = _TERM_ESC.match(text, end)
+                if esc is None:
+                    if n - end < 256:
+                        self._esc = text[end:]  # chờ phần còn lại
+                        break
+                    continue  # ESC lạc – bỏ qua
+                pos = esc.end()
+                if esc.group(2):
+                    self._csi(esc.group(1), esc.group(2))
+            elif ch == "\n":
+                self._newline()
+            elif ch == "\r":
+                self.col = 0
+            elif ch == "\b":
+                self.col = max(0, self.col - 1)
+            elif ch == "\t":
+                self._write(" " * (8 - self.col % 8))
+
+    def _newline(self):
+        self.lines.append("".join(self.line))
+        self.line = []
+        self.col = 0
+
+    def _write(self, run):
+        while run:
+            if self.col >= self.cols:
+                self._newline()  # autowrap
+            chunk, run = run[:self.cols - self.col], run[self.cols - self.col:]
+            line = self.line
+            if self.col > len(line):
+                line.extend(" " * (self.col - len(line)))
+            line[self.col:self.col + len(chunk)] = chunk
+            self.col += len(chunk)
+
+    def _csi(self, params, final):
+        args = [int(p) if p.isdigit() else 0 for p in params.lstrip("?").split(";")]
+        count = max(1, args[0])
+        line = self.line
+        if final == "K":
+            if args[0] == 0:
+                del line[self.col:]
+            elif args[0] == 1:
+                line[:self.col] = " " * min(self.col, len(line))
+            else:
+                line.clear()
+        elif final == "P":
+            del line[self.col:self.col + count]
+        elif final == "@":
+            line[self.col:self.col] = " " * count
+        elif final == "C":
+            self.col = min(self.cols - 1, self.col + count)
+        elif final == "D":
+            self.col = max(0, self.col - count)
+        elif final == "G":
+            self.col = min(self.cols - 1, count - 1)
+
+
+class TerminalSession:
+    """Một phiên shell: Transport riêng (không lấy từ pool – phiên sống lâu) + channel PTY.
+    Output được TerminalHub đẩy vào pending, GUI rút theo lô."""
+
+    def __init__(self, row, scrollback=TERMINAL_SCROLLBACK):
+        self.row = row
+        self.buffer = TerminalBuffer(scrollback)
+        self.transport = None
+        self.chan = None
+        self.eof = False
+        self._pending = []
+        self._lock = threading.Lock()
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    def open(self, pool, cols, rows, token=None):
+        # Chạy trên worker: connect + xác thực + PTY + shell
+        id_, grp, name, host, port, user, pwd, proto, last = self.row
+        t = pool.connect(host, port, user, pwd, token)
+        try:
+            chan = t.open_session(timeout=pool.connect_timeout)
+            chan.get_pty(term=TERMINAL_TERM, width=cols, height=rows)
+            chan.invoke_shell()
+        except Exception:
+            t.close()
+            raise
+        self.transport, self.chan = t, chan
+
+    def push(self, data):
+        text = self._decoder.decode(data)
+        with self._lock:
+            self._pending.append(text)
+
+    def push_eof(self):
+        with self._lock:
+            self.eof = True
+
+    def take(self, limit=TERMINAL_DRAIN_CHUNK):
+        # → (tối đa `limit` ký tự chưa hiển thị, đã hết phiên và rút hết?) – phần dư để lần sau,
+        # tránh một lần in khổng lồ (cat file lớn) làm đứng GUI
+        with self._lock:
+            text = "".join(self._pending)
+            self._pending.clear()
+            if len(text) > limit:
+                self._pending.append(text[limit:])
+                text = text[:limit]
+            return text, self.eof and not self._pending
+
+    def send(self, data):
+        if self.chan is not None and not self.eof:
+            try:
+                self.chan.sendall(data)
+            except OSError as e:
+                print("terminal send error:", e)
+
+    def resize(self, cols, rows):
+        self.buffer.cols = cols
+        if self.chan is not None and not self.eof:
+            try:
+                self.chan.resize_pty(width=cols, height=rows)
+            except (OSError, paramiko.SSHException):
+                pass
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+
+class TerminalHub:
+    """Một thread select() đọc mọi channel PTY (thay vì một thread cho mỗi phiên)."""
+
+    def __init__(self):
+        self._sessions = {}  # channel → TerminalSession
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = os.pipe()
+        self._thread = None
+
+    def add(self, session):
+        with self._lock:
+            self._sessions[session.chan] = session
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="terminal-hub", daemon=True)
+                self._thread.start()
+        os.write(self._wake_w, b"x")
+
+    def remove(self, session):
+        with self._lock:
+            self._sessions.pop(session.chan, None)
+        os.write(self._wake_w, b"x")
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                chans = list(self._sessions)
+            try:
+                ready, _, _ = select.select([self._wake_r, *chans], [], [], 5)
+            except (OSError, ValueError):
+                ready = [c for c in chans if c.closed]  # channel bị đóng giữa chừng
+            for ch in ready:
+                if ch is self._wake_r:
+                    os.read(self._wake_r, 4096)
+                    continue
+                session = self._sessions.get(ch)
+                if session is None:
+                    continue
+                try:
+                    data = ch.recv(65536)
+                except OSError:
+                    data = b""
+                if data:
+                    session.push(data)
+                else:
+                    session.push_eof()
+                    with self._lock:
+                        self._sessions.pop(ch, None)
+
+
+_terminal_hub = None
+
+
+def get_terminal_hub():
+    global _terminal_hub
+    if _terminal_hub is None:
+        _terminal_hub = TerminalHub()
+    return _terminal_hub
+
+
+# ==========================
+# REACHABILITY SCANNER
+# ==========================
+HostStatus = collections.namedtuple("HostStatus", "ok rtt_ms info checked_at")
+
+
+def status_text(st):
+    if st is None:
+        return ""
+    if st.ok:
+        return f"🟢 {st.rtt_ms:.0f} ms"
+    if st.rtt_ms is not None:
+        return f"🟡 {st.info}"  # TCP mở nhưng không phải SSH banner
+    return f"🔴 {st.info}"
+
+
+class ReachabilityScanner:
+    """Probe đồng thời nhiều host:port (asyncio: TCP connect + đọc SSH banner) với timeout
+    từng host; kết quả được cache theo TTL để reload không probe lại."""
+
+    def __init__(self, timeout=3.0, concurrency=256, ttl=120):
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.ttl = ttl  # giây
+        self._cache = {}  # (host, port) → HostStatus
+        self._lock = threading.Lock()
+
+    def get(self, host, port):
+        with self._lock:
+            st = self._cache.get((host, port))
+        if st and time.monotonic() - st.checked_at < self.ttl:
+            return st
+        return None
+
+    def scan(self, targets, on_result, on_done=None, force=False, token=None):
+        # Chạy trên thread riêng; on_result((host, port), HostStatus) gọi từ thread đó
+        todo = [t for t in dict.fromkeys(targets) if force or self.get(*t) is None]
+        token = token or CancelToken()
+
+        def run():
+            try:
+                asyncio.run(self._scan(todo, on_result, token))
+            finally:
+                if on_done:
+                    on_done(len(todo))
+
+        threading.Thread(target=run, name="reachability", daemon=True).start()
+        return todo, token
+
+    async def _scan(self, targets, on_result, token):
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def one(host, port):
+            async with sem:
+                if token.cancelled:
+                    return
+                st = await self.probe(host, port)
+            with self._lock:
+                self._cache[(host, port)] = st
+            on_result((host, port), st)
+
+        await asyncio.gather(*(one(h, p) for h, p in targets))
+
+    async def probe(self, host, port):
+        t0 = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.timeout)
+        except asyncio.TimeoutError:
+            return HostStatus(False, None, "timeout", time.monotonic())
+        except OSError as e:
+            return HostStatus(False, None, os.strerror(e.errno) if e.errno else str(e), time.monotonic())
+        rtt = (time.perf_counter() - t0) * 1000
+        try:
+            banner = await asyncio.wait_for(reader.readline(), self.timeout)
+            banner = banner.decode(errors="replace").strip()
+        except (asyncio.TimeoutError, OSError):
+            banner = ""
+        finally:
+            writer.close()
+        if banner.startswith("SSH-"):
+            return HostStatus(True, rtt, banner, time.monotonic())
+        return HostStatus(False, rtt, "no SSH banner", time.monotonic())
+
+
+# ==========================
+# HOST KEY CACHE (known_hosts)
+# ==========================
+def host_key_type(algorithm):
+    # Thuật toán chữ ký → loại key như trong known_hosts (rsa-sha2-* đều là key ssh-rsa)
+    return "ssh-rsa" if algorithm.startswith("rsa-sha2-") else algorithm
+
+
+def known_hosts_entry(host, port):
+    return host if int(port) == 22 else f"[{host}]:{port}"
+
+
+def parse_known_hosts_entry(name):
+    # "host" | "[host]:port" → (host, port)
+    host, _, port = name.partition("]:")
+    return (host[1:], int(port)) if port else (name, 22)
+
+
+USER_KNOWN_HOSTS_FILE = "~/.ssh/known_hosts"
+
+
+class KnownHosts:
+    """Host key đã biết theo host:port (bảng known_hosts, giữ trong bộ nhớ). paramiko verify trực tiếp,
+    ssh verify qua file known_hosts sinh từ bảng → lúc connect chỉ tra dict, không thêm round trip.
+    Host chưa có trong bảng thì tra tiếp ~/.ssh/known_hosts của user trước khi nhận key lần đầu."""
+
+    def __init__(self, repo, path=None, user_path=USER_KNOWN_HOSTS_FILE):
+        self.repo = repo
+        self.path = path or os.path.join(os.path.dirname(os.path.abspath(repo.path)), "known_hosts")
+        self.user_path = os.path.expanduser(user_path) if user_path else None
+        self._keys = None  # (host, port) → {key_type: base64}
+        self._mtime = None  # mtime file lúc app ghi/đọc lần cuối
+        self._user_keys = None  # paramiko.HostKeys của file user (nạp lại khi mtime đổi)
+        self._user_mtime = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._keys is None:
+            keys = collections.defaultdict(dict)
+            for host, port, key_type, key in self.repo.known_hosts():
+                keys[(host, int(port))][key_type] = key
+            self._keys = keys
+            if keys and not os.path.exists(self.path):
+                self._write_file()
+        self._absorb_file()
+        return self._keys
+
+    def _absorb_file(self):
+        # ssh (accept-new) tự ghi key mới vào file → nhận vào bảng trước khi app ghi đè file
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        new = []
+        with open(self.path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3 or parts[0].startswith(("#", "|", "@")):
+                    continue
+                entry, key_type, key = parts[:3]
+                # CheckHostIP → ssh ghi "host,ip" trên một dòng: mỗi tên một dòng trong bảng
+                for name in entry.split(","):
+                    host, port = parse_known_hosts_entry(name)
+                    if self._keys[(host, port)].get(key_type) != key:
+                        new.append((host, port, key_type, key))
+        if new:
+            self.repo.save_host_keys(new)
+            for host, port, key_type, key in new:
+                self._keys[(host, port)][key_type] = key
+
+    def get(self, host, port):
+        with self._lock:
+            return dict(self._load().get((host, int(port)), {}))
+
+    def user_keys(self, host, port):
+        # Key trong ~/.ssh/known_hosts (paramiko.HostKeys hiểu cả dòng hash và "host,ip")
+        if not self.user_path:
+            return {}
+        with self._lock:
+            try:
+                mtime = os.stat(self.user_path).st_mtime_ns
+            except OSError:
+                return {}
+            if mtime != self._user_mtime:
+                keys = paramiko.HostKeys()
+                try:
+                    keys.load(self.user_path)
+                except (OSError, paramiko.SSHException) as e:
+                    print("⚠️ Không đọc được", self.user_path, e)
+                self._user_keys, self._user_mtime = keys, mtime
+            found = self._user_keys.lookup(known_hosts_entry(host, port)) or {}
+            return {key_type: k.get_base64() for key_type, k in found.items()}
+
+    def lookup(self, host, port):
+        # Key để so: bảng của app, chưa có thì file của user
+        return self.get(host, port) or self.user_keys(host, port)
+
+    def check(self, host, port, key_type, key):
+        # → "same" | "new" (chưa biết host) | "changed" (khác key đã lưu / loại key lạ)
+        known = self.lookup(host, port)
+        if not known:
+            return "new"
+        return "same" if known.get(key_type) == key else "changed"
+
+    def learn(self, entries):
+        # entries: [(host, port, key_type, base64)] → ghi DB một lần rồi sinh lại file cho ssh
+        entries = list(entries)
+        if not entries:
+            return 0
+        with self._lock:
+            self.repo.save_host_keys(entries)
+            keys = self._load()
+            for host, port, key_type, key in entries:
+                keys[(host, int(port))][key_type] = key
+            self._write_file()
+        return len(entries)
+
+    def forget(self, targets):
+        targets = [(h, int(p)) for h, p in targets]
+        with self._lock:
+            self.repo.delete_host_keys(targets)
+            keys = self._load()
+            for target in targets:
+                keys.pop(target, None)
+            self._write_file()
+
+    def _write_file(self):
+        # Ghi file tạm rồi rename → ssh không bao giờ đọc phải file ghi dở
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            for (host, port), types in sorted(self._keys.items()):
+                for key_type, key in sorted(types.items()):
+                    f.write(f"{known_hosts_entry(host, port)} {key_type} {key}\n")
+        os.replace(tmp, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def ssh_options(self, host, port):
+        # File của app trước, ~/.ssh/known_hosts sau (ssh tự tách token trong ngoặc kép → path có dấu
+        # cách vẫn đúng). ssh so key với cả hai file, key mới chỉ ghi vào file đầu (không hash để
+        # _absorb_file đọc lại được). Host đã có key → từ chối key lạ; chưa có ở đâu → nhận lần đầu,
+        # key khác với file của user vẫn bị từ chối
+        files = f'"{self.path}"' + (f' "{self.user_path}"' if self.user_path else "")
+        strict = "yes" if self.get(host, port) else "accept-new"
+        return [
+            "-o", f"UserKnownHostsFile={files}", "-o", "HashKnownHosts=no",
+            "-o", f"StrictHostKeyChecking={strict}",
+        ]
+
+    def prefer(self, transport, host, port):
+        # Xin server trình đúng loại key đã lưu (gọi trước start_client) để so sánh được
+        known = self.lookup(host, port)
+        if known:
+            opts = transport.get_security_options()
+            preferred = [a for a in opts.key_types if host_key_type(a) in known]
+            if preferred:
+                opts.key_types = preferred
+
+    def verify(self, host, port, key):
+        # Key của paramiko Transport sau start_client(); host chưa biết → lưu lại (accept-new)
+        key_type, b64 = key.get_name(), key.get_base64()
+        status = self.check(host, port, key_type, b64)
+        if status == "changed":
+            raise paramiko.SSHException(
+                f"Host key của {known_hosts_entry(host, port)} đã thay đổi ({key_type} {key.fingerprint})"
+                " – nếu server thật sự đổi key, hãy quên key cũ rồi scan lại")
+        if status == "new":
+            self.learn([(host, port, key_type, b64)])
+
+
+_known_hosts = None
+
+
+def get_known_hosts():
+    global _known_hosts
+    if _known_hosts is None:
+        _known_hosts = KnownHosts(get_repo())
+    return _known_hosts
+
+
+HostKeyResult = collections.namedtuple("HostKeyResult", "host port status key_type fingerprint error")
+
+
+class HostKeyScanner:
+    """Lấy host key của nhiều host song song (chỉ bắt tay SSH, không xác thực), so với cache
+    và lưu key mới trong một lần ghi. Key khác với key đã lưu chỉ được báo, không ghi đè."""
+
+    def __init__(self, known_hosts=None, concurrency=32, timeout=SSH_CONNECT_TIMEOUT):
+        self.known_hosts = known_hosts or get_known_hosts()
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    def scan(self, targets, on_result=None, on_done=None, token=None):
+        # Chạy trên thread riêng; on_result(HostKeyResult) / on_done([HostKeyResult]) gọi từ thread đó
+        targets = list(dict.fromkeys((h, int(p)) for h, p in targets))
+        token = token or CancelToken()
+
+        def coordinator():
+            results, new = [], []
+            with ThreadPoolExecutor(max_workers=max(1, self.concurrency), thread_name_prefix="keyscan") as ex:
+                futures = [ex.submit(self._scan_one, h, p, token) for h, p in targets]
+                for f in as_completed(futures):
+                    res, key = f.result()
+                    results.append(res)
+                    if res.status == "new":
+                        new.append((res.host, res.port, res.key_type, key))
+                    if on_result:
+                        on_result(res)
+            try:
+                self.known_hosts.learn(new)
+            except (sqlite3.Error, OSError) as e:
+                print("⚠️ Không lưu được host key:", e)
+            if on_done:
+                on_done(results)
+
+        threading.Thread(target=coordinator, name="keyscan", daemon=True).start()
+        return token
+
+    def _scan_one(self, host, port, token):
+        try:
+            token.check()
+            key = self.fetch(host, port, token)
+        except CancelledError:
+            return HostKeyResult(host, port, "error", None, None, "cancelled"), None
+        except Exception as e:
+            return HostKeyResult(host, port, "error", None, None, str(e) or type(e).__name__), None
+        key_type, b64 = key.get_name(), key.get_base64()
+        status = self.known_hosts.check(host, port, key_type, b64)
+        return HostKeyResult(host, port, status, key_type, key.fingerprint, None), b64
+
+    def fetch(self, host, port, token=None):
+        sock = socket.create_connection((host, port), timeout=self.timeout)
+        t = paramiko.Transport(sock)
+        if token:
+            token.on_cancel(t.close)
+        try:
+            t.banner_timeout = self.timeout
+            t.handshake_timeout = self.timeout
+            self.known_hosts.prefer(t, host, port)
+            t.start_client()
+            return t.get_remote_server_key()
+        finally:
+            if token:
+                token.remove(t.close)
+            t.close()
+
+
+# ==========================
+# REMOTE DIRECTORY CACHE (SFTP)
+# ==========================
+def human_size(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+RemoteEntry = collections.namedtuple("RemoteEntry", "name is_dir size mtime")
+
+
+class SftpChannels:
+    """Mỗi thread một SFTPClient (channel riêng) trên cùng Transport trong pool:
+    nhiều thread làm việc song song mà không phải bắt tay / xác thực lại."""
+
+    def __init__(self, open_sftp):
+        self._open_sftp = open_sftp  # callable() → SFTPClient mới (channel trên transport trong pool)
+        self._clients = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def get(self):
+        sftp = getattr(self._local, "sftp", None)
+        if sftp is None or sftp.sock.closed:
+            sftp = self._open_sftp()
+            self._local.sftp = sftp
+            with self._lock:
+                self._clients.append(sftp)
+        return sftp
+
+    def drop(self):
+        # Bỏ client của thread hiện tại (channel đã hỏng) – lần get() sau mở channel mới
+        sftp = getattr(self._local, "sftp", None)
+        if sftp is None:
+            return
+        self._local.sftp = None
+        with self._lock:
+            if sftp in self._clients:
+                self._clients.remove(sftp)
+        with contextlib.suppress(Exception):
+            sftp.close()
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for sftp in clients:
+            sftp.close()
+
+    def close_after(self, pool, name):
+        # Dừng nhận việc mới trên pool, đóng channel ở thread nền khi các worker đang dùng chúng
+        # đã chạy xong – không đóng channel dưới chân một request đang chạy, không chặn thread gọi
+        pool.shutdown(wait=False, cancel_futures=True)
+
+        def run():
+            pool.shutdown(wait=True)
+            self.close()
+
+        threading.Thread(target=run, name=name, daemon=True).start()
+
+
+class RemoteDirCache:
+    """Cache listing thư mục remote theo path (có TTL). Mỗi listing là một lần listdir_attr
+    (tên + thuộc tính trong một round trip); thư mục con được prefetch ở background."""
+
+    def __init__(self, open_sftp, ttl=30, prefetch_limit=32, workers=2):
+        self.ttl = ttl  # giây
+        self.prefetch_limit = prefetch_limit  # số thư mục con tối đa prefetch mỗi lần mở
+        self._cache = {}  # path → (monotonic, [RemoteEntry])
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._channels = SftpChannels(open_sftp)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sftp-prefetch")
+
+    def _sftp(self):
+        return self._channels.get()
+
+    def normalize(self, path):
+        return self._sftp().normalize(path)
+
+    def get(self, path):
+        # Chỉ đọc cache (None nếu chưa có / hết hạn)
+        with self._lock:
+            hit = self._cache.get(path)
+        if hit and time.monotonic() - hit[0] < self.ttl:
+            return hit[1]
+        return None
+
+    def listdir(self, path, refresh=False):
+        if not refresh:
+            cached = self.get(path)
+            if cached is not None:
+                return cached
+        entries = [
+            RemoteEntry(a.filename, stat.S_ISDIR(a.st_mode or 0), a.st_size or 0, a.st_mtime or 0)
+            for a in self._sftp().listdir_attr(path)
+        ]
+        entries.sort(key=lambda e: (not e.is_dir, e.name.lower()))
+        with self._lock:
+            self._cache[path] = (time.monotonic(), entries)
+        return entries
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+                return
+            prefix = path.rstrip("/") + "/"
+            for key in [k for k in self._cache if k == path or k.startswith(prefix)]:
+                del self._cache[key]
+
+    def prefetch(self, path, entries):
+        dirs = [posixpath.join(path, e.name) for e in entries if e.is_dir][:self.prefetch_limit]
+        for d in dirs:
+            with self._lock:
+                if d in self._pending or d in self._cache:
+                    continue
+                self._pending.add(d)
+            self._pool.submit(self._prefetch_one, d)
+
+    def _prefetch_one(self, path):
+        try:
+            self.listdir(path)
+        except (OSError, EOFError, CancelledError, paramiko.SSHException):
+            pass  # không có quyền / mất kết nối / đã huỷ: để lần mở thật báo lỗi
+        finally:
+            with self._lock:
+                self._pending.discard(path)
+
+    def close(self):
+        # Prefetch đang chạy dở (listdir) được làm nốt rồi mới đóng channel; không chặn GUI
+        self._channels.close_after(self._pool, "sftp-dircache-close")
+
+
+# ==========================
+# SFTP TRANSFERS (upload / download)
+# ==========================
+TRANSFER_CHUNK = 256 * 1024  # byte mỗi lần đọc / ghi; paramiko tự chia thành request 32 KB
+TRANSFER_WINDOW = 8 * 1024 * 1024  # download: byte có request đọc đang bay cùng lúc; cũng là cỡ checkpoint
+TRANSFER_RETRY_DELAYS = (2, 5, 10, 20, 30)  # giây chờ trước mỗi lần kết nối lại khi đường truyền rớt
+TRANSFER_STALL_TIMEOUT = 30  # giây không nhận được gì trên channel → coi như mất kết nối
+TRANSFER_WORKERS = 4  # số file chạy cùng lúc (mỗi worker một SFTP channel trên cùng Transport)
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "–"
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+class Transfer:
+    """Một lượt upload / download (một file hoặc cả thư mục): tiến độ, tốc độ, ETA, huỷ.
+    Worker cộng số byte, GUI / CLI đọc định kỳ – không có callback cho từng chunk."""
+
+    RATE_WINDOW = 5.0  # tốc độ hiện tại tính trên chừng này giây gần nhất
+
+    def __init__(self, direction, source, dest, is_dir=False):
+        self.direction = direction  # "upload" | "download"
+        self.source = source
+        self.dest = dest
+        self.is_dir = is_dir
+        self.token = CancelToken()
+        self.note = None  # trạng thái tạm (vd. đang chờ kết nối lại)
+        self.state = "pending"  # pending → running → done | failed | cancelled
+        self.total = 0
+        self.done = 0
+        self.resumed = 0  # byte đã có sẵn ở đích (resume) – tính vào tiến độ, không tính vào tốc độ
+        self.files_total = 0
+        self.files_done = 0
+        self.errors = []  # [(path, lỗi)]
+        self.started = None
+        self.finished = None
+        self._samples = collections.deque()  # (monotonic, done) – lấy mẫu tối đa 2 lần/giây
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return os.path.basename(self.source.rstrip("/")) or self.source
+
+    @property
+    def active(self):
+        return self.state in ("pending", "running")
+
+    def start(self, total, files):
+        with self._lock:
+            self.total, self.files_total = total, files
+            self.started = time.monotonic()
+            self._samples.append((self.started, 0))
+            self.state = "running"
+
+    def add(self, n):
+        now = time.monotonic()
+        with self._lock:
+            self.done += n
+            if now - self._samples[-1][0] >= 0.5:
+                self._samples.append((now, self.done))
+                while now - self._samples[0][0] > self.RATE_WINDOW:
+                    self._samples.popleft()
+
+    def skip(self, n):
+        with self._lock:
+            self.done += n
+            self.resumed += n
+            self._shift(n)
+
+    def rewind(self, sent, skipped):
+        # Lần thử hỏng giữa chừng: bỏ phần chưa được xác nhận, lần sau resume tính lại
+        with self._lock:
+            self.done -= sent + skipped
+            self.resumed -= skipped
+            self._shift(-skipped)
+
+    def _shift(self, n):
+        # Dời các mẫu theo byte không truyền qua mạng để rate() chỉ phản ánh byte thật sự truyền
+        self._samples = collections.deque((t, d + n) for t, d in self._samples)
+
+    def file_done(self, path, error=None):
+        with self._lock:
+            self.files_done += 1
+            if error is not None:
+                self.errors.append((path, error))
+
+    def finish(self, state):
+        with self._lock:
+            self.state = state
+            self.finished = time.monotonic()
+
+    def rate(self):
+        # byte/giây: trung bình cả lượt khi đã xong, còn đang chạy thì theo RATE_WINDOW
+        with self._lock:
+            if self.started is None:
+                return 0.0
+            if self.finished is not None:
+                return (self.done - self.resumed) / max(self.finished - self.started, 1e-6)
+            t0, d0 = self._samples[0]
+            now, done = time.monotonic(), self.done
+        return (done - d0) / (now - t0) if now - t0 > 0.2 else 0.0
+
+    def eta(self):
+        rate = self.rate()
+        return (self.total - self.done) / rate if rate > 0 and self.state == "running" else None
+
+    def summary(self):
+        arrow = "⬆" if self.direction == "upload" else "⬇"
+        files = f" ({self.files_done}/{self.files_total} file)" if self.files_total > 1 else ""
+        size = f"{human_size(self.done)} / {human_size(self.total)}"
+        if self.state == "pending":
+            return f"{arrow} {self.name}: ⏳ đang chuẩn bị..."
+        resumed = f"  ↻ {human_size(self.resumed)} có sẵn" if self.resumed else ""
+        if self.state == "running":
+            if self.note:
+                return f"{arrow} {self.name}{files}: {size}  {self.note}"
+            pct = self.done * 100 // self.total if self.total else 0
+            return (f"{arrow} {self.name}{files}: {pct}%  {size}  {human_size(self.rate())}/s  "
+                    f"ETA {format_eta(self.eta())}{resumed}")
+        took = format_eta(self.finished - self.started) if self.started else "–"
+        if self.state == "done":
+            return f"{arrow} {self.name}{files}: ✅ {size} trong {took} ({human_size(self.rate())}/s){resumed}"
+        if self.state == "cancelled":
+            return f"{arrow} {self.name}{files}: ⏹ đã huỷ ở {size}"
+        return f"{arrow} {self.name}{files}: ❌ {len(self.errors)} lỗi – {self.errors[0][1] if self.errors else ''}"
+
+
+class TransferEngine:
+    """Upload / download qua SFTP. File lớn: đọc theo cửa sổ readv (nhiều request đọc bay cùng lúc),
+    ghi pipelined (không chờ ack từng request). Thư mục: chia thành từng file cho worker pool,
+    nhiều file chạy song song trên cùng Transport. File được ghi vào <tên>.part rồi mới đổi tên.
+
+    Có endpoint ("user@host:port") thì mỗi cửa sổ TRANSFER_WINDOW là một checkpoint: sha256 của chunk
+    và offset đã xác nhận được ghi vào DB. Đường truyền rớt → kết nối lại và đi tiếp từ checkpoint;
+    chạy lại cùng transfer sau này (kể cả sau khi tắt app) cũng resume. Trước khi resume, phần đã có
+    được kiểm hash: .part local đọc lại tại chỗ, .part remote hash trên server qua exec (sha256sum)."""
+
+    def __init__(self, open_sftp, endpoint=None, run_command=None, repo=None,
+                 workers=TRANSFER_WORKERS, chunk=TRANSFER_CHUNK):
+        self.chunk = chunk
+        self.endpoint = endpoint
+        self.repo = repo or (get_repo() if endpoint else None)  # None → không ghi tiến độ, không resume
+        self._run_command = run_command  # callable(cmd) → (exit code, stdout bytes); None → không hash remote
+        self._open_sftp = open_sftp
+        self._channels = SftpChannels(open_sftp)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="sftp-transfer")
+        self._verified = {}  # (direction, dest) → số chunk đã ghi / kiểm trong phiên này, không cần kiểm lại
+        if self.repo is not None:
+            self.repo.prune_transfers()
+
+    def download(self, remote, is_dir, local_dir, on_done=None):
+        dest = os.path.join(local_dir, posixpath.basename(remote.rstrip("/")))
+        return self._start(Transfer("download", remote, dest, is_dir), on_done)
+
+    def upload(self, local, remote_dir, on_done=None):
+        dest = posixpath.join(remote_dir, os.path.basename(local.rstrip(os.sep)))
+        return self._start(Transfer("upload", local, dest, os.path.isdir(local)), on_done)
+
+    def retry(self, transfer, on_done=None):
+        # Chạy lại transfer đã hỏng / huỷ; file đã có checkpoint sẽ resume
+        return self._start(Transfer(transfer.direction, transfer.source, transfer.dest, transfer.is_dir), on_done)
+
+    def _start(self, transfer, on_done):
+        threading.Thread(target=self._run, args=(transfer, on_done), name="sftp-transfer", daemon=True).start()
+        return transfer
+
+    def _run(self, transfer, on_done):
+        token = transfer.token
+        try:
+            # Liệt kê / tạo thư mục trên channel riêng của lượt này, đóng ngay khi đã chia việc xong
+            with contextlib.closing(self._open_sftp()) as sftp:
+                files = self._plan(sftp, transfer, transfer.is_dir)
+            transfer.start(sum(size for _, _, size in files), len(files))
+            futures = {self._pool.submit(self._copy_file, transfer, src, dst): src for src, dst, size in files}
+            for f in as_completed(futures):
+                try:
+                    f.result()
+                    transfer.file_done(futures[f])
+                except CancelledError:
+                    transfer.file_done(futures[f])
+                except Exception as e:
+                    transfer.file_done(futures[f], str(e) or type(e).__name__)
+            if token.cancelled:
+                transfer.finish("cancelled")
+            else:
+                transfer.finish("failed" if transfer.errors else "done")
+        except CancelledError:
+            transfer.finish("cancelled")
+        except Exception as e:
+            if token.cancelled:
+                # Huỷ lúc đang chia việc (engine đã đóng, channel bị đóng) – không phải lỗi
+                transfer.finish("cancelled")
+            else:
+                transfer.errors.append((transfer.source, str(e) or type(e).__name__))
+                transfer.finish("failed")
+        if on_done:
+            on_done(transfer)
+
+    def _plan(self, sftp, transfer, is_dir):
+        # → [(nguồn, đích, size)] cho từng file thường; thư mục đích được tạo sẵn
+        if transfer.direction == "download":
+            dirs, files = self._walk_remote(sftp, transfer.source, transfer.dest, is_dir, transfer.token)
+            for d in dirs:
+                os.makedirs(d, exist_ok=True)
+        else:
+            dirs, files = self._walk_local(transfer.source, transfer.dest, is_dir)
+            for d in dirs:
+                transfer.token.check()
+                self._mkdir_remote(sftp, d)
+        return files
+
+    @staticmethod
+    def _walk_remote(sftp, remote, local, is_dir, token):
+        # → ([thư mục local cần tạo], [(remote, local, size)])
+        if not is_dir:
+            return [], [(remote, local, sftp.stat(remote).st_size or 0)]
+        dirs, files, stack = [], [], [(remote, local)]
+        while stack:
+            token.check()
+            rdir, ldir = stack.pop()
+            dirs.append(ldir)
+            for a in sftp.listdir_attr(rdir):
+                mode = a.st_mode or 0
+                if stat.S_ISDIR(mode):
+                    stack.append((posixpath.join(rdir, a.filename), os.path.join(ldir, a.filename)))
+                elif stat.S_ISREG(mode):
+                    files.append((posixpath.join(rdir, a.filename), os.path.join(ldir, a.filename), a.st_size or 0))
+        return dirs, files
+
+    @staticmethod
+    def _walk_local(local, remote, is_dir):
+        # → ([thư mục remote cần tạo], [(local, remote, size)]); symlink không được đi theo
+        if not is_dir:
+            return [], [(local, remote, os.path.getsize(local))]
+        dirs, files = [], []
+        for root, subdirs, names in os.walk(local):
+            rel = os.path.relpath(root, local)
+            rroot = remote if rel == "." else posixpath.join(remote, *rel.split(os.sep))
+            dirs.append(rroot)
+            for n in names:
+                path = os.path.join(root, n)
+                if os.path.isfile(path) and not os.path.islink(path):
+                    files.append((path, posixpath.join(rroot, n), os.path.getsize(path)))
+        return dirs, files
+
+    @staticmethod
+    def _mkdir_remote(sftp, path):
+        try:
+            sftp.mkdir(path)
+        except IOError:
+            if not stat.S_ISDIR(sftp.stat(path).st_mode or 0):
+                raise
+
+    # ---------- một file: thử lại khi mất kết nối ----------
+    def _sftp(self):
+        sftp = self._channels.get()
+        sftp.get_channel().settimeout(TRANSFER_STALL_TIMEOUT)  # đường truyền treo → timeout thay vì chờ mãi
+        return sftp
+
+    def _copy_file(self, transfer, src, dst):
+        try:
+            self._copy_with_retry(transfer, src, dst)
+        except CancelledError:
+            self._discard(transfer, dst)
+            raise
+        except Exception:
+            if self.repo is None:
+                self._discard(transfer, dst)  # không có checkpoint thì .part không dùng lại được
+            raise
+
+    def _copy_with_retry(self, transfer, src, dst):
+        once = self._download_once if transfer.direction == "download" else self._upload_once
+        token = transfer.token
+        for attempt, delay in enumerate((*TRANSFER_RETRY_DELAYS, None)):
+            token.check()
+            sftp = None
+            moved = [0, 0]  # [byte truyền trong lần thử này, byte bỏ qua nhờ resume]
+            try:
+                sftp = self._sftp()
+                return once(transfer, sftp, src, dst, moved)
+            except CancelledError:
+                raise
+            except Exception as e:
+                if token.cancelled:
+                    raise CancelledError() from e  # lỗi do huỷ (channel bị đóng) không phải lỗi thật
+                if delay is None or self.repo is None or not self._link_error(e, sftp):
+                    raise
+                transfer.rewind(*moved)
+                self._channels.drop()
+                if sftp is not None:
+                    # Transport có thể vẫn tưởng mình sống (timeout) → đóng để pool kết nối lại
+                    with contextlib.suppress(Exception):
+                        sftp.get_channel().get_transport().close()
+                transfer.note = (f"🔌 {str(e) or type(e).__name__} – kết nối lại sau {delay}s "
+                                 f"({attempt + 1}/{len(TRANSFER_RETRY_DELAYS)})")
+                if token.wait(delay):
+                    raise CancelledError()
+                transfer.note = None
+
+    @staticmethod
+    def _link_error(e, sftp):
+        # Lỗi đường truyền (timeout, mất kết nối) → thử lại; lỗi SFTP status (quyền, hết chỗ) / đĩa local → không
+        if isinstance(e, (EOFError, TimeoutError)):
+            return True
+        if sftp is None:
+            # Đang kết nối lại: chỉ lỗi mạng mới thử tiếp (sai password / host key đổi thì thôi)
+            return isinstance(e, OSError)
+        if isinstance(e, paramiko.SSHException):
+            return True
+        return isinstance(e, OSError) and (sftp.sock.closed or not sftp.get_channel().get_transport().is_active())
+
+    def _discard(self, transfer, dst):
+        # Huỷ: bỏ .part và tiến độ đã ghi
+        part = dst + ".part"
+        if transfer.direction == "download":
+            with contextlib.suppress(OSError):
+                os.remove(part)
+        else:
+            with contextlib.suppress(Exception):
+                self._channels.get().remove(part)
+        self._verified.pop((transfer.direction, dst), None)
+        if self.repo is not None:
+            self.repo.forget_transfer(transfer.direction, self.endpoint, dst)
+
+    # ---------- checkpoint / resume ----------
+    def _resume(self, direction, source, dest, size, mtime, verify):
+        # → (file_id, offset đi tiếp). verify(hashes, trusted) → số chunk đầu còn đúng;
+        # nguồn đổi (size / mtime) thì bắt đầu lại từ đầu
+        if self.repo is None:
+            return None, 0
+        state = self.repo.transfer_state(direction, self.endpoint, dest)
+        if state is not None:
+            file_id, old_size, old_mtime, chunk, confirmed, hashes = state
+            if (old_size, old_mtime, chunk) == (size, mtime, TRANSFER_WINDOW):
+                trusted = min(self._verified.get((direction, dest), 0), len(hashes))
+                good = verify(hashes, trusted) if hashes else 0
+                if good < len(hashes):
+                    print(f"↻ {dest}: {len(hashes) - good} chunk không khớp hash, truyền lại")
+                offset = min(good * TRANSFER_WINDOW, size)
+                self.repo.rewind_transfer(file_id, good, offset)
+                self._verified[(direction, dest)] = good
+                return file_id, offset
+        self._verified[(direction, dest)] = 0
+        return self.repo.start_transfer(direction, self.endpoint, source, dest, size, mtime, TRANSFER_WINDOW), 0
+
+    def _checkpoint(self, file_id, direction, dest, idx, digest, end):
+        if file_id is not None:
+            self.repo.confirm_chunk(file_id, idx, digest, end)
+            self._verified[(direction, dest)] = idx + 1
+
+    def _finish(self, file_id, direction, dest):
+        self._verified.pop((direction, dest), None)
+        if file_id is not None:
+            self.repo.finish_transfer(file_id)
+
+    @staticmethod
+    def _verify_local(path, hashes, trusted, token):
+        # Đọc lại .part local, so sha256 từng chunk (chunk đã xác nhận trong phiên này chỉ cần đủ độ dài)
+        good = 0
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size < trusted * TRANSFER_WINDOW:
+                    trusted = 0
+                f.seek(trusted * TRANSFER_WINDOW)
+                good = trusted
+                for h in hashes[trusted:]:
+                    token.check()
+                    if hashlib.sha256(f.read(TRANSFER_WINDOW)).hexdigest() != h:
+                        break
+                    good += 1
+        except OSError:
+            pass
+        return good
+
+    def _verify_remote(self, sftp, path, hashes, trusted, size):
+        # .part remote: chunk phải nằm trọn trong file; có shell thì so sha256 tính trên server,
+        # không có thì tin offset đã xác nhận (server đã ack mọi write trước checkpoint)
+        try:
+            have = sftp.stat(path).st_size or 0
+        except IOError:
+            return 0
+        good = sum(1 for i in range(len(hashes)) if min((i + 1) * TRANSFER_WINDOW, size) <= have)
+        if good <= trusted:
+            return good
+        remote = self._remote_hashes(path, trusted, good)
+        if remote is None:
+            return good
+        for i, h in enumerate(remote, trusted):
+            if h != hashes[i]:
+                return i
+        return good
+
+    def _remote_hashes(self, path, first, end):
+        # sha256 của chunk [first, end) của file remote, một lệnh exec; không có shell / sha256sum → None
+        if self._run_command is None:
+            return None
+        f = shlex.quote(path)
+        script = (f"[ -f {f} ] || exit 2; command -v sha256sum >/dev/null && h=sha256sum || h='shasum -a 256'; "
+                  f"i={first}; while [ $i -lt {end} ]; do dd if={f} bs={TRANSFER_WINDOW} skip=$i count=1 "
+                  f"2>/dev/null | $h || exit 1; i=$((i + 1)); done")
+        try:
+            code, out = self._run_command("sh -c " + shlex.quote(script))
+        except Exception as e:
+            print(f"⚠️ không hash được {path} trên server: {e}")
+            return None
+        hashes = [line.split()[0] for line in out.decode("ascii", "replace").splitlines() if line.strip()]
+        if code != 0 or len(hashes) != end - first or not all(re.fullmatch(r"[0-9a-f]{64}", h) for h in hashes):
+            return None
+        return hashes
+
+    # ---------- download / upload một lần thử ----------
+    def _download_once(self, transfer, sftp, remote, local, moved):
+        token = transfer.token
+        part = local + ".part"
+        st = sftp.stat(remote)
+        size, mtime = st.st_size or 0, int(st.st_mtime or 0)
+        file_id, offset = self._resume(
+            "download", remote, local, size, mtime,
+            lambda hashes, trusted: self._verify_local(part, hashes, trusted, token))
+        transfer.skip(offset)
+        moved[1] = offset
+        # readv theo cửa sổ thay vì prefetch() cả file: bộ nhớ có giới hạn, và khi huỷ
+        # không còn thread nền tiếp tục gửi request đọc cho phần còn lại của file
+        with sftp.open(remote, "rb") as rf, open(part, "r+b" if offset else "wb") as lf:
+            lf.truncate(offset)
+            lf.seek(offset)
+            for idx in range(offset // TRANSFER_WINDOW, -(-size // TRANSFER_WINDOW)):
+                token.check()
+                start, end = idx * TRANSFER_WINDOW, min((idx + 1) * TRANSFER_WINDOW, size)
+                digest = hashlib.sha256()
+                for data in rf.readv([(o, min(self.chunk, end - o)) for o in range(start, end, self.chunk)]):
+                    lf.write(data)
+                    digest.update(data)
+                    transfer.add(len(data))
+                    moved[0] += len(data)
+                if file_id is not None:
+                    # Không cần fsync: lúc resume .part được đọc lại và so hash
+                    lf.flush()
+                    self._checkpoint(file_id, "download", local, idx, digest.hexdigest(), end)
+        os.replace(part, local)
+        self._finish(file_id, "download", local)
+
+    def _upload_once(self, transfer, sftp, local, remote, moved):
+        token = transfer.token
+        part = remote + ".part"
+        st = os.stat(local)
+        size, mtime = st.st_size, int(st.st_mtime)
+        file_id, offset = self._resume(
+            "upload", local, remote, size, mtime,
+            lambda hashes, trusted: self._verify_remote(sftp, part, hashes, trusted, size))
+        transfer.skip(offset)
+        moved[1] = offset
+        with open(local, "rb") as lf, sftp.open(part, "r+b" if offset else "wb") as rf:
+            rf.set_pipelined(True)
+            lf.seek(offset)
+            rf.seek(offset)
+            last = -(-size // TRANSFER_WINDOW) - 1
+            for idx in range(offset // TRANSFER_WINDOW, last + 1):
+                token.check()
+                end = min((idx + 1) * TRANSFER_WINDOW, size)
+                digest = hashlib.sha256()
+                while lf.tell() < end:
+                    data = lf.read(min(self.chunk, end - lf.tell()))
+                    if not data:
+                        break
+                    digest.update(data)
+                    if lf.tell() >= end and (file_id is not None or idx == last):
+                        self._write_confirmed(rf, data)
+                    else:
+                        rf.write(data)
+                    transfer.add(len(data))
+                    moved[0] += len(data)
+                self._checkpoint(file_id, "upload", remote, idx, digest.hexdigest(), end)
+            if offset and rf.stat().st_size > size:
+                rf.truncate(size)
+        self._rename_remote(sftp, part, remote)
+        self._finish(file_id, "upload", remote)
+
+    @staticmethod
+    def _write_confirmed(rf, data):
+        # Write cuối của checkpoint: tắt pipelining cho byte cuối → paramiko đọc ack của mọi write
+        # đang chờ theo thứ tự (lỗi write được raise ở đây), tốn đúng một round trip.
+        # Không dùng stat(): request đồng bộ khác trên cùng SFTPClient nuốt mất ack của write
+        # pipelined, lần write sau sẽ chờ mãi ack đã bị đọc.
+        rf.write(data[:-1])
+        rf.set_pipelined(False)
+        rf.write(data[-1:])
+        rf.flush()
+        rf.set_pipelined(True)
+
+    @staticmethod
+    def _rename_remote(sftp, src, dst):
+        # posix-rename@openssh.com ghi đè được file đích; server không hỗ trợ thì xoá rồi đổi tên
+        try:
+            sftp.posix_rename(src, dst)
+        except IOError:
+            with contextlib.suppress(IOError):
+                sftp.remove(dst)
+            sftp.rename(src, dst)
+
+    def close(self):
+        # Worker đang chạy dừng ở lần kiểm token kế tiếp (GUI đã huỷ transfer) – đóng channel sau đó
+        # để lần huỷ không thành lỗi "Socket is closed" giữa chừng
+        self._channels.close_after(self._pool, "sftp-transfer-close")
@@ -1,140 +1,448 @@
 #!/usr/bin/env python3
-import sys, os, sqlite3, subprocess, datetime, shutil
-import threading
 import time
 
+_T0 = time.perf_counter()  # mốc đo thời gian khởi động (FirstPaintProbe)
+import os
+import socket
+import sys
+
+
+# ==========================
+# SINGLE INSTANCE – phía client (chạy TRƯỚC khi import PyQt6 để lần mở sau chỉ tốn vài chục ms)
+# ==========================
+def ipc_socket_path():
+    # Socket phải nằm trong thư mục chỉ user ghi được (ở /tmp user khác có thể tạo trước path này để
+    # nhận lệnh connect/sftp): runtime dir, không có thì thư mục chứa DB (cùng cách tính với
+    # ssh_core.DB_FILE, không import ssh_core để lần mở sau vẫn nhanh)
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if not base:
+        db = os.environ.get("SSH_MANAGER_DB") or os.path.join(
+            os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"), "ssh_manager", "connections.db")
+        base = os.path.dirname(os.path.abspath(db))
+    return os.path.join(base, f"ssh_manager-{os.getuid()}.sock")
+
+
+def instance_alive(path):
+    s = socket.socket(socket.AF_UNIX)
+    s.settimeout(1.0)
+    try:
+        s.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+
+def send_to_instance(args, timeout=3.0):
+    # Gửi argv cho instance đang chạy → phản hồi ("ok..." / "error: ..."), None nếu chưa có instance.
+    # Giao thức: một dòng, các tham số ngăn bởi \0 (argv không thể chứa \0).
+    s = socket.socket(socket.AF_UNIX)
+    s.settimeout(timeout)
+    try:
+        s.connect(ipc_socket_path())
+    except OSError:
+        s.close()
+        return None
+    with s:
+        try:
+            s.sendall(("\0".join(a.replace("\n", " ") for a in args) + "\n").encode())
+            reply = b""
+            while not reply.endswith(b"\n"):
+                chunk = s.recv(4096)
+                if not chunk:
+                    break
+                reply += chunk
+        except OSError as e:
+            return f"error: {e}"
+    return reply.decode(errors="replace").strip()
+
+
+# Lệnh dòng lệnh chạy không cần Qt lẫn instance GUI (xem ssh_cli.py)
+CLI_COMMANDS = ("ls", "groups", "search", "exec", "keyscan", "connect", "-h", "--help")
+
+
+def is_cli_command(args):
+    # connect chỉ chạy ssh tại chỗ khi có terminal; gọi từ launcher / desktop thì vẫn gửi cho GUI
+    if not args or args[0] not in CLI_COMMANDS:
+        return False
+    return args[0] != "connect" or sys.stdin.isatty()
+
+
+if __name__ == "__main__" and "--new-instance" not in sys.argv:
+    if is_cli_command(sys.argv[1:]):
+        import ssh_cli
+        sys.exit(ssh_cli.main(sys.argv[1:]))
+    _reply = send_to_instance(sys.argv[1:])
+    if _reply is not None:
+        print(_reply)
+        sys.exit(0 if _reply.startswith("ok") else 1)
+
+import collections
+import datetime
+import shutil
+import sqlite3
+import bisect
+import posixpath
+import queue
+
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-    QTableWidget, QTableWidgetItem, QPushButton,
+    QTableView, QHeaderView, QAbstractItemView, QPushButton,
     QDialog, QFormLayout, QLineEdit, QSpinBox, QComboBox,
-    QMessageBox, QLabel, QListWidget, QSplitter, QInputDialog
+    QMessageBox, QLabel, QListWidget, QSplitter, QInputDialog, QProgressDialog, QTreeView,
+    QProgressBar, QMenu, QPlainTextEdit, QCheckBox, QAbstractScrollArea, QTabWidget, QFileDialog
+)
+from PyQt6.QtCore import (
+    Qt, QAbstractTableModel, QAbstractItemModel, QModelIndex, QObject, QProcess, QTimer, QEvent, pyqtSignal
+)
+from PyQt6.QtGui import QIcon, QPainter, QColor, QFontDatabase
+from PyQt6.QtNetwork import QLocalServer
+
+from ssh_core import (
+    HAVE_PARAMIKO, SSH_CONFIG_FILE, REMMINA_DIR, EXPORT_FORMATS,
+    resource_path, now_str, human_size, status_text,
+    get_repo, init_db, fetch_all, insert_conn, update_conn, delete_conn,
+    iter_ssh_config, iter_remmina, iter_servers_json, export_connections, backup_db,
+    Launcher, CancelToken, get_transport_pool, get_ssh_executor, evict_idle_transports, shutdown_ssh,
+    FanoutExecutor, TerminalSession, get_terminal_hub, ReachabilityScanner, RemoteDirCache, RemoteEntry,
+    HostKeyScanner, get_known_hosts, TransferEngine,
 )
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QIcon
 
 
-# =====================================================
-# RESOURCE PATH – dùng được cho DEV, PyInstaller và .deb
-# =====================================================
-def resource_path(relative):
-    if hasattr(sys, '_MEIPASS'):  # PyInstaller
-        base = sys._MEIPASS
-    else:
-        # Khi cài .deb → file thực nằm tại /usr/share/ssh_manager/
-        base = os.path.dirname(os.path.abspath(__file__))
-    return os.path.join(base, relative)
+# ==========================
+# TASK RUNNER (worker → GUI thread)
+# ==========================
+class TaskRunner(QObject):
+    """Chạy hàm trên executor và trả kết quả về thread của object này (GUI) qua signal.
+    Kết quả của task đã huỷ bị bỏ qua."""
 
+    _result = pyqtSignal(object, object, object, object)  # token, (on_done, on_error), value, error
 
-# DB location
-DB_FILE = resource_path("connections.db")
+    def __init__(self, executor, parent=None):
+        super().__init__(parent)
+        self.executor = executor
+        self._result.connect(self._deliver)
 
-# Optional paramiko support
-try:
-    import paramiko
+    def submit(self, fn, on_done, on_error=None, token=None):
+        # fn(token) chạy trên worker; on_done(value) / on_error(exc) chạy trên GUI thread
+        token = token or CancelToken()
 
-    HAVE_PARAMIKO = True
-except:
-    HAVE_PARAMIKO = False
+        def job():
+            if token.cancelled:
+                return
+            try:
+                value, error = fn(token), None
+            except Exception as e:
+                value, error = None, e
+            try:
+                self._result.emit(token, (on_done, on_error), value, error)
+            except RuntimeError:
+                pass  # object nhận đã bị huỷ (dialog đóng)
+
+        self.executor.submit(job)
+        return token
+
+    def _deliver(self, token, callbacks, value, error):
+        if token.cancelled:
+            return
+        on_done, on_error = callbacks
+        if error is None:
+            on_done(value)
+        elif on_error:
+            on_error(error)
 
 
 # ==========================
-# DATABASE HELPERS
+# GVFS RESET (bất đồng bộ, QProcess)
 # ==========================
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-
-    # Bảng lưu danh sách kết nối
-    cur.execute("""
-                CREATE TABLE IF NOT EXISTS connections
-                (
-                    id        INTEGER PRIMARY KEY AUTOINCREMENT,
-                    grp       TEXT,
-                    name      TEXT,
-                    host      TEXT,
-                    port      INTEGER,
-                    user      TEXT,
-                    password  TEXT,
-                    protocol  TEXT,
-                    last_used TEXT
-                )
-                """)
-
-    # ✅ Bảng mới lưu danh sách group
-    cur.execute("""
-                CREATE TABLE IF NOT EXISTS groups
-                (
-                    id   INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT UNIQUE
-                )
-                """)
-
-    # ✅ Bảng mới lưu config table layout
-    cur.execute("""
-                CREATE TABLE IF NOT EXISTS table_layout
-                (
-                    col_name TEXT PRIMARY KEY,
-                    width    INTEGER
-                )
-                """)
-
-    conn.commit()
-    conn.close()
-
-
-def fetch_all():
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM connections ORDER BY grp, name")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
-
-
-def insert_conn(data):
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    cur.execute("""
-                INSERT INTO connections (grp, name, host, port, user, password, protocol, last_used)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    data['grp'], data['name'], data['host'], data['port'],
-                    data['user'], data['password'], data['protocol'],
-                    data.get('last_used', '')
-                ))
-    conn.commit()
-    conn.close()
-
-
-def update_conn(id_, data):
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    cur.execute("""
-                UPDATE connections
-                SET grp=?,
-                    name=?,
-                    host=?,
-                    port=?,
-                    user=?,
-                    password=?,
-                    protocol=?,
-                    last_used=?
-                WHERE id = ?
-                """, (
-                    data['grp'], data['name'], data['host'], data['port'],
-                    data['user'], data['password'], data['protocol'],
-                    data.get('last_used', ''), id_
-                ))
-    conn.commit()
-    conn.close()
-
-
-def delete_conn(id_):
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM connections WHERE id=?", (id_,))
-    conn.commit()
-    conn.close()
+class GvfsResetPipeline(QObject):
+    """Chạy lần lượt các bước reset GVFS bằng QProcess, chờ exit status thật
+    (không time.sleep trên GUI thread) và báo tiến độ qua signal."""
+
+    progress = pyqtSignal(int, int, str)  # bước hiện tại, tổng số bước, mô tả
+    finished = pyqtSignal(bool, str)  # thành công?, tóm tắt
+
+    POLL_MS = 200
+    WAIT_TIMEOUT_MS = 5000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.steps = self.build_steps()
+        self.errors = []
+        self._i = -1
+        self._proc = None
+        self._waited = 0
+
+    @staticmethod
+    def build_steps():
+        # ("run", mô tả, argv, exit code chấp nhận) | ("wait", mô tả, tên process)
+        steps = [
+            ("run", "Dừng gvfsd-sftp", ["pkill", "-x", "gvfsd-sftp"], (0, 1)),
+            ("wait", "Chờ gvfsd-sftp thoát", "gvfsd-sftp"),
+            ("run", "Xoá cache GVFS", ["rm", "-rf", os.path.expanduser("~/.cache/gvfs")], (0,)),
+        ]
+        if shutil.which("systemctl"):
+            steps.append(("run", "Khởi động lại gvfs-daemon",
+                          ["systemctl", "--user", "restart", "gvfs-daemon.service"], (0,)))
+        else:
+            # Không có systemd: gvfsd được D-Bus kích hoạt lại ở lần truy cập kế tiếp
+            steps.append(("run", "Dừng gvfsd", ["pkill", "-x", "gvfsd"], (0, 1)))
+            steps.append(("wait", "Chờ gvfsd thoát", "gvfsd"))
+        return steps
+
+    def start(self):
+        self._next()
+
+    def _next(self):
+        self._i += 1
+        if self._i >= len(self.steps):
+            ok = not self.errors
+            self.finished.emit(ok, "\n".join(self.errors) if self.errors else "OK")
+            return
+        step = self.steps[self._i]
+        self.progress.emit(self._i, len(self.steps), step[1])
+        if step[0] == "run":
+            self._start_proc(step[2][0], step[2][1:], self._on_finished)
+        else:
+            self._waited = 0
+            self._poll()
+
+    def _start_proc(self, program, args, on_finished):
+        self._proc = QProcess(self)
+        self._proc.finished.connect(on_finished)
+        self._proc.errorOccurred.connect(self._on_error)
+        self._proc.start(program, args)
+
+    def _drop_proc(self):
+        proc, self._proc = self._proc, None
+        if proc is not None:
+            proc.deleteLater()
+        return proc
+
+    def _on_finished(self, code, status):
+        step = self.steps[self._i]
+        proc = self._drop_proc()
+        if status != QProcess.ExitStatus.NormalExit or code not in step[3]:
+            err = bytes(proc.readAllStandardError()).decode(errors="replace").strip()
+            self.errors.append(f"{step[1]}: exit {code} {err}".strip())
+        self._next()
+
+    def _on_error(self, error):
+        if error == QProcess.ProcessError.FailedToStart:
+            proc = self._drop_proc()
+            self.errors.append(f"{self.steps[self._i][1]}: không chạy được {proc.program()}")
+            self._next()
+
+    # Bước "wait": pgrep định kỳ tới khi process biến mất (exit 1) hoặc hết thời gian
+    def _poll(self):
+        self._start_proc("pgrep", ["-x", self.steps[self._i][2]], self._on_poll)
+
+    def _on_poll(self, code, status):
+        self._drop_proc()
+        if code != 0:
+            self._next()
+            return
+        self._waited += self.POLL_MS
+        if self._waited >= self.WAIT_TIMEOUT_MS:
+            self.errors.append(f"{self.steps[self._i][1]}: quá {self.WAIT_TIMEOUT_MS // 1000}s")
+            self._next()
+            return
+        QTimer.singleShot(self.POLL_MS, self._poll)
+
+
+# ==========================
+# CONNECTION TABLE MODEL
+# ==========================
+TABLE_HEADERS = ["ID", "Group", "Name", "Host:Port", "User", "Protocol", "Status", "Last used"]
+STATUS_COL = TABLE_HEADERS.index("Status")
+LAYOUT_SAVE_DELAY_MS = 1500  # ghi bố cục bảng sau khi ngừng kéo cột / splitter chừng này
+
+
+class ConnectionTableModel(QAbstractTableModel):
+    """Model ảo cho bảng kết nối: đọc theo trang (keyset), chỉ dựng chuỗi khi view cần hiển thị,
+    và áp ChangeSet từ repository thay vì nạp lại toàn bộ."""
+
+    BATCH_SIZE = 256
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []  # tuple thô từ DB, đúng thứ tự cột của bảng connections
+        self._index = {}  # id → vị trí trong _rows
+        self._group = None  # None = All
+        self._exhausted = True
+        self._search = False  # True khi đang hiển thị kết quả tìm kiếm
+        self.status_lookup = None  # callable(host, port) → HostStatus | None
+
+    # --- Nạp dữ liệu ---
+    def set_group(self, grp):
+        self.beginResetModel()
+        self._group = grp
+        self._search = False
+        self._rows = []
+        self._index = {}
+        self._exhausted = False
+        self._append(self._read_page())
+        self.endResetModel()
+
+    def set_search_results(self, rows):
+        self.beginResetModel()
+        self._search = True
+        self._rows = []
+        self._index = {}
+        self._exhausted = True
+        self._append(rows)
+        self.endResetModel()
+
+    def clear(self):
+        self.beginResetModel()
+        self._rows = []
+        self._index = {}
+        self._exhausted = True
+        self.endResetModel()
+
+    def _sort_key(self, row):
+        if self._group is None:
+            return row[1] or "", row[2] or "", row[0]
+        return row[2] or "", row[0]
+
+    def _matches(self, row):
+        if self._search:
+            return False  # kết quả tìm kiếm cố định, dòng mới chỉ xuất hiện khi gõ lại
+        return self._group is None or row[1] == self._group
+
+    def _read_page(self):
+        after = self._sort_key(self._rows[-1]) if self._rows else None
+        page = get_repo().fetch_page(self._group, after, self.BATCH_SIZE)
+        if len(page) < self.BATCH_SIZE:
+            self._exhausted = True
+        return page
+
+    def _append(self, rows):
+        for row in rows:
+            self._index[row[0]] = len(self._rows)
+            self._rows.append(row)
+
+    def _reindex(self, start):
+        for pos in range(start, len(self._rows)):
+            self._index[self._rows[pos][0]] = pos
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        page = self._read_page()
+        if not page:
+            return
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+        self._append(page)
+        self.endInsertRows()
+
+    # --- Áp thay đổi ---
+    def apply_changes(self, changes):
+        self._remove_ids(changes.deleted)
+        for row in changes.updated:
+            pos = self._index.get(row[0])
+            if pos is not None:
+                old = self._rows[pos]
+                if self._search or (self._matches(row) and self._sort_key(old) == self._sort_key(row)):
+                    # Không đổi vị trí → chỉ báo các ô thực sự thay đổi
+                    self._rows[pos] = row
+                    cols = [c for c in range(len(TABLE_HEADERS)) if self._cell(old, c) != self._cell(row, c)]
+                    if cols:
+                        self.dataChanged.emit(self.index(pos, cols[0]), self.index(pos, cols[-1]))
+                    continue
+                self._remove_ids([row[0]])
+            self._insert_sorted(row)
+        for row in changes.inserted:
+            self._insert_sorted(row)
+
+    def _insert_sorted(self, row):
+        if not self._matches(row) or row[0] in self._index:
+            return
+        pos = bisect.bisect_right(self._rows, self._sort_key(row), key=self._sort_key)
+        if pos == len(self._rows) and not self._exhausted:
+            return  # nằm ngoài vùng đã nạp → trang sau sẽ tự lấy
+        self.beginInsertRows(QModelIndex(), pos, pos)
+        self._rows.insert(pos, row)
+        self.endInsertRows()
+        self._reindex(pos)
+
+    def _remove_ids(self, ids):
+        positions = sorted((self._index[i] for i in ids if i in self._index), reverse=True)
+        if not positions:
+            return
+        # Gom các vị trí liên tiếp thành một lần removeRows
+        ranges = []
+        for pos in positions:
+            if ranges and ranges[-1][0] == pos + 1:
+                ranges[-1][0] = pos
+            else:
+                ranges.append([pos, pos])
+        for first, last in ranges:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for row in self._rows[first:last + 1]:
+                del self._index[row[0]]
+            del self._rows[first:last + 1]
+            self.endRemoveRows()
+        self._reindex(ranges[-1][0])
+
+    # --- Truy cập dòng ---
+    def row_at(self, r):
+        return self._rows[r]
+
+    def conn_id(self, r):
+        return self._rows[r][0]
+
+    def row_of(self, id_):
+        return self._index.get(id_, -1)
+
+    # --- Qt API ---
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(TABLE_HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return TABLE_HEADERS[section]
+        return str(section + 1)
+
+    def status_changed(self):
+        # Kết quả probe mới: chỉ báo cột Status, view tự vẽ lại các ô đang hiển thị
+        if self._rows:
+            self.dataChanged.emit(self.index(0, STATUS_COL), self.index(len(self._rows) - 1, STATUS_COL))
+
+    def _cell(self, row, col):
+        id_, grp, name, host, port, user, pwd, proto, last = row
+        if col == 0:
+            return str(id_)
+        if col == 1:
+            return grp or ""
+        if col == 2:
+            return name
+        if col == 3:
+            return f"{host}:{port}"
+        if col == 4:
+            return user
+        if col == 5:
+            return proto
+        if col == STATUS_COL:
+            return status_text(self.status_lookup(host, port)) if self.status_lookup else ""
+        return last or ""
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        return self._cell(self._rows[index.row()], index.column())
 
 
 # ==========================
@@ -174,6 +482,8 @@ class EntryDialog(QDialog):
         self.protocol = QComboBox()
         self.protocol.addItems(["SSH", "SFTP"])
 
+        self.multiplex = QCheckBox("Dùng chung kết nối (ControlMaster)")
+
         layout.addRow("Group:", self.grp)
         layout.addRow("Name:", self.name)
         layout.addRow("Host:", self.host)
@@ -181,6 +491,7 @@ class EntryDialog(QDialog):
         layout.addRow("User:", self.user)
         layout.addRow("Password:", self.password)
         layout.addRow("Protocol:", self.protocol)
+        layout.addRow("Multiplex:", self.multiplex)
 
         btns = QHBoxLayout()
         btn_ok = QPushButton("OK")
@@ -199,6 +510,7 @@ class EntryDialog(QDialog):
             self.user.setText(entry['user'])
             self.password.setText(entry['password'])
             self.protocol.setCurrentText(entry['protocol'])
+            self.multiplex.setChecked(bool(entry.get('multiplex')))
 
     def get_data(self):
         return {
@@ -209,24 +521,13 @@ class EntryDialog(QDialog):
             "user": self.user.text().strip(),
             "password": self.password.text(),
             "protocol": self.protocol.currentText(),
-            "last_used": ""
+            "last_used": "",
+            "multiplex": int(self.multiplex.isChecked())
         }
 
     def load_groups(self):
-        conn = sqlite3.connect(DB_FILE)
-        cur = conn.cursor()
-
-        # ✅ Ưu tiên lấy từ bảng groups (nếu có)
-        try:
-            cur.execute("SELECT name FROM groups ORDER BY name")
-            groups = [r[0] for r in cur.fetchall()]
-        except Exception as e:
-            print(e)
-            # fallback: nếu chưa có bảng groups, lấy từ connections
-            cur.execute("SELECT DISTINCT grp FROM connections")
-            groups = [r[0] for r in cur.fetchall()]
-
-        conn.close()
+        # ✅ Ưu tiên lấy từ bảng groups (nếu có), fallback sang connections
+        groups = get_repo().list_groups()
 
         # loại None / '' → đổi thành (no group)
         fixed = []
@@ -240,13 +541,877 @@ class EntryDialog(QDialog):
         self.grp.addItems(sorted(fixed))
 
 
+# ==========================
+# SFTP BROWSER
+# ==========================
+class _RemoteNode:
+    __slots__ = ("path", "entry", "parent", "row", "children", "token")
+
+    def __init__(self, path, entry, parent, row):
+        self.path = path
+        self.entry = entry
+        self.parent = parent
+        self.row = row
+        self.children = None  # None = chưa nạp
+        self.token = None  # CancelToken khi đang nạp
+
+
+class RemoteTreeModel(QAbstractItemModel):
+    """Cây thư mục remote nạp lười: mỗi thư mục chỉ listdir khi được mở (canFetchMore/fetchMore).
+    listdir chạy trên worker (TaskRunner), kết quả được chèn vào cây khi về tới GUI thread."""
+
+    HEADERS = ["Name", "Size", "Modified"]
+    load_failed = pyqtSignal(str, str)  # path, lỗi
+    busy_changed = pyqtSignal(int)  # số thư mục đang nạp
+
+    def __init__(self, cache, root_path, runner, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.runner = runner
+        self.root = _RemoteNode(root_path, RemoteEntry(root_path, True, 0, 0), None, 0)
+        self._loading = set()
+
+    def _node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def _index_of(self, node):
+        return QModelIndex() if node is self.root else self.createIndex(node.row, 0, node)
+
+    def path_of(self, index):
+        return self._node(index).path
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self._node(parent)
+        if node.children is None or not 0 <= row < len(node.children):
+            return QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        p = index.internalPointer().parent
+        if p is None or p is self.root:
+            return QModelIndex()
+        return self.createIndex(p.row, 0, p)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self._node(parent).children or ())
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.HEADERS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self._node(parent)
+        if node.children is None:
+            return node.entry.is_dir
+        return bool(node.children)
+
+    def canFetchMore(self, parent):
+        node = self._node(parent)
+        return node.entry.is_dir and node.children is None and node.token is None
+
+    def fetchMore(self, parent):
+        node = self._node(parent)
+        if node.token is not None:
+            return
+        cached = self.cache.get(node.path)
+        if cached is not None:
+            self._set_children(node, cached)
+            return
+        self._load(node, refresh=False)
+
+    def _load(self, node, refresh):
+        def work(token):
+            token.check()
+            return self.cache.listdir(node.path, refresh=refresh)
+
+        node.token = self.runner.submit(
+            work,
+            lambda entries: self._on_loaded(node, entries),
+            lambda err: self._on_failed(node, err))
+        self._loading.add(node)
+        self.busy_changed.emit(len(self._loading))
+
+    def _done(self, node):
+        node.token = None
+        self._loading.discard(node)
+        self.busy_changed.emit(len(self._loading))
+
+    def _on_loaded(self, node, entries):
+        self._done(node)
+        self._set_children(node, entries)
+        self.cache.prefetch(node.path, entries)
+
+    def _on_failed(self, node, err):
+        self._done(node)
+        node.children = []
+        self.load_failed.emit(node.path, str(err) or type(err).__name__)
+
+    def cancel_loads(self):
+        # Huỷ các listdir đang chờ; thư mục trở lại trạng thái "chưa nạp" để mở lại sau
+        for node in list(self._loading):
+            node.token.cancel()
+            self._done(node)
+
+    def refresh(self, index):
+        # Bỏ cache của thư mục (và con) rồi đọc lại
+        node = self._node(index)
+        if not node.entry.is_dir:
+            node = node.parent or self.root
+        if node.token is not None:
+            return
+        self.cache.invalidate(node.path)
+        if node.children:
+            self.beginRemoveRows(self._index_of(node), 0, len(node.children) - 1)
+            node.children = []
+            self.endRemoveRows()
+        node.children = None
+        self._load(node, refresh=True)
+
+    def refresh_path(self, path):
+        # Đọc lại thư mục path nếu nó đang hiển thị trong cây (sau upload)
+        node = self.root
+        while node.path != path:
+            node = next((c for c in node.children or () if c.entry.is_dir and
+                         (path == c.path or path.startswith(c.path.rstrip("/") + "/"))), None)
+            if node is None:
+                return
+        if node.children is not None:
+            self.refresh(self._index_of(node))
+
+    def _set_children(self, node, entries):
+        children = [_RemoteNode(posixpath.join(node.path, e.name), e, node, i) for i, e in enumerate(entries)]
+        if not children:
+            node.children = []
+            return
+        self.beginInsertRows(self._index_of(node), 0, len(children) - 1)
+        node.children = children
+        self.endInsertRows()
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        e = index.internalPointer().entry
+        col = index.column()
+        if col == 0:
+            return ("📁 " if e.is_dir else "📄 ") + e.name
+        if col == 1:
+            return "" if e.is_dir else human_size(e.size)
+        return datetime.datetime.fromtimestamp(e.mtime).strftime("%Y-%m-%d %H:%M") if e.mtime else ""
+
+
+class SftpBrowserDialog(QDialog):
+    """Trình duyệt SFTP không chặn GUI: connect / xác thực / listdir đều chạy trên worker,
+    có spinner và nút Cancel. Upload / download chạy nền, danh sách transfer có tốc độ, ETA và huỷ."""
+
+    transfer_done = pyqtSignal(object)  # Transfer (phát từ thread transfer)
+
+    def __init__(self, host, port, user, password, parent=None):
+        super().__init__(parent)
+        self.conn_args = (host, port, user, password)
+        self.cache = None
+        self.model = None
+        self.engine = None
+        self.transfers = []
+        self.token = CancelToken()  # huỷ toàn bộ kết nối của dialog khi đóng
+        self.runner = TaskRunner(get_ssh_executor(), self)
+        self.setWindowTitle(f"SFTP – {user}@{host}:{port}")
+        self.resize(720, 520)
+
+        layout = QVBoxLayout(self)
+        self.lbl_path = QLabel(f"⏳ Đang kết nối {host}:{port}...")
+        layout.addWidget(self.lbl_path)
+
+        self.tree = QTreeView()
+        self.tree.setUniformRowHeights(True)  # 10k dòng vẫn cuộn mượt
+        self.tree.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.tree.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        layout.addWidget(self.tree)
+
+        actions = QHBoxLayout()
+        self.btn_upload = QPushButton("⬆ Upload file...")
+        self.btn_upload.clicked.connect(self.upload_files)
+        self.btn_upload_dir = QPushButton("⬆ Upload folder...")
+        self.btn_upload_dir.clicked.connect(self.upload_folder)
+        self.btn_download = QPushButton("⬇ Download...")
+        self.btn_download.clicked.connect(self.download_selected)
+        self.btn_cancel_transfer = QPushButton("Cancel transfer")
+        self.btn_cancel_transfer.clicked.connect(self.cancel_transfer)
+        for b in (self.btn_upload, self.btn_upload_dir, self.btn_download):
+            b.setEnabled(False)
+            actions.addWidget(b)
+        actions.addStretch()
+        actions.addWidget(self.btn_cancel_transfer)
+        layout.addLayout(actions)
+
+        self.transfer_list = QListWidget()
+        self.transfer_list.setMaximumHeight(110)
+        self.transfer_list.setVisible(False)
+        self.transfer_list.setToolTip("Double-click transfer lỗi / đã huỷ để chạy lại (transfer lỗi đi tiếp từ checkpoint)")
+        self.transfer_list.itemDoubleClicked.connect(self.retry_transfer)
+        layout.addWidget(self.transfer_list)
+        # Tiến độ đọc định kỳ từ Transfer – worker không phát signal cho từng chunk
+        self.transfer_timer = QTimer(self)
+        self.transfer_timer.setInterval(500)
+        self.transfer_timer.timeout.connect(self.update_transfers)
+        self.transfer_done.connect(self.on_transfer_done)
+
+        btns = QHBoxLayout()
+        self.spinner = QProgressBar()
+        self.spinner.setRange(0, 0)  # busy indicator
+        self.spinner.setMaximumWidth(120)
+        self.spinner.setTextVisible(False)
+        self.btn_cancel = QPushButton("Cancel")
+        self.btn_cancel.clicked.connect(self.on_cancel)
+        self.btn_refresh = QPushButton("Refresh")
+        self.btn_refresh.setEnabled(False)
+        self.btn_refresh.clicked.connect(lambda: self.model.refresh(self.tree.currentIndex()))
+        btn_close = QPushButton("Close")
+        btn_close.clicked.connect(self.accept)
+        btns.addWidget(self.btn_refresh)
+        btns.addWidget(self.spinner)
+        btns.addWidget(self.btn_cancel)
+        btns.addStretch()
+        btns.addWidget(btn_close)
+        layout.addLayout(btns)
+
+        self.finished.connect(self.on_closed)
+        self.connect_host()
+
+    def connect_host(self):
+        host, port, user, pwd = self.conn_args
+        token = self.token
+
+        def work(tok):
+            # Transport được giữ trong pool → mỗi channel SFTP mới chỉ tốn vài ms
+            pool = get_transport_pool()
+            cache = RemoteDirCache(lambda: pool.open_sftp(host, port, user, pwd, token))
+            try:
+                return cache, cache.normalize(".")
+            except Exception:
+                cache.close()
+                raise
+
+        self.set_busy(True)
+        self.runner.submit(work, self.on_connected, self.on_connect_failed, token)
+
+    def on_connected(self, result):
+        self.cache, root = result
+        self.lbl_path.setText(root)
+        self.model = RemoteTreeModel(self.cache, root, self.runner, self)
+        self.model.load_failed.connect(self.on_load_failed)
+        self.model.busy_changed.connect(lambda n: self.set_busy(n > 0))
+        self.tree.setModel(self.model)
+        self.tree.setColumnWidth(0, 380)
+        self.tree.selectionModel().currentChanged.connect(
+            lambda cur, prev: self.lbl_path.setText(self.model.path_of(cur)))
+        self.btn_refresh.setEnabled(True)
+        for b in (self.btn_upload, self.btn_upload_dir, self.btn_download):
+            b.setEnabled(True)
+        self.set_busy(False)
+
+    def on_connect_failed(self, err):
+        self.set_busy(False)
+        self.lbl_path.setText(f"❌ {err}")
+        QMessageBox.critical(self, "SFTP Error", str(err) or type(err).__name__)
+
+    def on_cancel(self):
+        if self.model is None:
+            # Chưa kết nối xong → huỷ và đóng
+            self.reject()
+            return
+        self.model.cancel_loads()
+
+    def set_busy(self, busy):
+        self.spinner.setVisible(busy)
+        self.btn_cancel.setEnabled(busy)
+
+    def on_load_failed(self, path, err):
+        QMessageBox.warning(self, "SFTP Error", f"{path}\n{err}")
+
+    # ---------- transfers ----------
+    def transfer_engine(self):
+        if self.engine is None:
+            host, port, user, pwd = self.conn_args
+            pool = get_transport_pool()
+            # endpoint → tiến độ được ghi vào DB, transfer rớt mạng tự resume; exec để hash .part trên server
+            self.engine = TransferEngine(lambda: pool.open_sftp(host, port, user, pwd, self.token),
+                                         endpoint=f"{user}@{host}:{port}",
+                                         run_command=lambda cmd: pool.run(host, port, user, pwd, cmd, self.token))
+        return self.engine
+
+    def current_dir(self):
+        # Thư mục đích khi upload: thư mục đang chọn, hoặc thư mục chứa file đang chọn
+        node = self.model._node(self.tree.currentIndex())
+        return node.path if node.entry.is_dir else posixpath.dirname(node.path)
+
+    def upload_files(self):
+        paths, _ = QFileDialog.getOpenFileNames(self, "Upload file")
+        for p in paths:
+            self.add_transfer(self.transfer_engine().upload(p, self.current_dir(), self.transfer_done.emit))
+
+    def upload_folder(self):
+        path = QFileDialog.getExistingDirectory(self, "Upload folder")
+        if path:
+            self.add_transfer(self.transfer_engine().upload(path, self.current_dir(), self.transfer_done.emit))
+
+    def download_selected(self):
+        nodes = [self.model._node(i) for i in self.tree.selectionModel().selectedRows(0)]
+        if not nodes:
+            return
+        dest = QFileDialog.getExistingDirectory(self, "Download to", os.path.expanduser("~"))
+        if not dest:
+            return
+        for node in nodes:
+            self.add_transfer(self.transfer_engine().download(
+                node.path, node.entry.is_dir, dest, self.transfer_done.emit))
+
+    def add_transfer(self, transfer):
+        self.transfers.append(transfer)
+        self.transfer_list.addItem(transfer.summary())
+        self.transfer_list.setVisible(True)
+        self.transfer_timer.start()
+
+    def update_transfers(self):
+        for i, t in enumerate(self.transfers):
+            self.transfer_list.item(i).setText(t.summary())
+        if not any(t.active for t in self.transfers):
+            self.transfer_timer.stop()
+
+    def retry_transfer(self, item):
+        i = self.transfer_list.row(item)
+        old = self.transfers[i]
+        if old.active:
+            return
+        self.transfers[i] = self.transfer_engine().retry(old, self.transfer_done.emit)
+        item.setText(self.transfers[i].summary())
+        self.transfer_timer.start()
+
+    def cancel_transfer(self):
+        # Huỷ transfer đang chọn; không chọn gì thì huỷ tất cả transfer đang chạy
+        rows = {self.transfer_list.row(it) for it in self.transfer_list.selectedItems()}
+        for i, t in enumerate(self.transfers):
+            if t.active and (not rows or i in rows):
+                t.token.cancel()
+
+    def on_transfer_done(self, transfer):
+        self.update_transfers()
+        if transfer.direction == "upload" and self.model is not None:
+            parent = posixpath.dirname(transfer.dest)
+            self.cache.invalidate(parent)
+            self.model.refresh_path(parent)
+        if transfer.state == "failed" and self.isVisible():
+            errors = "\n".join(f"{p}: {e}" for p, e in transfer.errors[:10])
+            QMessageBox.warning(self, "SFTP transfer", f"{transfer.name}: {len(transfer.errors)} lỗi\n{errors}\n\n"
+                                "Double-click transfer trong danh sách để chạy lại – phần đã truyền được giữ lại.")
+
+    def done(self, result):
+        running = [t for t in self.transfers if t.active]
+        if running and QMessageBox.question(
+                self, "SFTP", f"Còn {len(running)} transfer đang chạy. Huỷ và đóng?") \
+                != QMessageBox.StandardButton.Yes:
+            return
+        super().done(result)
+
+    def on_closed(self, _):
+        self.token.cancel()
+        for t in self.transfers:
+            t.token.cancel()
+        self.transfer_timer.stop()
+        if self.engine is not None:
+            self.engine.close()
+        if self.model is not None:
+            self.model.cancel_loads()
+        if self.cache is not None:
+            self.cache.close()
+
+
+# ==========================
+# CONTROL MASTERS DIALOG
+# ==========================
+class MastersDialog(QDialog):
+    """Liệt kê các ControlMaster đang sống và đóng chúng (ssh -O exit chạy trên worker)."""
+
+    def __init__(self, masters, parent=None):
+        super().__init__(parent)
+        self.masters = masters
+        self.runner = TaskRunner(get_ssh_executor(), self)
+        self.setWindowTitle("SSH masters")
+        self.resize(560, 360)
+
+        layout = QVBoxLayout(self)
+        self.list = QListWidget()
+        self.list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.lbl = QLabel("")
+        btns = QHBoxLayout()
+        self.btn_refresh = QPushButton("Refresh")
+        self.btn_close_sel = QPushButton("Close selected")
+        self.btn_close_all = QPushButton("Close all")
+        btn_done = QPushButton("Done")
+        for b in (self.btn_refresh, self.btn_close_sel, self.btn_close_all, btn_done):
+            btns.addWidget(b)
+        layout.addWidget(self.list)
+        layout.addWidget(self.lbl)
+        layout.addLayout(btns)
+
+        self.btn_refresh.clicked.connect(self.refresh)
+        self.btn_close_sel.clicked.connect(lambda: self.close_paths(
+            [it.data(Qt.ItemDataRole.UserRole) for it in self.list.selectedItems()]))
+        self.btn_close_all.clicked.connect(lambda: self.close_paths(
+            [self.list.item(i).data(Qt.ItemDataRole.UserRole) for i in range(self.list.count())]))
+        btn_done.clicked.connect(self.accept)
+        self.refresh()
+
+    def refresh(self):
+        self.list.clear()
+        for host, port, user, label, path in self.masters.live(get_repo().multiplex_targets()):
+            text = f"🟢 {label} – {user}@{host}:{port}" if host else f"🟢 (không rõ) {os.path.basename(path)}"
+            self.list.addItem(text)
+            self.list.item(self.list.count() - 1).setData(Qt.ItemDataRole.UserRole, path)
+        self.lbl.setText(f"{self.list.count()} master đang sống – thư mục: {self.masters.dir}")
+
+    def close_paths(self, paths):
+        if not paths:
+            return
+        self.btn_close_sel.setEnabled(False)
+        self.btn_close_all.setEnabled(False)
+        self.lbl.setText(f"⏳ Đang đóng {len(paths)} master...")
+        self.runner.submit(lambda token: [self.masters.close(p) for p in paths], self.on_closed, self.on_closed)
+
+    def on_closed(self, _):
+        self.btn_close_sel.setEnabled(True)
+        self.btn_close_all.setEnabled(True)
+        self.refresh()
+
+
+# ==========================
+# FAN-OUT DIALOG
+# ==========================
+class FanoutDialog(QDialog):
+    """Chạy một lệnh trên nhiều host: output stream vào một pane, tổng kết exit code."""
+
+    MAX_LINES = 20000  # giới hạn số dòng output giữ trong pane
+
+    def __init__(self, rows, title, parent=None):
+        super().__init__(parent)
+        self.rows = rows
+        self.token = None
+        self.events = queue.SimpleQueue()  # worker → GUI, được rút theo QTimer
+        self.partial = {}  # (conn_id, stream) → đoạn chưa hết dòng
+        self.results = []
+        self.setWindowTitle(f"Run command – {title} ({len(rows)} host)")
+        self.resize(900, 620)
+
+        layout = QVBoxLayout(self)
+        form = QHBoxLayout()
+        self.cmd = QLineEdit()
+        self.cmd.setPlaceholderText("uptime / df -h / systemctl restart ...")
+        self.concurrency = QSpinBox()
+        self.concurrency.setRange(1, 256)
+        self.concurrency.setValue(32)
+        self.concurrency.setPrefix("Song song: ")
+        self.timeout = QSpinBox()
+        self.timeout.setRange(1, 3600)
+        self.timeout.setValue(60)
+        self.timeout.setPrefix("Timeout: ")
+        self.timeout.setSuffix(" s")
+        self.btn_run = QPushButton("Run")
+        self.btn_cancel = QPushButton("Cancel")
+        self.btn_cancel.setEnabled(False)
+        form.addWidget(self.cmd, 1)
+        form.addWidget(self.concurrency)
+        form.addWidget(self.timeout)
+        form.addWidget(self.btn_run)
+        form.addWidget(self.btn_cancel)
+        layout.addLayout(form)
+
+        splitter = QSplitter(Qt.Orientation.Vertical)
+        self.output = QPlainTextEdit()
+        self.output.setReadOnly(True)
+        self.output.setMaximumBlockCount(self.MAX_LINES)
+        self.output.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.result_list = QListWidget()
+        splitter.addWidget(self.output)
+        splitter.addWidget(self.result_list)
+        splitter.setStretchFactor(0, 3)
+        splitter.setStretchFactor(1, 1)
+        layout.addWidget(splitter)
+
+        self.lbl_summary = QLabel("")
+        layout.addWidget(self.lbl_summary)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(50)
+        self.timer.timeout.connect(self.drain)
+
+        self.btn_run.clicked.connect(self.start)
+        self.cmd.returnPressed.connect(self.start)
+        self.btn_cancel.clicked.connect(self.cancel)
+        self.finished.connect(lambda _: self.cancel())
+
+    def start(self):
+        command = self.cmd.text().strip()
+        if not command or self.token is not None:
+            return
+        self.output.clear()
+        self.result_list.clear()
+        self.results = []
+        self.partial = {}
+        self.t0 = time.perf_counter()
+        executor = FanoutExecutor(self.concurrency.value(), self.timeout.value())
+        self.token = executor.run(
+            self.rows, command,
+            lambda *a: self.events.put(("out",) + a),
+            lambda res: self.events.put(("result", res)),
+            lambda results: self.events.put(("done", results)))
+        self.btn_run.setEnabled(False)
+        self.btn_cancel.setEnabled(True)
+        self.lbl_summary.setText(f"⏳ Đang chạy trên {len(self.rows)} host...")
+        self.timer.start()
+
+    def cancel(self):
+        if self.token is not None:
+            self.token.cancel()
+
+    def drain(self):
+        lines = []
+        for _ in range(5000):
+            try:
+                ev = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if ev[0] == "out":
+                _, id_, name, stream, text = ev
+                buf = self.partial.get((id_, stream), "") + text
+                *complete, rest = buf.split("\n")
+                self.partial[(id_, stream)] = rest
+                mark = "!" if stream == "err" else " "
+                lines.extend(f"[{name}]{mark} {line}" for line in complete)
+            elif ev[0] == "result":
+                res = ev[1]
+                for stream in ("out", "err"):
+                    rest = self.partial.pop((res.conn_id, stream), "")
+                    if rest:
+                        lines.append(f"[{res.name}]{'!' if stream == 'err' else ' '} {rest}")
+                self.add_result(res)
+            else:
+                self.finish(ev[1])
+        if lines:
+            self.output.appendPlainText("\n".join(lines))
+
+    def add_result(self, res):
+        self.results.append(res)
+        if res.error:
+            text = f"❌ {res.name} ({res.host}): {res.error}"
+        elif res.exit_code == 0:
+            text = f"✅ {res.name} ({res.host}): exit 0"
+        else:
+            text = f"⚠️ {res.name} ({res.host}): exit {res.exit_code}"
+        self.result_list.addItem(f"{text}  [{res.elapsed:.1f}s]")
+        self.lbl_summary.setText(f"⏳ {len(self.results)}/{len(self.rows)} host xong...")
+
+    def finish(self, results):
+        self.timer.stop()
+        self.token = None
+        self.btn_run.setEnabled(True)
+        self.btn_cancel.setEnabled(False)
+        ok = sum(1 for r in results if not r.error and r.exit_code == 0)
+        nonzero = sum(1 for r in results if not r.error and r.exit_code != 0)
+        errors = sum(1 for r in results if r.error)
+        ms = (time.perf_counter() - self.t0) * 1000
+        self.lbl_summary.setText(
+            f"✅ {ok} exit 0   ⚠️ {nonzero} exit ≠ 0   ❌ {errors} lỗi kết nối / timeout   ⏱ {ms / 1000:.1f}s")
+
+
+# ==========================
+# TERMINAL TABS
+# ==========================
+TERMINAL_KEYS = {
+    Qt.Key.Key_Return: b"\r", Qt.Key.Key_Enter: b"\r", Qt.Key.Key_Backspace: b"\x7f",
+    Qt.Key.Key_Tab: b"\t", Qt.Key.Key_Escape: b"\x1b",
+    Qt.Key.Key_Up: b"\x1b[A", Qt.Key.Key_Down: b"\x1b[B", Qt.Key.Key_Right: b"\x1b[C", Qt.Key.Key_Left: b"\x1b[D",
+    Qt.Key.Key_Home: b"\x1b[H", Qt.Key.Key_End: b"\x1b[F", Qt.Key.Key_Delete: b"\x1b[3~",
+    Qt.Key.Key_PageUp: b"\x1b[5~", Qt.Key.Key_PageDown: b"\x1b[6~",
+}
+
+
+class TerminalView(QAbstractScrollArea):
+    """Vẽ trực tiếp các dòng đang nhìn thấy từ TerminalBuffer – không copy output vào widget,
+    nên đổi tab / cuộn không phải dựng lại gì."""
+
+    def __init__(self, session, parent=None):
+        super().__init__(parent)
+        self.session = session
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        fm = self.fontMetrics()
+        self.cell_w = max(1, fm.horizontalAdvance("M"))
+        self.cell_h = max(1, fm.height())
+        self.ascent = fm.ascent()
+        self.bg = QColor("#1e1e1e")
+        self.fg = QColor("#d4d4d4")
+
+    def grid_size(self):
+        vp = self.viewport()
+        return max(20, vp.width() // self.cell_w), max(5, vp.height() // self.cell_h)
+
+    def sync(self):
+        # Gọi sau khi buffer nhận output: cập nhật thanh cuộn, bám đáy nếu đang ở đáy
+        bar = self.verticalScrollBar()
+        at_bottom = bar.value() >= bar.maximum()
+        rows = self.grid_size()[1]
+        bar.setRange(0, max(0, len(self.session.buffer) - rows))
+        bar.setPageStep(rows)
+        if at_bottom:
+            bar.setValue(bar.maximum())
+        self.viewport().update()
+
+    def paintEvent(self, event):
+        buf = self.session.buffer
+        p = QPainter(self.viewport())
+        p.fillRect(self.viewport().rect(), self.bg)
+        p.setPen(self.fg)
+        first = self.verticalScrollBar().value()
+        rows = self.grid_size()[1]
+        last = min(len(buf), first + rows + 1)
+        for i in range(first, last):
+            p.drawText(0, (i - first) * self.cell_h + self.ascent, buf[i])
+        cursor_row = len(buf) - 1 - first
+        if 0 <= cursor_row <= rows and self.hasFocus():
+            p.fillRect(buf.col * self.cell_w, cursor_row * self.cell_h, self.cell_w, self.cell_h,
+                       QColor(212, 212, 212, 120))
+        p.end()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.session.resize(*self.grid_size())
+        self.sync()
+
+    def focusNextPrevChild(self, next_):
+        return False  # Tab gửi vào shell, không chuyển focus
+
+    def keyPressEvent(self, event):
+        key, mods = event.key(), event.modifiers()
+        ctrl = bool(mods & Qt.KeyboardModifier.ControlModifier)
+        shift = bool(mods & Qt.KeyboardModifier.ShiftModifier)
+        if shift and key in (Qt.Key.Key_PageUp, Qt.Key.Key_PageDown):
+            bar = self.verticalScrollBar()
+            step = bar.pageStep() if key == Qt.Key.Key_PageDown else -bar.pageStep()
+            bar.setValue(bar.value() + step)
+            self.viewport().update()
+            return
+        if ctrl and shift and key == Qt.Key.Key_V:
+            self.session.send(QApplication.clipboard().text().encode())
+            return
+        if key in TERMINAL_KEYS:
+            data = TERMINAL_KEYS[key]
+        elif ctrl and Qt.Key.Key_A <= key <= Qt.Key.Key_Z:
+            data = bytes([key - Qt.Key.Key_A + 1])
+        else:
+            data = event.text().encode()
+        if data:
+            self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+            self.session.send(data)
+
+
+class TerminalWindow(QWidget):
+    """Cửa sổ tab terminal trong app: mỗi tab là một TerminalSession, output của mọi phiên
+    được rút theo lô mỗi 30 ms và chỉ tab đang xem được vẽ lại."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent, Qt.WindowType.Window)
+        self.setWindowTitle("SSH Terminals")
+        self.resize(980, 620)
+        self.runner = TaskRunner(get_ssh_executor(), self)
+        self.tabs = QTabWidget()
+        self.tabs.setTabsClosable(True)
+        self.tabs.setDocumentMode(True)
+        self.tabs.tabCloseRequested.connect(self.close_tab)
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.tabs)
+        self.tokens = {}  # view → CancelToken khi đang connect
+        self.timer = QTimer(self)
+        self.timer.setInterval(30)
+        self.timer.timeout.connect(self.drain)
+
+    def open(self, row):
+        session = TerminalSession(row)
+        view = TerminalView(session)
+        name = row[2]
+        idx = self.tabs.addTab(view, f"⏳ {name}")
+        self.tabs.setCurrentIndex(idx)
+        self.show()
+        self.raise_()
+        self.activateWindow()
+        view.setFocus()
+        session.buffer.feed(f"Connecting {row[5]}@{row[3]}:{row[4]}...\r\n")
+        view.sync()
+        cols, rows = view.grid_size()
+
+        def job(token):
+            session.open(get_transport_pool(), cols, rows, token)
+            get_repo().touch_conn(row[0], now_str())
+
+        self.tokens[view] = self.runner.submit(
+            job, lambda _: self.on_connected(view), lambda e: self.on_failed(view, e))
+
+    def on_connected(self, view):
+        self.tokens.pop(view, None)
+        get_terminal_hub().add(view.session)
+        self.set_title(view, view.session.row[2])
+        self.timer.start()
+
+    def on_failed(self, view, error):
+        self.tokens.pop(view, None)
+        view.session.buffer.feed(f"❌ {error or type(error).__name__}\r\n")
+        view.sync()
+        self.set_title(view, f"✖ {view.session.row[2]}")
+
+    def set_title(self, view, text):
+        idx = self.tabs.indexOf(view)
+        if idx >= 0:
+            self.tabs.setTabText(idx, text)
+
+    def sessions(self):
+        return [self.tabs.widget(i) for i in range(self.tabs.count())]
+
+    def drain(self):
+        current = self.tabs.currentWidget()
+        live = 0
+        for view in self.sessions():
+            session = view.session
+            if session.chan is None:
+                continue
+            text, eof = session.take()
+            if text:
+                session.buffer.feed(text)
+                if view is current:
+                    view.sync()
+            if eof and session.chan is not None and not getattr(view, "ended", False):
+                view.ended = True
+                session.buffer.feed("\r\n[Phiên đã đóng]\r\n")
+                session.close()
+                self.set_title(view, f"✖ {session.row[2]}")
+                if view is current:
+                    view.sync()
+            if not getattr(view, "ended", False):
+                live += 1
+        if not live:
+            self.timer.stop()
+
+    def on_tab_changed(self, idx):
+        view = self.tabs.widget(idx)
+        if view is not None:
+            view.sync()
+            view.setFocus()
+
+    def close_tab(self, idx):
+        view = self.tabs.widget(idx)
+        token = self.tokens.pop(view, None)
+        if token:
+            token.cancel()
+        if view.session.chan is not None:
+            get_terminal_hub().remove(view.session)
+        view.session.close()
+        self.tabs.removeTab(idx)
+        view.deleteLater()
+
+    def close_all(self):
+        while self.tabs.count():
+            self.close_tab(0)
+
+    def closeEvent(self, event):
+        live = sum(1 for v in self.sessions() if v.session.chan is not None and not v.session.eof)
+        if live and QMessageBox.question(
+                self, "Close", f"Đóng {live} phiên SSH đang mở?") != QMessageBox.StandardButton.Yes:
+            event.ignore()
+            return
+        self.close_all()
+        event.accept()
+
+
+# ==========================
+# SINGLE INSTANCE – phía server
+# ==========================
+class InstanceServer(QObject):
+    """Nghe trên ipc_socket_path() bằng QLocalServer; mỗi client gửi một dòng argv (ngăn bởi \\0),
+    handler(args) chạy trên GUI thread và trả về một dòng phản hồi."""
+
+    def __init__(self, handler, parent=None):
+        super().__init__(parent)
+        self.handler = handler
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+        self.server.newConnection.connect(self.on_connection)
+
+    def listen(self):
+        path = ipc_socket_path()
+        directory = os.path.dirname(path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        st = os.stat(directory)
+        if st.st_uid != os.getuid() or st.st_mode & 0o022:
+            print("⚠️ Thư mục IPC không an toàn (user khác ghi được):", directory)
+            return False
+        # Chỉ xoá socket khi không còn ai nghe: hai lần mở đầu tiên chạy cùng lúc không xoá socket của nhau
+        if os.path.exists(path):
+            if instance_alive(path):
+                print("⚠️ Đã có instance khác nghe trên", path)
+                return False
+            QLocalServer.removeServer(path)
+        if not self.server.listen(path):
+            print("⚠️ Không mở được IPC socket:", path, self.server.errorString())
+            return False
+        return True
+
+    def close(self):
+        self.server.close()
+
+    def on_connection(self):
+        while self.server.hasPendingConnections():
+            sock = self.server.nextPendingConnection()
+            sock.readyRead.connect(lambda s=sock: self.on_ready(s))
+            sock.disconnected.connect(sock.deleteLater)
+
+    def on_ready(self, sock):
+        if not sock.canReadLine():
+            return
+        line = bytes(sock.readLine()).decode(errors="replace").rstrip("\n")
+        try:
+            reply = self.handler(line.split("\0") if line else [])
+        except Exception as e:
+            reply = f"error: {e}"
+        sock.write((reply.replace("\n", " ") + "\n").encode())
+        sock.flush()
+        sock.disconnectFromServer()
+
+
 # ==========================
 # MAIN WINDOW
 # ==========================
 class MainWindow(QWidget):
+    # ChangeSet từ repository (có thể phát từ thread khác) → áp trên GUI thread
+    changes_ready = pyqtSignal(object)
+    # Kết quả từ Launcher (worker thread) → GUI thread
+    launch_failed = pyqtSignal(str)
+    launch_started = pyqtSignal(str, float)
+    status_result = pyqtSignal(object, object)  # (host, port), HostStatus
+    status_done = pyqtSignal(int)
+    hostkeys_done = pyqtSignal(object)  # [HostKeyResult]
+
     def __init__(self):
         super().__init__()
         self.last_created_group = None
+        self.gvfs_reset = None  # GvfsResetPipeline đang chạy (nếu có)
         self.setWindowTitle("SSH Manager")
         self.setWindowIcon(QIcon(resource_path("icon.png")))
         self.resize(980, 600)
@@ -262,10 +1427,26 @@ class MainWindow(QWidget):
         self.btn_delete = QPushButton("Delete")
         self.btn_add_group = QPushButton("Add Group")
         self.btn_delete_group = QPushButton("Delete Group")
+        self.btn_import = QPushButton("Import")
+        import_menu = QMenu(self.btn_import)
+        import_menu.addAction("~/.ssh/config", lambda: self.import_from("ssh_config", SSH_CONFIG_FILE))
+        import_menu.addAction("Remmina profiles", lambda: self.import_from("remmina", REMMINA_DIR))
+        import_menu.addAction("servers.json (v1)...", lambda: self.import_from("servers.json", None))
+        self.btn_import.setMenu(import_menu)
+        self.btn_export = QPushButton("Export")
+        export_menu = QMenu(self.btn_export)
+        for fmt in EXPORT_FORMATS:
+            export_menu.addAction(f"{fmt}...", lambda fmt=fmt: self.export_to(fmt))
+        export_menu.addSeparator()
+        export_menu.addAction("Backup database...", self.backup_database)
+        self.btn_export.setMenu(export_menu)
 
         self.btn_ssh = QPushButton("Connect SSH")
+        self.btn_ssh_tab = QPushButton("SSH Tab")
         self.btn_sftp = QPushButton("Open SFTP")
         self.btn_browse = QPushButton("Browse SFTP")
+        self.btn_fanout = QPushButton("Run Command")
+        self.btn_masters = QPushButton("SSH Masters")
         self.btn_reset_sftp = QPushButton("Reset SFTP")
 
         top.addWidget(self.btn_add)
@@ -274,11 +1455,16 @@ class MainWindow(QWidget):
         top.addWidget(self.btn_add_group)
         self.btn_add_group.clicked.connect(self.add_group)
         top.addWidget(self.btn_delete_group)
+        top.addWidget(self.btn_import)
+        top.addWidget(self.btn_export)
 
         top.addStretch()
         top.addWidget(self.btn_ssh)
+        top.addWidget(self.btn_ssh_tab)
         top.addWidget(self.btn_sftp)
         top.addWidget(self.btn_browse)
+        top.addWidget(self.btn_fanout)
+        top.addWidget(self.btn_masters)
         top.addWidget(self.btn_reset_sftp)
         self.btn_reset_sftp.clicked.connect(self.reset_sftp)
         self.btn_delete_group.clicked.connect(self.delete_group)
@@ -286,7 +1472,7 @@ class MainWindow(QWidget):
         layout.addLayout(top)
 
         # Splitter
-        splitter = QSplitter(Qt.Orientation.Horizontal)
+        self.splitter = splitter = QSplitter(Qt.Orientation.Horizontal)
 
         # ==== Panel trái: group list + 3 dòng thông tin ====
         left_panel = QWidget()
@@ -319,29 +1505,55 @@ class MainWindow(QWidget):
         self.lbl_owner = QLabel("👤 Dev: DU-IT")
         self.lbl_created = QLabel("📅 Date: 04-11-2025")
         self.lbl_version = QLabel("🧩 Version: 1.0.0")
+        self.lbl_launch = QLabel("⚡ Launch: -")
 
         info_layout.addWidget(self.lbl_owner)
         info_layout.addWidget(self.lbl_created)
         info_layout.addWidget(self.lbl_version)
+        info_layout.addWidget(self.lbl_launch)
 
         left_layout.addWidget(info_frame, 0)  # stretch = 0 cho cố định chiều cao
         splitter.addWidget(left_panel)
 
-        # ==== Bảng bên phải ====
-        self.table = QTableWidget(0, 7)
-        self.table.setHorizontalHeaderLabels([
-            "ID", "Group", "Name", "Host:Port", "User", "Protocol", "Last used"
-        ])
+        # ==== Bảng bên phải (ô tìm kiếm + bảng) ====
+        right_panel = QWidget()
+        right_layout = QVBoxLayout(right_panel)
+        right_layout.setContentsMargins(0, 0, 0, 0)
+
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("🔍 Tìm theo name / host / user / group...")
+        self.search_box.setClearButtonEnabled(True)
+        right_layout.addWidget(self.search_box)
+
+        self.model = ConnectionTableModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        # Chiều cao dòng cố định → view không phải đo từng dòng
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
         # self.table.hideColumn(0)
-        splitter.addWidget(self.table)
+        right_layout.addWidget(self.table)
+        splitter.addWidget(right_panel)
         splitter.setStretchFactor(0, 0)  # group_list không giãn
         splitter.setStretchFactor(1, 1)  # table chiếm toàn bộ phần còn lại
 
         header = self.table.horizontalHeader()
         header.setStretchLastSection(True)
-
-        header.sectionResized.connect(self.save_table_layout)
+        header.setSectionsMovable(True)
+
+        # Bố cục (độ rộng / thứ tự cột, splitter) nằm trong widget; kéo chỉ khởi động lại timer,
+        # ghi DB một lần sau khi ngừng kéo và khi đóng cửa sổ
+        self.layout_timer = QTimer(self)
+        self.layout_timer.setSingleShot(True)
+        self.layout_timer.setInterval(LAYOUT_SAVE_DELAY_MS)
+        self.layout_timer.timeout.connect(self.flush_layout)
+        self.saved_layout = ({}, {})
         self.load_table_layout()
+        header.sectionResized.connect(self.schedule_layout_save)
+        header.sectionMoved.connect(self.schedule_layout_save)
+        splitter.splitterMoved.connect(self.schedule_layout_save)
 
         layout.addWidget(splitter)
 
@@ -351,44 +1563,92 @@ class MainWindow(QWidget):
         self.btn_delete.clicked.connect(self.delete_entry)
 
         self.btn_ssh.clicked.connect(self.open_ssh)
+        self.btn_ssh_tab.clicked.connect(self.open_ssh_tab)
         self.btn_sftp.clicked.connect(self.open_sftp)
         self.btn_browse.clicked.connect(self.browse_sftp)
+        self.btn_fanout.clicked.connect(self.run_command_selected)
+        self.btn_masters.clicked.connect(self.show_masters)
 
         self.group_list.itemClicked.connect(self.on_group_changed)
+        self.group_list.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.group_list.customContextMenuRequested.connect(self.on_group_menu)
+
+        # Kiểm tra trạng thái host (probe đồng thời, cache theo TTL)
+        self.scanner = ReachabilityScanner()
+        self.model.status_lookup = self.scanner.get
+        self.status_pending = 0
+        self.status_flush = QTimer(self)
+        self.status_flush.setSingleShot(True)
+        self.status_flush.setInterval(100)  # gom kết quả → một lần dataChanged
+        self.status_flush.timeout.connect(self.model.status_changed)
+        self.status_result.connect(self.on_status_result)
+        self.status_done.connect(self.on_status_done)
+        self.hostkeys_done.connect(self.on_hostkeys_done)
+        self.search_box.textChanged.connect(self.on_search)
+
+        self.launcher = Launcher(on_error=self.launch_failed.emit, on_started=self.launch_started.emit)
+        self.terminals = None  # TerminalWindow, tạo khi mở tab đầu tiên
+        self.launch_failed.connect(lambda msg: QMessageBox.critical(self, "Launch error", msg))
+        self.launch_started.connect(self.on_launch_started)
+
+        # Định kỳ đóng các SSH transport idle trong pool
+        self.pool_timer = QTimer(self)
+        self.pool_timer.timeout.connect(evict_idle_transports)
+        self.pool_timer.start(60_000)
+
+        self.runner = TaskRunner(get_ssh_executor(), self)  # việc nền chung (import...)
+        self.changes_ready.connect(self.apply_changes)
+        get_repo().subscribe(self.changes_ready.emit)
 
         self.reload()
 
     def load_table_layout(self):
-        conn = sqlite3.connect(DB_FILE)
-        cur = conn.cursor()
-        cur.execute("SELECT col_name, width FROM table_layout")
-        data = dict(cur.fetchall())
-        conn.close()
-
-        headers = ["ID", "Group", "Name", "Host:Port", "User", "Protocol", "Last used"]
-
-        for i, name in enumerate(headers):
-            if name in data:
-                self.table.setColumnWidth(i, data[name])
-
-    def save_table_layout(self, index, old_width, new_width):
+        columns, state = get_repo().load_layout()
+        header = self.table.horizontalHeader()
+        for i, name in enumerate(TABLE_HEADERS):
+            if name in columns:
+                self.table.setColumnWidth(i, columns[name][0])
+        # Đặt lại thứ tự hiển thị theo position tăng dần (cột chưa lưu position giữ nguyên chỗ)
+        moves = sorted((columns[name][1], i) for i, name in enumerate(TABLE_HEADERS)
+                       if name in columns and columns[name][1] is not None)
+        for pos, i in moves:
+            if pos < len(TABLE_HEADERS):
+                header.moveSection(header.visualIndex(i), pos)
+        sizes = [int(x) for x in state.get("main_splitter", "").split(",") if x.isdigit()]
+        if len(sizes) == self.splitter.count():
+            self.splitter.setSizes(sizes)
+        self.saved_layout = (columns, state)
+
+    def schedule_layout_save(self, *args):
+        # Bỏ qua tham số của signal (QTimer.start(int) sẽ hiểu nhầm thành interval)
+        self.layout_timer.start()
+
+    def layout_snapshot(self):
+        header = self.table.horizontalHeader()
+        columns = {name: (header.sectionSize(i), header.visualIndex(i)) for i, name in enumerate(TABLE_HEADERS)}
+        state = {"main_splitter": ",".join(str(x) for x in self.splitter.sizes())}
+        return columns, state
+
+    def flush_layout(self):
+        # Chỉ ghi những gì khác lần lưu trước, tất cả trong một transaction
+        self.layout_timer.stop()
+        columns, state = self.layout_snapshot()
+        saved_columns, saved_state = self.saved_layout
+        changed_columns = {k: v for k, v in columns.items() if saved_columns.get(k) != v}
+        changed_state = {k: v for k, v in state.items() if saved_state.get(k) != v}
+        if not changed_columns and not changed_state:
+            return
         try:
-            header = self.table.horizontalHeaderItem(index)
-            if not header:
-                return
-            header_name = header.text()
-            conn = sqlite3.connect(DB_FILE)
-            cur = conn.cursor()
-            cur.execute("""
-                        INSERT INTO table_layout (col_name, width)
-                        VALUES (?, ?)
-                        ON CONFLICT(col_name) DO UPDATE SET width=excluded.width
-                        """, (header_name, new_width))
-            conn.commit()
-            conn.close()
-            print(f"💾 Saved column {header_name}: {new_width}px")
-        except Exception as e:
-            print("save_table_layout error:", e)
+            get_repo().save_layout(changed_columns, changed_state)
+        except sqlite3.Error as e:
+            print("save layout error:", e)
+            return
+        self.saved_layout = (columns, state)
+        print(f"💾 Layout saved: {len(changed_columns)} cột, {len(changed_state)} mục khác")
+
+    def closeEvent(self, event):
+        self.flush_layout()
+        super().closeEvent(event)
 
     # Load data UI
     def reload(self):
@@ -396,26 +1656,15 @@ class MainWindow(QWidget):
         current_item = self.group_list.currentItem()
         current_group_text = current_item.text() if current_item else "All"
 
-        # Lấy tất cả connections (dùng để hiển thị table khi chọn All hoặc group)
-        rows = fetch_all()
-
         # Lấy danh sách groups từ bảng `groups` nếu có, fallback sang DISTINCT grp từ connections
-        conn = sqlite3.connect(DB_FILE)
-        cur = conn.cursor()
-        try:
-            cur.execute("SELECT name FROM groups ORDER BY name")
-            db_groups = [r[0] for r in cur.fetchall()]
-        except Exception:
-            cur.execute("SELECT DISTINCT grp FROM connections")
-            db_groups = [r[0] for r in cur.fetchall()]
-        conn.close()
+        db_groups = get_repo().list_groups()
 
         # Kết hợp groups từ bảng groups và các grp có trong connections (đảm bảo không mất group nào)
         groups = set(["All"])
         for g in db_groups:
             groups.add(g or "")  # lưu rỗng -> biểu diễn sau thành (no group)
-        for r in rows:
-            groups.add(r[1] or "")
+        for g in get_repo().distinct_grp():
+            groups.add(g or "")
 
         # Rebuild UI list (block signals khi thay đổi để tránh on_group_changed tự chạy)
         self.group_list.blockSignals(True)
@@ -440,20 +1689,116 @@ class MainWindow(QWidget):
             self.on_group_changed(target_item)
         else:
             # dự phòng: nếu thật sự không có gì, clear table
-            self.table.setRowCount(0)
-        self.load_table_layout()
+            self.model.clear()
+
+    # Áp ChangeSet: chỉ sửa những dòng / group bị ảnh hưởng thay vì reload()
+    def apply_changes(self, changes):
+        if changes.reset:
+            self.reload()
+            return
+        current_item = self.group_list.currentItem()
+        current_text = current_item.text() if current_item else "All"
+
+        self.group_list.blockSignals(True)
+        for g in changes.groups_removed:
+            for it in self.group_list.findItems(g or "(no group)", Qt.MatchFlag.MatchExactly):
+                self.group_list.takeItem(self.group_list.row(it))
+        for g in changes.groups_added:
+            self.ensure_group_item(g)
+        for row in changes.inserted + changes.updated:
+            self.ensure_group_item(row[1])
+        self.group_list.blockSignals(False)
+
+        if current_text != "All" and not self.group_list.findItems(current_text, Qt.MatchFlag.MatchExactly):
+            # Group đang xem vừa bị xoá → quay về All
+            items = self.group_list.findItems("All", Qt.MatchFlag.MatchExactly)
+            if items:
+                self.group_list.setCurrentItem(items[0])
+                self.on_group_changed(items[0])
+            return
+
+        self.model.apply_changes(changes)
+
+    # Import hàng loạt: parse + ghi DB trên worker, view nạp lại một lần qua ChangeSet(reset=True)
+    def import_from(self, kind, path):
+        if kind == "servers.json":
+            path, _ = QFileDialog.getOpenFileName(self, "servers.json (v1)", "", "JSON (*.json)")
+            if not path:
+                return
+        sources = {"ssh_config": iter_ssh_config, "remmina": iter_remmina, "servers.json": iter_servers_json}
+        records = sources[kind](path)
+        self.btn_import.setEnabled(False)
+        self.lbl_launch.setText(f"📥 Đang import {kind}...")
+        t0 = time.perf_counter()
+
+        def done(result):
+            self.btn_import.setEnabled(True)
+            inserted, skipped = result
+            ms = (time.perf_counter() - t0) * 1000
+            self.lbl_launch.setText(f"📥 Import {kind}: +{inserted}, trùng {skipped} ({ms:.0f} ms)")
+            QMessageBox.information(self, "Import", f"Đã thêm {inserted} kết nối, bỏ qua {skipped} trùng (host, port, user).")
+
+        def failed(e):
+            self.btn_import.setEnabled(True)
+            self.lbl_launch.setText("📥 Import lỗi")
+            QMessageBox.critical(self, "Import", f"Import {kind} lỗi: {e}")
+
+        self.runner.submit(lambda token: get_repo().bulk_import(records), done, failed)
+
+    # Export / backup: chạy trên worker, đọc bằng connection riêng (không chặn GUI, không giữ lock repo)
+    def export_to(self, fmt):
+        dest, _ = QFileDialog.getSaveFileName(self, f"Export {fmt}", f"connections.{fmt.replace('_', '.')}",
+                                              EXPORT_FORMATS[fmt])
+        if not dest:
+            return
+        passwords = fmt != "ssh_config" and QMessageBox.question(
+            self, "Export", "Xuất kèm password (plain text)?") == QMessageBox.StandardButton.Yes
+        self.run_export(f"Export {fmt}", lambda token: export_connections(fmt, dest, passwords),
+                        lambda n: f"{n} kết nối → {dest}")
+
+    def backup_database(self):
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        dest, _ = QFileDialog.getSaveFileName(self, "Backup database", f"connections-{stamp}.db", "SQLite (*.db)")
+        if not dest:
+            return
+        self.run_export("Backup", lambda token: backup_db(dest),
+                        lambda size: f"{human_size(size)} → {dest}")
+
+    def run_export(self, label, job, describe):
+        self.btn_export.setEnabled(False)
+        self.lbl_launch.setText(f"📤 {label}...")
+        t0 = time.perf_counter()
+
+        def done(value):
+            self.btn_export.setEnabled(True)
+            ms = (time.perf_counter() - t0) * 1000
+            self.lbl_launch.setText(f"📤 {label}: {ms:.0f} ms")
+            QMessageBox.information(self, label, describe(value))
+
+        def failed(e):
+            self.btn_export.setEnabled(True)
+            self.lbl_launch.setText(f"📤 {label} lỗi")
+            QMessageBox.critical(self, label, f"{label} lỗi: {e}")
+
+        self.runner.submit(job, done, failed)
+
+    def ensure_group_item(self, g):
+        text = g if g else "(no group)"
+        if self.group_list.findItems(text, Qt.MatchFlag.MatchExactly):
+            return
+        # Giữ đúng thứ tự sorted() như reload(): "(no group)" tương ứng chuỗi rỗng
+        keys = []
+        for i in range(self.group_list.count()):
+            t = self.group_list.item(i).text()
+            keys.append("" if t == "(no group)" else t)
+        self.group_list.insertItem(bisect.bisect_left(keys, g or ""), text)
 
     def add_group(self):
         text, ok = QInputDialog.getText(self, "Add Group", "Group name:")
         if ok and text.strip():
             g = text.strip()
-            conn = sqlite3.connect(DB_FILE)
-            cur = conn.cursor()
-            cur.execute("INSERT OR IGNORE INTO groups (name) VALUES (?)", (g,))
-            conn.commit()
-            conn.close()
+            get_repo().add_group(g)
 
-            self.reload()
             items = self.group_list.findItems(g, Qt.MatchFlag.MatchExactly)
             if items:
                 self.group_list.setCurrentItem(items[0])
@@ -471,41 +1816,17 @@ class MainWindow(QWidget):
 
         if QMessageBox.question(self, "Confirm",
                                 f"Xoá nhóm '{grp}' và tất cả kết nối trong đó?") == QMessageBox.StandardButton.Yes:
-            conn = sqlite3.connect(DB_FILE)
-            cur = conn.cursor()
-            cur.execute("DELETE FROM groups WHERE name=?", (grp,))
-            cur.execute("DELETE FROM connections WHERE grp=?", (grp,))
-            conn.commit()
-            conn.close()
-            self.reload()
-
-    def add_row(self, row):
-        id_, grp, name, host, port, user, pwd, proto, last = row
-        r = self.table.rowCount()
-        self.table.insertRow(r)
-
-        self.table.setItem(r, 0, QTableWidgetItem(str(id_)))
-        self.table.setItem(r, 1, QTableWidgetItem(grp or ""))
-        self.table.setItem(r, 2, QTableWidgetItem(name))
-        self.table.setItem(r, 3, QTableWidgetItem(f"{host}:{port}"))
-        self.table.setItem(r, 4, QTableWidgetItem(user))
-        self.table.setItem(r, 5, QTableWidgetItem(proto))
-        self.table.setItem(r, 6, QTableWidgetItem(last or ""))
+            get_repo().delete_group(grp)
 
     def get_selected(self):
-        r = self.table.currentRow()
+        r = self.table.currentIndex().row()
         if r < 0:
             QMessageBox.warning(self, "Select", "Chọn dòng trước.")
             return None
 
-        id_ = int(self.table.item(r, 0).text())
+        id_ = self.model.conn_id(r)
 
-        conn = sqlite3.connect(DB_FILE)
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM connections WHERE id=?", (id_,))
-        row = cur.fetchone()
-        conn.close()
-        return row
+        return get_repo().get_conn(id_)
 
     def select_last_group(self):
         if not self.last_created_group:
@@ -526,12 +1847,6 @@ class MainWindow(QWidget):
         if d.exec():
             data = d.get_data()
             insert_conn(data)
-            self.reload()
-
-            if item:
-                items = self.group_list.findItems(current_group, Qt.MatchFlag.MatchExactly)
-                if items:
-                    self.group_list.setCurrentItem(items[0])
 
     def edit_entry(self):
         sel = self.get_selected()
@@ -541,13 +1856,13 @@ class MainWindow(QWidget):
         entry = {
             "grp": grp, "name": name, "host": host,
             "port": port, "user": user, "password": pwd,
-            "protocol": proto, "last_used": last
+            "protocol": proto, "last_used": last,
+            "multiplex": get_repo().multiplex_enabled(id_)
         }
 
         d = EntryDialog(self, entry)
         if d.exec():
             update_conn(id_, d.get_data())
-            self.reload()
 
     def delete_entry(self):
         sel = self.get_selected()
@@ -558,116 +1873,113 @@ class MainWindow(QWidget):
                                 f"Xóa {name} ({grp}) ?"
                                 ) == QMessageBox.StandardButton.Yes:
             delete_conn(id_)
-            self.reload()
 
     # SSH
     def open_ssh(self):
+        clicked_at = time.perf_counter()
         sel = self.get_selected()
         if not sel: return
 
-        id_, grp, name, host, port, user, pwd, proto, last = sel
-
-        update_conn(id_, {
-            "grp": grp, "name": name, "host": host, "port": port,
-            "user": user, "password": pwd, "protocol": proto,
-            "last_used": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
-        self.reload()
+        # Spawn terminal + ghi last_used trên worker (ChangeSet cập nhật đúng một ô)
+        self.launcher.open_ssh(sel, clicked_at)
 
-        # Auto login with sshpass
-        if pwd and shutil.which("sshpass"):
-            subprocess.Popen([
-                "gnome-terminal", "--",
-                "sshpass", "-p", pwd,
-                "ssh", f"{user}@{host}", "-p", str(port),
-                "-o", "StrictHostKeyChecking=no"
-            ])
+    # SSH trong tab terminal của app (paramiko PTY, không spawn process)
+    def open_ssh_tab(self):
+        sel = self.get_selected()
+        if not sel:
             return
-
-        subprocess.Popen([
-            "gnome-terminal", "--",
-            "ssh", f"{user}@{host}", "-p", str(port)
-        ])
+        if not HAVE_PARAMIKO:
+            QMessageBox.warning(self, "Missing", "Cài paramiko: pip install paramiko")
+            return
+        self.open_tab_for(sel)
+
+    def open_tab_for(self, row):
+        if self.terminals is None:
+            self.terminals = TerminalWindow()
+        self.terminals.open(row)
+        return True
+
+    # Lệnh từ dòng lệnh hoặc từ lần chạy sau (InstanceServer):
+    #   (trống) → đưa cửa sổ lên; connect|tab|sftp <tên hoặc host>; quit
+    def handle_command(self, args):
+        if args and args[0] == "quit":
+            QTimer.singleShot(0, QApplication.quit)
+            return "ok: quit"
+        self.showNormal()
+        self.raise_()
+        self.activateWindow()
+        if not args:
+            return "ok"
+        actions = {
+            "connect": lambda row: self.launcher.open_ssh(row) or True,
+            "tab": self.open_tab_for,
+            "sftp": self.launcher.open_sftp,
+        }
+        cmd, name = args[0], " ".join(args[1:]).strip()
+        if cmd not in actions or not name:
+            return f"error: dùng connect|tab|sftp <tên> hoặc quit (nhận: {' '.join(args)})"
+        row = get_repo().find_conn(name)
+        if not row:
+            return f"error: không có kết nối '{name}'"
+        if cmd == "tab" and not HAVE_PARAMIKO:
+            return "error: chưa cài paramiko"
+        if not actions[cmd](row):
+            return f"error: không mở được {cmd} cho {row[2]}"
+        return f"ok: {cmd} {row[2]} ({row[5]}@{row[3]}:{row[4]})"
 
     # Open SFTP via Nautilus
     def open_sftp(self):
+        clicked_at = time.perf_counter()
         sel = self.get_selected()
         if not sel:
             return
-        id_, grp, name, host, port, user, pwd, proto, last = sel
-
-        uri = f"sftp://{user}:{pwd}@{host}:{port}" if pwd else f"sftp://{user}@{host}:{port}"
 
-        # Tìm file manager khả dụng
-        file_managers = ["nautilus", "nemo", "thunar", "pcmanfm"]
-        fm = None
-        for fm_name in file_managers:
-            if shutil.which(fm_name):
-                fm = fm_name
-                break
-
-        if not fm:
+        # File manager đã được dò sẵn lúc khởi động
+        if not self.launcher.open_sftp(sel, clicked_at):
             QMessageBox.critical(self, "Error", "Không tìm thấy file manager (nautilus/nemo/thunar).")
-            return
 
-        # --- Mở SFTP ---
-        try:
-            subprocess.Popen([fm, uri])
-        except Exception as e:
-            print("⚠️ Lỗi mở SFTP:", e)
-            return
+    def show_masters(self):
+        MastersDialog(self.launcher.masters, self).exec()
+
+    def on_launch_started(self, label, ms):
+        self.lbl_launch.setText(f"⚡ Launch: {ms:.0f} ms")
+        self.lbl_launch.setToolTip(label)
 
         # Hàm reset GVFS (nếu quá 120 giây)
 
     def reset_sftp(self):
-        print("⏳ Đang reset toàn bộ GVFS và file manager...")
-
-        # Danh sách tiến trình cần kill (tùy môi trường desktop)
-        processes = [
-            "nautilus", "nemo", "thunar",
-            "caja", "pcmanfm",
-            "gvfsd", "gvfsd-fuse", "gvfs-ssh", "gio"
-        ]
-
-        # Kill hết các tiến trình liên quan
-        for p in processes:
-            try:
-                subprocess.Popen(["pkill", "-f", p])
-            except Exception as e:
-                print(e)
-                pass
-
-        # Xóa cache cũ
-        try:
-            subprocess.Popen(["rm", "-rf", os.path.expanduser("~/.cache/gvfs")])
-        except Exception as e:
-            print(e)
-            pass
-
-        # Một số bản cũ (Ubuntu 16–18) có thể cần restart DBus của user
-        try:
-            subprocess.Popen(["dbus-launch"])
-        except Exception as e:
-            print(e)
-            pass
-
-        # Dừng một chút để tránh race-condition
-        time.sleep(3)
+        if self.gvfs_reset is not None:
+            return  # đang chạy
+        print("⏳ Đang reset GVFS (gvfsd / gvfsd-sftp)...")
+
+        pipeline = GvfsResetPipeline(self)
+        dlg = QProgressDialog("Đang reset GVFS...", None, 0, len(pipeline.steps), self)
+        dlg.setWindowTitle("Reset SFTP")
+        dlg.setWindowModality(Qt.WindowModality.NonModal)
+        dlg.setMinimumDuration(0)
+        dlg.setValue(0)
+
+        def on_progress(i, total, label):
+            print(f"  [{i + 1}/{total}] {label}")
+            dlg.setLabelText(label)
+            dlg.setValue(i)
+
+        def on_finished(ok, summary):
+            dlg.setValue(len(pipeline.steps))
+            dlg.close()
+            pipeline.deleteLater()
+            self.gvfs_reset = None
+            self.btn_reset_sftp.setEnabled(True)
+            if ok:
+                QMessageBox.information(self, "✅ GVFS reset hoàn tất", "Vui lòng thử mở lại SFTP.")
+            else:
+                QMessageBox.warning(self, "GVFS reset", f"Một số bước lỗi:\n{summary}")
 
-        # Thử khởi động lại file manager mặc định (nếu có)
-        fm_candidates = ["nautilus", "nemo", "thunar", "caja", "pcmanfm"]
-        for fm in fm_candidates:
-            try:
-                subprocess.Popen([fm])
-                print(f"✅ Đã khởi động lại {fm}.")
-                break
-            except FileNotFoundError:
-                continue
-        QMessageBox.warning(
-            self,
-            "✅ GVFS reset hoàn tất",
-            "Vui lòng thử mở lại SFTP."
-        )
+        pipeline.progress.connect(on_progress)
+        pipeline.finished.connect(on_finished)
+        self.gvfs_reset = pipeline
+        self.btn_reset_sftp.setEnabled(False)
+        pipeline.start()
 
     # Browse SFTP inside-app
     def browse_sftp(self):
@@ -683,51 +1995,177 @@ class MainWindow(QWidget):
             QMessageBox.information(self, "Notice", "Chỉ dùng cho SFTP")
             return
 
-        try:
-            t = paramiko.Transport((host, port))
-            t.connect(username=user, password=pwd)
-            sftp = paramiko.SFTPClient.from_transport(t)
-            files = sftp.listdir(".")
-            t.close()
-        except Exception as e:
-            QMessageBox.critical(self, "SFTP Error", str(e))
+        # Dialog hiện ngay; kết nối chạy trên worker nên host chết không làm treo app
+        dlg = SftpBrowserDialog(host, port, user, pwd, self)
+        dlg.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        dlg.show()
+
+    def on_group_menu(self, pos):
+        item = self.group_list.itemAt(pos)
+        if not item:
+            return
+        menu = QMenu(self)
+        act_check = menu.addAction("Check status")
+        act_recheck = menu.addAction("Check status (bỏ qua cache)")
+        act_run = menu.addAction("Run command...")
+        menu.addSeparator()
+        act_keys = menu.addAction("Scan host keys")
+        act_forget = menu.addAction("Quên host keys của group")
+        act_keys.setEnabled(HAVE_PARAMIKO)
+        chosen = menu.exec(self.group_list.mapToGlobal(pos))
+        if chosen in (act_check, act_recheck):
+            self.check_group_status(item.text(), force=chosen is act_recheck)
+        elif chosen is act_run:
+            self.run_command_group(item.text())
+        elif chosen is act_keys:
+            self.scan_group_host_keys(item.text())
+        elif chosen is act_forget:
+            self.forget_group_host_keys(item.text())
+
+    # Fan-out: chạy lệnh trên các dòng đang chọn (hoặc cả group đang xem)
+    def run_command_selected(self):
+        rows = [self.model.row_at(ix.row()) for ix in self.table.selectionModel().selectedRows()]
+        if not rows:
+            item = self.group_list.currentItem()
+            self.run_command_group(item.text() if item else "All")
+            return
+        self.open_fanout(rows, f"{len(rows)} dòng đã chọn")
+
+    def run_command_group(self, grp_text):
+        if grp_text == "All":
+            rows = fetch_all()
+        else:
+            rows = get_repo().fetch_group("" if grp_text == "(no group)" else grp_text)
+        if not rows:
+            QMessageBox.information(self, "Notice", "Group không có kết nối nào.")
             return
+        self.open_fanout(rows, grp_text)
 
-        dlg = QDialog(self)
-        dlg.setWindowTitle(f"SFTP – {host}")
-        layout = QVBoxLayout(dlg)
-        lw = QListWidget()
-        lw.addItems(files)
-        layout.addWidget(QLabel("Remote root files:"))
-        layout.addWidget(lw)
-        btn = QPushButton("Close")
-        btn.clicked.connect(dlg.accept)
-        layout.addWidget(btn)
-        dlg.exec()
+    def open_fanout(self, rows, title):
+        if not HAVE_PARAMIKO:
+            QMessageBox.warning(self, "Missing", "Cài paramiko: pip install paramiko")
+            return
+        dlg = FanoutDialog(rows, title, self)
+        dlg.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        dlg.show()
+
+    def check_group_status(self, grp_text, force=False):
+        grp = None if grp_text == "All" else ("" if grp_text == "(no group)" else grp_text)
+        targets = [(h, p) for h, p in get_repo().host_ports(grp)]
+        todo, _ = self.scanner.scan(targets, self.status_result.emit, self.status_done.emit, force=force)
+        self.status_pending += len(todo)
+        self.status_t0 = time.perf_counter()
+        self.lbl_launch.setText(f"📡 Checking {len(todo)}/{len(targets)} host...")
+        print(f"📡 Check status {grp_text}: {len(todo)} probe, {len(targets) - len(todo)} từ cache")
+
+    # Host key: lấy song song cho cả group, lưu vào cache known_hosts của app
+    def scan_group_host_keys(self, grp_text):
+        grp = None if grp_text == "All" else ("" if grp_text == "(no group)" else grp_text)
+        targets = get_repo().host_ports(grp)
+        self.hostkeys_t0 = time.perf_counter()
+        HostKeyScanner().scan(targets, on_done=self.hostkeys_done.emit)
+        self.lbl_launch.setText(f"🔑 Scanning {len(targets)} host...")
+
+    def on_hostkeys_done(self, results):
+        ms = (time.perf_counter() - self.hostkeys_t0) * 1000
+        count = collections.Counter(r.status for r in results)
+        self.lbl_launch.setText(f"🔑 {len(results)} host: {ms:.0f} ms")
+        lines = [f"Mới: {count['new']}   Không đổi: {count['same']}   Đổi key: {count['changed']}   "
+                 f"Lỗi: {count['error']}"]
+        for r in sorted(results, key=lambda r: (r.status != "changed", r.host, r.port)):
+            if r.status == "changed":
+                lines.append(f"⚠️ {r.host}:{r.port} key đã đổi ({r.key_type} {r.fingerprint}) – không lưu")
+            elif r.status == "error":
+                lines.append(f"❌ {r.host}:{r.port} {r.error}")
+        box = QMessageBox.warning if count["changed"] else QMessageBox.information
+        box(self, "Host keys", "\n".join(lines[:40]))
+
+    def forget_group_host_keys(self, grp_text):
+        grp = None if grp_text == "All" else ("" if grp_text == "(no group)" else grp_text)
+        targets = get_repo().host_ports(grp)
+        if QMessageBox.question(self, "Confirm", f"Quên host key đã lưu của {len(targets)} host trong "
+                                f"'{grp_text}'?") == QMessageBox.StandardButton.Yes:
+            get_known_hosts().forget(targets)
+
+    def on_status_result(self, key, st):
+        self.status_pending -= 1
+        if not self.status_flush.isActive():
+            self.status_flush.start()
+
+    def on_status_done(self, count):
+        self.status_flush.start()
+        if self.status_pending <= 0:
+            self.status_pending = 0
+            ms = (time.perf_counter() - self.status_t0) * 1000
+            self.lbl_launch.setText(f"📡 Checked {count} host: {ms:.0f} ms" if count else "📡 Status từ cache")
+
+    # Tìm kiếm khi gõ (FTS5, xếp theo last_used)
+    def on_search(self, text):
+        if text.strip():
+            self.model.set_search_results(get_repo().search(text))
+            return
+        item = self.group_list.currentItem()
+        if item:
+            self.on_group_changed(item)
+        else:
+            self.model.set_group(None)
 
     # Filter by group
     def on_group_changed(self, item):
+        if self.search_box.text():
+            # Chọn group → bỏ chế độ tìm kiếm (không gọi lại on_search)
+            self.search_box.blockSignals(True)
+            self.search_box.clear()
+            self.search_box.blockSignals(False)
         grp = item.text()
         if grp == "All":
-            rows = fetch_all()
+            self.model.set_group(None)
         else:
             g = "" if grp == "(no group)" else grp
-            conn = sqlite3.connect(DB_FILE)
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM connections WHERE grp=? ORDER BY name", (g,))
-            rows = cur.fetchall()
-            conn.close()
-
-        self.table.setRowCount(0)
-        for r in rows:
-            self.add_row(r)
+            self.model.set_group(g)
 
 
 # ==========================
 # RUN APP
 # ==========================
+class FirstPaintProbe(QObject):
+    """SSH_MANAGER_STARTUP_PROBE=1: in thời gian tới lần vẽ đầu tiên của cửa sổ rồi thoát
+    (dùng cho benchmarks/bench_startup.py)."""
+
+    def __init__(self, t0, parent=None):
+        super().__init__(parent)
+        self.t0 = t0
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint:
+            obj.removeEventFilter(self)
+            print(f"FIRST_PAINT_MS {(time.perf_counter() - self.t0) * 1000:.1f}", flush=True)
+            QTimer.singleShot(0, QApplication.quit)
+        return False
+
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    new_instance = "--new-instance" in sys.argv
+    args = [a for a in sys.argv[1:] if a != "--new-instance"]
+    app = QApplication(sys.argv[:1])
     w = MainWindow()
+    # quit qua IPC / đóng phiên không đi qua closeEvent → lưu bố cục trước khi đóng DB
+    app.aboutToQuit.connect(w.flush_layout)
+    app.aboutToQuit.connect(lambda: get_repo().close())
+    app.aboutToQuit.connect(w.launcher.shutdown)
+    app.aboutToQuit.connect(lambda: w.terminals and w.terminals.close_all())
+    app.aboutToQuit.connect(shutdown_ssh)
+    if not new_instance:
+        # Các lần chạy sau gửi argv qua socket này thay vì mở process mới
+        instance = InstanceServer(w.handle_command)
+        instance.listen()
+        app.aboutToQuit.connect(instance.close)
+    if os.environ.get("SSH_MANAGER_STARTUP_PROBE"):
+        probe = FirstPaintProbe(_T0)
+        w.installEventFilter(probe)
     w.show()
+    if args:
+        reply = w.handle_command(args)
+        if not reply.startswith("ok"):
+            print(reply)
     sys.exit(app.exec())